@@ -3,8 +3,6 @@ AI Analytics Service for Pet Health Insights
 Generates intelligent insights, recommendations, and daily routine headlines
 """
 
-import openai
-import os
 from datetime import datetime, timedelta
 import json
 import logging
@@ -13,19 +11,15 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict, Counter
 
+from openai_pool import chat_completion
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 
 class PetAnalyticsAI:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    def generate_daily_headlines(
+    async def generate_daily_headlines(
         self, pet_name: str, daily_data: List[Dict], historical_data: List[Dict] = None, date: str = None
     ) -> List[str]:
         """Generate AI-powered daily routine headlines"""
@@ -58,7 +52,7 @@ class PetAnalyticsAI:
             Generate headlines as a JSON array of strings.
             """
 
-            response = self.client.chat.completions.create(
+            response = await chat_completion(
                 model="gpt-4", messages=[{"role": "user", "content": prompt}], temperature=0.7, max_tokens=300
             )
 
@@ -86,7 +80,9 @@ class PetAnalyticsAI:
 
         return self._generate_fallback_headlines(pet_name, daily_data, date)
 
-    def generate_health_insights(self, pet_name: str, analytics_data: List[Dict], timeframe_days: int = 30) -> Dict[str, Any]:
+    async def generate_health_insights(
+        self, pet_name: str, analytics_data: List[Dict], timeframe_days: int = 30
+    ) -> Dict[str, Any]:
         """Generate AI-powered health insights and recommendations"""
         try:
             context = self._prepare_health_context(pet_name, analytics_data, timeframe_days)
@@ -125,7 +121,7 @@ class PetAnalyticsAI:
             - Positive health behaviors to celebrate
             """
 
-            response = self.client.chat.completions.create(
+            response = await chat_completion(
                 model="gpt-4", messages=[{"role": "user", "content": prompt}], temperature=0.3, max_tokens=500
             )
 
@@ -0,0 +1,208 @@
+"""
+Incrementally maintained analytics rollups per pet and category.
+
+Each ``pets/{pet_id}/rollups/{category}`` document holds the running total,
+per-day entry counts and the most recent entries for that category. Write
+paths update the rollup as entries are stored, so the dashboard summary reads
+one small document per category instead of streaming a pet's whole history.
+
+Rollups always describe the pet's timeline entries from the dashboard
+collections. They only change in the transaction that writes a timeline
+entry (see ``pet_timeline.record_ingest``), which counts an entry when it is
+created and moves it when its category changes, so storing the same entry
+again never counts it twice.
+
+A ``_meta`` document marks pets whose rollups were built from their full
+history. Existing pets can be backfilled with:
+
+    python analytics_rollups.py --pet_id <pet_id>
+    python analytics_rollups.py --all
+"""
+
+import argparse
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from firebase_admin import firestore
+
+from firestore_store import db
+
+ROLLUP_COLLECTION = "rollups"
+ROLLUP_META_ID = "_meta"
+
+# Number of most recent entries kept on each rollup
+RECENT_ENTRIES_LIMIT = 5
+
+# Days of per-day counts kept on each rollup document
+ROLLUP_RETENTION_DAYS = int(os.getenv("ROLLUP_RETENTION_DAYS", "90"))
+
+
+def _rollups(pet_id: str):
+    return db.collection("pets").document(pet_id).collection(ROLLUP_COLLECTION)
+
+
+def _empty_rollup(category: str) -> Dict:
+    return {"category": category, "total": 0, "daily_counts": {}, "recent_entries": []}
+
+
+def _merge_entries(rollup: Dict, entries: List[Dict]) -> Dict:
+    """Fold new entries into a rollup document"""
+    daily_counts = dict(rollup.get("daily_counts", {}))
+
+    for entry in entries:
+        day = entry.get("timestamp", "")[:10]
+        rollup["total"] = rollup.get("total", 0) + 1
+        if day:
+            daily_counts[day] = daily_counts.get(day, 0) + 1
+
+    # Drop per-day counts outside the retention window to bound document size
+    oldest_day = (datetime.utcnow() - timedelta(days=ROLLUP_RETENTION_DAYS)).strftime("%Y-%m-%d")
+    rollup["daily_counts"] = {day: count for day, count in daily_counts.items() if day >= oldest_day}
+
+    rollup["recent_entries"] = sorted(
+        list(rollup.get("recent_entries", [])) + list(entries), key=lambda x: x.get("timestamp", ""), reverse=True
+    )[:RECENT_ENTRIES_LIMIT]
+    rollup["updated_at"] = datetime.utcnow().isoformat()
+    return rollup
+
+
+def _entry_key(entry: Dict):
+    return entry.get("source_collection"), entry.get("id")
+
+
+def _remove_entries(rollup: Dict, entries: List[Dict]) -> Dict:
+    """Take entries that were counted before back out of a rollup document"""
+    daily_counts = dict(rollup.get("daily_counts", {}))
+    for entry in entries:
+        day = entry.get("timestamp", "")[:10]
+        rollup["total"] = max(0, rollup.get("total", 0) - 1)
+        if daily_counts.get(day):
+            daily_counts[day] -= 1
+            if not daily_counts[day]:
+                del daily_counts[day]
+    rollup["daily_counts"] = daily_counts
+
+    removed = {_entry_key(entry) for entry in entries}
+    rollup["recent_entries"] = [entry for entry in rollup.get("recent_entries", []) if _entry_key(entry) not in removed]
+    rollup["updated_at"] = datetime.utcnow().isoformat()
+    return rollup
+
+
+def update_rollups(transaction, pet_id: str, removed: Iterable[Dict], added: Iterable[Dict]):
+    """Take ``removed`` timeline entries out of the pet's rollups and count ``added`` ones, in ``transaction``
+
+    Reads the affected rollup documents, so it has to run before the
+    transaction's first write.
+    """
+    removed, added = list(removed), list(added)
+    by_category = defaultdict(lambda: ([], []))
+    for entry in removed:
+        by_category[entry.get("category", "unknown")][0].append(entry)
+    for entry in added:
+        by_category[entry.get("category", "unknown")][1].append(entry)
+
+    refs = {category: _rollups(pet_id).document(category) for category in sorted(by_category)}
+    snapshots = {category: ref.get(transaction=transaction) for category, ref in refs.items()}
+    for category, ref in refs.items():
+        rollup = snapshots[category].to_dict() if snapshots[category].exists else _empty_rollup(category)
+        category_removed, category_added = by_category[category]
+        if category_removed:
+            _remove_entries(rollup, category_removed)
+        if category_added:
+            _merge_entries(rollup, category_added)
+        transaction.set(ref, rollup)
+
+
+def load_rollups(pet_id: str):
+    """Return (category rollups, whether they cover the pet's full history)"""
+    rollups = {}
+    backfilled = False
+    for doc in _rollups(pet_id).stream():
+        if doc.id == ROLLUP_META_ID:
+            backfilled = True
+        else:
+            rollups[doc.id] = doc.to_dict()
+    return rollups, backfilled
+
+
+def summarize_rollups(rollups: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Build the dashboard summary (totals, this week, daily average, recent entries) from rollups"""
+    # The last 7 calendar days, including today
+    week_start = (datetime.utcnow() - timedelta(days=6)).strftime("%Y-%m-%d")
+
+    summary = {}
+    for category, rollup in rollups.items():
+        total = rollup.get("total", 0)
+        if total <= 0:
+            continue
+        this_week = sum(count for day, count in rollup.get("daily_counts", {}).items() if day >= week_start)
+        summary[category] = {
+            "total": total,
+            "this_week": this_week,
+            "avg_daily": round(this_week / 7, 1),
+            "recent_entries": rollup.get("recent_entries", [])[:RECENT_ENTRIES_LIMIT],
+        }
+    return summary
+
+
+@firestore.transactional
+def _rebuild(transaction, pet_id: str) -> Dict[str, Dict]:
+    from pet_timeline import DASHBOARD_COLLECTIONS, TIMELINE_COLLECTION
+
+    timeline = db.collection("pets").document(pet_id).collection(TIMELINE_COLLECTION)
+    rollups = {}
+    for doc in timeline.where("source_collection", "in", list(DASHBOARD_COLLECTIONS)).stream(transaction=transaction):
+        entry = doc.to_dict()
+        category = entry.get("category", "unknown")
+        rollups.setdefault(category, _empty_rollup(category))
+        _merge_entries(rollups[category], [entry])
+    stale = [doc.reference for doc in _rollups(pet_id).stream(transaction=transaction) if doc.id not in rollups]
+
+    for ref in stale:
+        if ref.id != ROLLUP_META_ID:
+            transaction.delete(ref)
+    for category, rollup in rollups.items():
+        transaction.set(_rollups(pet_id).document(category), rollup)
+    transaction.set(_rollups(pet_id).document(ROLLUP_META_ID), {"rebuilt_at": datetime.utcnow().isoformat()})
+    return rollups
+
+
+def rebuild_pet_rollups(pet_id: str) -> Dict[str, Dict]:
+    """Recompute a pet's rollups from its timeline and mark them as backfilled
+
+    The timeline is backfilled first if needed. Reading it and writing the
+    rollups happen in one transaction, so an entry ingested meanwhile is either
+    part of the rebuild or counted after it, never lost or counted twice.
+    """
+    from pet_timeline import backfill_pet_timeline, timeline_ready
+
+    if not timeline_ready(pet_id):
+        backfill_pet_timeline(pet_id)
+    rollups = _rebuild(db.transaction(), pet_id)
+
+    print(f"Rebuilt {len(rollups)} rollups for pet {pet_id}")
+    return rollups
+
+
+def rebuild_all_rollups():
+    """Backfill rollups for every pet"""
+    count = 0
+    for pet_doc in db.collection("pets").stream():
+        rebuild_pet_rollups(pet_doc.id)
+        count += 1
+    print(f"Rebuilt rollups for {count} pets")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild analytics summary rollups.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--pet_id", help="Rebuild rollups for a single pet")
+    group.add_argument("--all", action="store_true", help="Rebuild rollups for every pet")
+    args = parser.parse_args()
+
+    if args.all:
+        rebuild_all_rollups()
+    else:
+        rebuild_pet_rollups(args.pet_id)
@@ -1,12 +1,19 @@
 # api_server.py
-from fastapi import FastAPI, Request, UploadFile, File
+from fastapi import FastAPI, Request, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from firebase_admin import storage
 from dotenv import load_dotenv
+from collections import deque
 from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 import os
+import statistics
+import time
 import uuid
 
 """
@@ -32,9 +39,28 @@ if credentials_path:
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
 
 from main import main as run_main
-from firestore_store import get_pets_by_user_id, add_pet_to_page_and_user, handle_user_invite, db, store_to_firestore
-from pdf_parser import extract_text_and_summarize
-from transcribe import start_recording, stop_recording, get_recording_status
+from firestore_store import (
+    get_pets_by_user_id,
+    add_pet_to_page_and_user,
+    handle_user_invite,
+    invalidate_pet_profile,
+    db,
+    find_pdf_record,
+    store_to_firestore,
+)
+from firestore_async import run_db, pet_collection, get_document, get_pet_name, query_pet_collection
+from pet_timeline import ingest_batch, load_pet_timeline, normalize_timestamp, server_timing_header, record_ingest
+from analytics_rollups import load_rollups, summarize_rollups, rebuild_pet_rollups
+from job_queue import get_job, start_workers, stop_workers
+from note_enrichment import create_pending_note
+from json_responses import ORJSONResponse, add_compression, json_response, sse_event
+from llm_cache import llm_cache
+import openai_pool
+import audio_processing
+from response_cache import bump_data_version, etag_matches, get_data_version, make_etag, visualization_cache
+from pdf_extract import pdf_buffer, shutdown_pool
+from pdf_parser import store_summary, summarize_pdf
+from transcribe import RATE, recording_sessions, start_recording, stop_recording, get_recording_status
 
 # Lazy-loaded service instances to improve startup performance
 _intelligent_chatbot_service = None
@@ -76,6 +102,44 @@ def _require_gcp():
         )
 
 
+# Time to first token of recent streamed answers, in ms, for /api/health
+_stream_ttft_ms = deque(maxlen=200)
+
+
+def event_stream(label: str, events) -> StreamingResponse:
+    """Send ``(event, data)`` pairs as Server-Sent Events
+
+    Time to first token is measured from when the request was handled, logged,
+    and added to the final ``done`` event as ``timings_ms``.
+    """
+    started = time.perf_counter()
+
+    async def body():
+        ttft_ms = None
+        async for event, data in events:
+            if event == "token" and ttft_ms is None:
+                ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                _stream_ttft_ms.append(ttft_ms)
+                print(f"{label}: first token after {ttft_ms} ms")
+            if event == "done":
+                data = {**data, "timings_ms": {"ttft": ttft_ms, "total": round((time.perf_counter() - started) * 1000, 1)}}
+            yield sse_event(event, data)
+
+    # Proxies must pass events through as they come rather than buffering the response
+    return StreamingResponse(
+        body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def not_modified(request: Request, response: Response, etag: str):
+    """Return a 304 response when the client already has ``etag``, otherwise tag ``response`` with it"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
 def get_visualization_service():
     global _visualization_service
     if _visualization_service is None:
@@ -94,7 +158,7 @@ def get_pet_ai():
     return _pet_ai
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -103,6 +167,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_compression(app)
 
 
 # Startup event to pre-warm critical services
@@ -120,17 +185,39 @@ async def startup_event():
     except Exception as e:
         print(f"⚠️ Failed to pre-warm visualization service: {e}")
 
+    # Background workers for note enrichment; picks up jobs left over from the last run
+    start_workers()
+
     print("🎉 PetPulse API server ready!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_workers()
+    shutdown_pool()
+
+
 @app.post("/api/start")
 async def start(request: Request):
     data = await request.json()
-    return run_main(data["uid"], data["pet"])
+    return await run_in_threadpool(run_main, data["uid"], data["pet"])
+
+
+# Uploads over 8 MB go to Cloud Storage as a resumable upload, sent in chunks of this size
+PDF_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def upload_to_storage(blob, upload, size, content_type):
+    """Stream an upload's spooled file to Cloud Storage and make it public"""
+    blob.chunk_size = PDF_UPLOAD_CHUNK_SIZE
+    blob.upload_from_file(upload, rewind=True, size=size, content_type=content_type)
+    blob.make_public()
+    return blob.public_url
 
 
 @app.post("/api/upload_pdf")
-async def upload_pdf(request: Request, file: UploadFile = File(...)):
+async def upload_pdf(request: Request, file: UploadFile = File(...), force: bool = False):
+    """Store and summarize a vet PDF; a file this pet already has returns its existing record unless ``force=true``"""
     # Guard: this endpoint depends on Google Cloud Storage & credentials
     _require_gcp()
     # Get form data
@@ -145,40 +232,50 @@ async def upload_pdf(request: Request, file: UploadFile = File(...)):
         return {"error": "No file provided"}
 
     try:
-        contents = await file.read()
-        temp_path = f"/tmp/{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(contents)
-
-        blob = storage.bucket().blob(f"{uid}/{pet}/records/{uuid.uuid4()}_{file.filename}")
-        blob.upload_from_filename(temp_path)
-        blob.make_public()
-
-        result = extract_text_and_summarize(temp_path, uid, pet, file.filename, blob.public_url)
-
-        # Clean up temporary file
-        try:
-            os.remove(temp_path)
-        except:
-            pass
+        # The upload is already spooled by FastAPI (in memory, or an anonymous temp file
+        # once it is large); it is read from there rather than copied to /tmp
+        with pdf_buffer(file.file) as pdf:
+            # SHA-256 of the spooled bytes, looked up in the pet's record_hashes index
+            content_hash = await asyncio.to_thread(lambda: hashlib.sha256(pdf).hexdigest())
+            existing = None if force else await run_db(find_pdf_record, pet, content_hash)
+            if existing:
+                print(f"Duplicate PDF upload for pet {pet}, returning record {existing['record_id']}")
+                return {
+                    "message": "PDF already uploaded",
+                    "summary": existing["summary"],
+                    "url": existing["file_url"],
+                    "record_id": existing["record_id"],
+                    "duplicate": True,
+                }
 
-        if "error" in result:
-            return {"error": result["error"]}
+            blob = storage.bucket().blob(f"{uid}/{pet}/records/{uuid.uuid4()}_{file.filename}")
+            content_type = file.content_type or "application/pdf"
+            # Send the file to storage while its text is extracted and summarized;
+            # both finish before the buffer is released
+            file_url, summary = await asyncio.gather(
+                run_in_threadpool(upload_to_storage, blob, file.file, file.size, content_type),
+                summarize_pdf(pdf),
+                return_exceptions=True,
+            )
+        for result in (file_url, summary):
+            if isinstance(result, Exception):
+                raise result
 
-        return {"message": "PDF processed", "summary": result["summary"], "url": blob.public_url}
+        record_id = await store_summary(uid, pet, summary, file.filename, file_url, content_hash)
+        return {"message": "PDF processed", "summary": summary, "url": file_url, "record_id": record_id, "duplicate": False}
 
     except Exception as e:
-        # Clean up temporary file on error
-        try:
-            os.remove(temp_path)
-        except:
-            pass
         return {"error": f"Failed to process PDF: {str(e)}"}
 
 
 @app.get("/api/user-pets/{user_id}")
-async def get_user_pets(user_id: str):
-    return get_pets_by_user_id(user_id)
+async def get_user_pets(user_id: str, response: Response):
+    start = time.perf_counter()
+    pets = await run_db(get_pets_by_user_id, user_id)
+    # Latency against pet count, visible in the browser's network panel
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    response.headers["Server-Timing"] = f'pets;dur={elapsed_ms};desc="{len(pets)} pets"'
+    return pets
 
 
 @app.post("/api/pets/{user_id}")
@@ -192,7 +289,7 @@ async def create_pet(user_id: str, request: Request):
         return {"error": "Animal type is required"}
 
     try:
-        result = add_pet_to_page_and_user(user_id, data, data.get("pageId", "default-page"))
+        result = await run_db(add_pet_to_page_and_user, user_id, data, data.get("pageId", "default-page"))
         return {"status": "success", "pet": result}
     except Exception as e:
         return {"error": f"Failed to create pet: {str(e)}"}
@@ -201,19 +298,18 @@ async def create_pet(user_id: str, request: Request):
 @app.post("/api/pages/invite")
 async def invite_user(request: Request):
     data = await request.json()
-    return handle_user_invite(data)
+    return await run_db(handle_user_invite, data)
 
 
 @app.get("/api/pages/{page_id}")
 async def get_page(page_id: str):
-    doc = db.collection("pages").document(page_id).get()
-    return doc.to_dict() or {}
+    return await get_document(db.collection("pages").document(page_id)) or {}
 
 
 @app.post("/api/pages/{page_id}")
 async def update_page(page_id: str, request: Request):
     data = await request.json()
-    db.collection("pages").document(page_id).update({"markdown": data.get("markdown", "")})
+    await run_db(db.collection("pages").document(page_id).update, {"markdown": data.get("markdown", "")})
     return {"status": "updated"}
 
 
@@ -222,11 +318,11 @@ async def get_markdown(page: str = None, pet: str = None):
     if not page or not pet:
         return {"markdown": ""}
 
-    page_doc = db.collection("pages").document(page).get()
-    pet_doc = db.collection("pets").document(pet).get()
-
-    pet_data = pet_doc.to_dict() or {}
-    page_data = page_doc.to_dict() or {}
+    page_data, pet_data = await asyncio.gather(
+        get_document(db.collection("pages").document(page)), get_document(db.collection("pets").document(pet))
+    )
+    page_data = page_data or {}
+    pet_data = pet_data or {}
 
     return {"markdown": pet_data.get("markdown") or page_data.get("markdown", "")}
 
@@ -238,8 +334,11 @@ async def update_markdown(request: Request):
     pet = data["pet"]
     markdown = data.get("markdown", "")
 
-    db.collection("pets").document(pet).set({"markdown": markdown}, merge=True)
-    db.collection("pages").document(page).set({"markdown": markdown}, merge=True)
+    await asyncio.gather(
+        run_db(db.collection("pets").document(pet).set, {"markdown": markdown}, merge=True),
+        run_db(db.collection("pages").document(page).set, {"markdown": markdown}, merge=True),
+    )
+    invalidate_pet_profile(pet)
     return {"status": "updated"}
 
 
@@ -251,41 +350,14 @@ async def add_pet_textinput(pet_id: str, request: Request):
     if not input_text:
         return {"status": "error", "message": "Input is empty"}
 
-    # Enhanced: Classify and summarize the content
-    from summarize_openai import summarize_text, classify_pet_content
-
-    # Classify the content type
-    classification = classify_pet_content(input_text)
-
-    # Generate AI summary
-    summary = summarize_text(input_text)
-
-    # Store with enhanced metadata
-    entry_data = {
-        "input": input_text,
-        "summary": summary,
-        "content_type": classification.get("classification", "MIXED"),
-        "confidence": classification.get("confidence", 0.5),
-        "keywords": classification.get("keywords", []),
-        "timestamp": datetime.utcnow().isoformat(),
-    }
-
-    db.collection("pets").document(pet_id).collection("textinput").add(entry_data)
-
-    # If daily activity content, also store in analytics for dashboard visibility
-    if classification.get('classification') == 'DAILY_ACTIVITY':
-        from firestore_store import store_analytics_from_voice
-
-        store_analytics_from_voice(pet_id, input_text, summary, classification)
-        print(f"Daily activity from text input also stored in analytics collection")
+    # Store the note right away; classification, summary and analytics mirroring run as a background job
+    note = await run_db(create_pending_note, pet_id, "textinput", input_text)
 
     return {
-        "status": "success",
-        "summary": summary,
-        "content_type": classification.get("classification", "MIXED"),
-        "confidence": classification.get("confidence", 0.5),
-        "keywords": classification.get("keywords", []),
-        "message": f"Added {classification.get('classification', 'MIXED').lower()} note with AI summary",
+        "status": "pending",
+        "job_id": note["job_id"],
+        "note_id": note["doc_id"],
+        "message": "Note saved, AI analysis in progress",
     }
 
 
@@ -299,7 +371,7 @@ async def start_recording_endpoint(request: Request):
     if not user_id or not pet_id:
         return {"status": "error", "message": "Missing uid or pet"}
 
-    result = start_recording()
+    result = start_recording(user_id, pet_id, data.get("session_id") or "default", data.get("streaming"))
     return result
 
 
@@ -314,280 +386,238 @@ async def stop_recording_endpoint(request: Request):
         return {"status": "error", "message": "Missing uid or pet"}
 
     try:
-        result = stop_recording()
-
-        # Handle the transcription result
-        if result["status"] == "stopped" and result.get("transcript"):
-            # We have a transcript, try to process with AI
-            try:
-                from summarize_openai import summarize_text, classify_pet_content
-
-                transcript = result["transcript"]
-
-                # Classify the content type
-                classification = classify_pet_content(transcript)
-
-                # Generate enhanced summary
-                summary = summarize_text(transcript)
-
-                # Store with enhanced metadata
-                entry_data = {
-                    "transcript": transcript,
-                    "summary": summary,
-                    "content_type": classification.get("classification", "MIXED"),
-                    "confidence": classification.get("confidence", 0.5),
-                    "keywords": classification.get("keywords", []),
-                    "timestamp": datetime.utcnow().isoformat(),
-                }
+        # Blocks until the final streaming results (or the batch transcription) are in
+        result = await run_in_threadpool(stop_recording, user_id, pet_id, data.get("session_id") or "default")
+        return await save_recording(pet_id, result)
 
-                db.collection("pets").document(pet_id).collection("voice-notes").add(entry_data)
+    except Exception as e:
+        print(f"Error in stop_recording_endpoint: {e}")
+        return {"status": "error", "message": f"Server error: {str(e)}"}
 
-                return {
-                    "status": "success",
-                    "transcript": transcript,
-                    "summary": summary,
-                    "content_type": classification.get("classification", "MIXED"),
-                    "confidence": classification.get("confidence", 0.5),
-                    "message": f"Processed {classification.get('classification', 'MIXED').lower()} voice note",
-                }
 
-            except Exception as ai_error:
-                print(f"AI processing failed: {ai_error}")
-                # AI processing failed, but we still have transcript
-                # Store basic transcript without AI enhancement
-                entry_data = {
-                    "transcript": result["transcript"],
-                    "summary": "Transcription completed. AI processing unavailable.",
-                    "content_type": "TRANSCRIPTION_ONLY",
-                    "timestamp": datetime.utcnow().isoformat(),
-                }
+async def save_recording(pet_id, result):
+    """Store the transcript of a stopped recording and queue its AI analysis"""
+    # Handle the transcription result
+    if result["status"] == "stopped" and result.get("transcript"):
+        # Store the transcript right away; AI enrichment runs as a background job
+        note = await run_db(create_pending_note, pet_id, "voice-notes", result["transcript"])
 
-                db.collection("pets").document(pet_id).collection("voice-notes").add(entry_data)
+        return {
+            "status": "pending",
+            "job_id": note["job_id"],
+            "note_id": note["doc_id"],
+            "transcript": result["transcript"],
+            "message": "Transcription saved, AI analysis in progress",
+        }
 
-                return {
-                    "status": "stopped",
-                    "transcript": result["transcript"],
-                    "message": "Transcription successful, AI processing unavailable",
-                }
+    elif result["status"] == "stopped":
+        # Recording stopped but no transcript (no speech detected)
+        return {"status": "stopped", "message": "Recording stopped but no speech was detected"}
 
-        elif result["status"] == "stopped":
-            # Recording stopped but no transcript (no speech detected)
-            return {"status": "stopped", "message": "Recording stopped but no speech was detected"}
+    else:
+        # Recording failed or other error
+        return {"status": "error", "message": result.get("message", "Recording failed")}
+
+
+# Largest audio chunk accepted from the browser (about 2 seconds of 16 kHz 16-bit mono)
+RECORDING_MAX_CHUNK_BYTES = 64 * 1024
 
-        else:
-            # Recording failed or other error
-            return {"status": "error", "message": result.get("message", "Recording failed")}
 
+@app.websocket("/api/recordings/ws")
+async def browser_recording(websocket: WebSocket, uid: str, pet: str, session_id: str = "default", streaming: bool = None):
+    """Record a voice note from the browser's microphone
+
+    Binary messages are 16 kHz, 16-bit mono PCM chunks. The server replies with
+    ``transcript`` messages as streaming results come in. After the client sends
+    ``{"type": "stop"}``, the server replies with a ``result`` message, which
+    has the same fields as /api/stop_recording, and closes the socket. All of a
+    recording's chunks arrive on one connection, so any API worker can take it.
+    """
+    await websocket.accept()
+    started = start_recording(uid, pet, session_id, streaming, source="browser")
+    if started["status"] != "recording":
+        await websocket.send_json({"type": "error", **started})
+        await websocket.close()
+        return
+    session = recording_sessions.get((uid, pet, session_id))
+    await websocket.send_json({"type": "started", "session_id": session_id, "sample_rate": RATE})
+
+    sent = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            session.touch()
+            if message.get("bytes") is not None:
+                if len(message["bytes"]) > RECORDING_MAX_CHUNK_BYTES:
+                    await websocket.close(code=1009, reason="Audio chunk too large")
+                    recording_sessions.discard(session)
+                    return
+                session.add_chunk(message["bytes"])
+                status = session.status()
+                update = (status["transcript"], status["interim_transcript"])
+                if session.streaming and update != sent:
+                    sent = update
+                    await websocket.send_json({"type": "transcript", **status})
+            elif json.loads(message.get("text") or "{}").get("type") == "stop":
+                result = await run_in_threadpool(session.stop)
+                await websocket.send_json({"type": "result", **(await save_recording(pet, result))})
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        # The tab closed mid-recording; nothing is saved
+        print(f"Browser recording {(uid, pet, session_id)} disconnected")
+        recording_sessions.discard(session)
     except Exception as e:
-        print(f"Error in stop_recording_endpoint: {e}")
-        return {"status": "error", "message": f"Server error: {str(e)}"}
+        print(f"Error in browser recording: {e}")
+        recording_sessions.discard(session)
+        await websocket.close(code=1011)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status of a background job; ``job.result`` holds its output once ``job.status`` is done or failed"""
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        return {"status": "error", "message": "Job not found"}
+    job.pop("payload", None)
+    return {"status": "success", "job": job}
 
 
 # NEW: Get recording status endpoint
 @app.get("/api/recording_status")
-async def recording_status_endpoint():
-    return get_recording_status()
+async def recording_status_endpoint(uid: str, pet: str, session_id: str = "default"):
+    return get_recording_status(uid, pet, session_id)
 
 
 # Enhanced Analytics endpoints for comprehensive pet tracking
+VALID_ANALYTICS_CATEGORIES = [
+    "diet",
+    "activity",
+    "medication",
+    "grooming",
+    "exercise",
+    "energy_levels",
+    "bowel_movements",
+    "exit_events",
+    "weight",
+    "temperature",
+    "mood",
+    "sleep",
+    "water_intake",
+]
+
+# Largest number of entries accepted by one bulk analytics request
+MAX_ANALYTICS_BATCH_SIZE = 10000
+
+
+@app.post("/api/pets/{pet_id}/analytics:batch")
+async def add_analytics_entries(pet_id: str, request: Request):
+    """Add many analytics entries in one request, e.g. when importing a spreadsheet or wearable export
+
+    Body: ``{"entries": [{"category": "diet", "timestamp": "2024-05-01T08:00:00", ...}, ...]}``.
+    Entries keep their own timestamp (defaulting to now), converted to naive
+    UTC like every other stored timestamp. Returns one result per
+    entry, in order; invalid entries are reported without failing the others.
+    """
+    data = await request.json()
+    entries = data.get("entries") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        return {"status": "error", "message": "Expected a non-empty 'entries' list"}
+    if len(entries) > MAX_ANALYTICS_BATCH_SIZE:
+        return {"status": "error", "message": f"At most {MAX_ANALYTICS_BATCH_SIZE} entries per request"}
+
+    now = datetime.utcnow().isoformat()
+    results = [None] * len(entries)
+    valid_indexes, valid_entries = [], []
+
+    for index, entry in enumerate(entries):
+        timestamp = normalize_timestamp(entry["timestamp"]) if isinstance(entry, dict) and entry.get("timestamp") else now
+        if not isinstance(entry, dict):
+            results[index] = {"index": index, "status": "error", "message": "Entry must be an object"}
+        elif entry.get("category") not in VALID_ANALYTICS_CATEGORIES:
+            results[index] = {"index": index, "status": "error", "message": "Invalid category"}
+        elif timestamp is None:
+            results[index] = {"index": index, "status": "error", "message": "Invalid timestamp"}
+        else:
+            valid_indexes.append(index)
+            valid_entries.append({**entry, "timestamp": timestamp})
+
+    stored = await run_db(ingest_batch, pet_id, "analytics", valid_entries) if valid_entries else []
+    for index, result in zip(valid_indexes, stored):
+        results[index] = {"index": index, **result}
+
+    created = sum(1 for result in results if result["status"] == "success")
+    status = "success" if created == len(entries) else "partial" if created else "error"
+    return {"status": status, "created": created, "failed": len(entries) - created, "results": results}
+
+
 @app.post("/api/pets/{pet_id}/analytics/{category}")
 async def add_analytics_entry(pet_id: str, category: str, request: Request):
     data = await request.json()
 
     # Validate category
-    valid_categories = [
-        "diet",
-        "activity",
-        "medication",
-        "grooming",
-        "exercise",
-        "energy_levels",
-        "bowel_movements",
-        "exit_events",
-        "weight",
-        "temperature",
-        "mood",
-        "sleep",
-        "water_intake",
-    ]
-
-    if category not in valid_categories:
+    if category not in VALID_ANALYTICS_CATEGORIES:
         return {"status": "error", "message": "Invalid category"}
 
     # Add timestamp and store in Firestore
     entry_data = {**data, "timestamp": datetime.utcnow().isoformat(), "category": category}
 
-    db.collection("pets").document(pet_id).collection("analytics").add(entry_data)
+    _, doc_ref = await run_db(pet_collection(pet_id, "analytics").add, entry_data)
+    await run_db(record_ingest, pet_id, "analytics", doc_ref.id, entry_data)
 
     return {"status": "success", "data": entry_data}
 
 
 @app.get("/api/pets/{pet_id}/analytics")
-async def get_analytics_data(pet_id: str, category: str = None, days: int = 30):
-    """Get analytics data including voice recordings for dashboard charts"""
-    query = db.collection("pets").document(pet_id).collection("analytics")
-
-    if category:
-        query = query.where("category", "==", category)
-
-    # Get data from last N days
-    from datetime import datetime, timedelta
-
-    cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
-    query = query.where("timestamp", ">=", cutoff_date)
-
-    results = query.stream()
-    analytics_data = []
-
-    for doc in results:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        analytics_data.append(data)
-
-    # Also include voice-notes as daily activities if no specific category requested
-    if not category or category == "daily_activity":
-        voice_query = db.collection("pets").document(pet_id).collection("voice-notes")
-        voice_query = voice_query.where("timestamp", ">=", cutoff_date)
-
-        for doc in voice_query.stream():
-            data = doc.to_dict()
-            # Convert voice note to analytics format
-            voice_entry = {
-                "id": doc.id,
-                "category": "daily_activity",
-                "source": "voice_note",
-                "transcript": data.get("transcript", ""),
-                "summary": data.get("summary", ""),
-                "timestamp": data.get("timestamp", ""),
-                "notes": f"Voice recording: {data.get('summary', '')[:100]}...",
-            }
-            analytics_data.append(voice_entry)
-
-    # Also include text input as daily activities/medical notes if no specific category requested
-    if not category or category in ["daily_activity", "medical_notes", "mixed_notes"]:
-        text_query = db.collection("pets").document(pet_id).collection("textinput")
-        text_query = text_query.where("timestamp", ">=", cutoff_date)
-
-        for doc in text_query.stream():
-            data = doc.to_dict()
-            content_type = data.get("content_type", "DAILY_ACTIVITY")
-
-            # Map content type to category
-            if content_type == "DAILY_ACTIVITY":
-                text_category = "daily_activity"
-            elif content_type == "MEDICAL":
-                text_category = "medical_notes"
-            else:
-                text_category = "mixed_notes"
-
-            # Only include if matches requested category
-            if not category or category == text_category:
-                text_entry = {
-                    "id": doc.id,
-                    "category": text_category,
-                    "source": "text_input",
-                    "input": data.get("input", ""),
-                    "summary": data.get("summary", ""),
-                    "content_type": content_type,
-                    "timestamp": data.get("timestamp", ""),
-                    "notes": f"Text note: {data.get('summary', '')[:100]}...",
-                }
-                analytics_data.append(text_entry)
+async def get_analytics_data(
+    pet_id: str,
+    request: Request,
+    response: Response,
+    category: str = None,
+    days: int = 30,
+    limit: int = None,
+    cursor: str = None,
+    fields: str = None,
+):
+    """Get analytics data including voice recordings for dashboard charts
+
+    ``limit`` pages through the window newest first; pass the returned
+    ``next_cursor`` as ``cursor`` for the following page. ``fields`` is a
+    comma-separated list of entry fields to return, e.g. ``fields=level,duration``.
+    """
+    version = await run_db(get_data_version, pet_id)
+    cached = not_modified(request, response, make_etag(pet_id, version, "analytics", category, days, limit, cursor, fields))
+    if cached:
+        return cached
+
+    projection = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    try:
+        timeline = await load_pet_timeline(pet_id, days=days, category=category, limit=limit, cursor=cursor, fields=projection)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    response.headers["Server-Timing"] = server_timing_header(timeline["timings_ms"])
 
-    return {"data": analytics_data}
+    # Returned as a response so the (possibly year-long) entry list skips jsonable_encoder
+    return json_response({"data": timeline["entries"], "next_cursor": timeline["next_cursor"]}, response)
 
 
 @app.get("/api/pets/{pet_id}/analytics/summary")
-async def get_analytics_summary(pet_id: str):
+async def get_analytics_summary(pet_id: str, request: Request, response: Response):
     """Get summary statistics for all analytics categories including voice-notes"""
-    from collections import defaultdict
-    from datetime import datetime, timedelta
-
-    # Get all analytics data
-    analytics_results = db.collection("pets").document(pet_id).collection("analytics").stream()
-
-    # Also get voice-notes that might contain daily activities
-    voice_results = db.collection("pets").document(pet_id).collection("voice-notes").stream()
-
-    # Also get text input notes
-    text_results = db.collection("pets").document(pet_id).collection("textinput").stream()
-
-    summary = defaultdict(lambda: {"total": 0, "this_week": 0, "avg_daily": 0, "recent_entries": []})
-
-    one_week_ago = datetime.utcnow() - timedelta(days=7)
-
-    # Process analytics collection data
-    for doc in analytics_results:
-        data = doc.to_dict()
-        category = data.get("category", "unknown")
-        timestamp = datetime.fromisoformat(data.get("timestamp", ""))
-
-        summary[category]["total"] += 1
-        summary[category]["recent_entries"].append(data)
-
-        if timestamp >= one_week_ago:
-            summary[category]["this_week"] += 1
-
-    # Process voice-notes and classify as daily activities
-    for doc in voice_results:
-        data = doc.to_dict()
-        timestamp = datetime.fromisoformat(data.get("timestamp", ""))
-
-        # Classify as daily activity for now (could enhance with stored classification)
-        category = "daily_activity"
-        voice_entry = {
-            "category": category,
-            "source": "voice_note",
-            "transcript": data.get("transcript", ""),
-            "summary": data.get("summary", ""),
-            "timestamp": data.get("timestamp", ""),
-        }
-
-        summary[category]["total"] += 1
-        summary[category]["recent_entries"].append(voice_entry)
-
-        if timestamp >= one_week_ago:
-            summary[category]["this_week"] += 1
+    version = await run_db(get_data_version, pet_id)
+    cached = not_modified(request, response, make_etag(pet_id, version, "summary"))
+    if cached:
+        return cached
 
-    # Process text input data with classification
-    for doc in text_results:
-        data = doc.to_dict()
-        timestamp = datetime.fromisoformat(data.get("timestamp", ""))
+    rollups, backfilled = await run_db(load_rollups, pet_id)
 
-        # Use stored classification or default to daily activity
-        content_type = data.get("content_type", "DAILY_ACTIVITY")
-        if content_type == "DAILY_ACTIVITY":
-            category = "daily_activity"
-        elif content_type == "MEDICAL":
-            category = "medical_notes"
-        else:
-            category = "mixed_notes"
-
-        text_entry = {
-            "category": category,
-            "source": "text_input",
-            "input": data.get("input", ""),
-            "summary": data.get("summary", ""),
-            "content_type": content_type,
-            "timestamp": data.get("timestamp", ""),
-        }
-
-        summary[category]["total"] += 1
-        summary[category]["recent_entries"].append(text_entry)
-
-        if timestamp >= one_week_ago:
-            summary[category]["this_week"] += 1
+    # Pets whose history predates rollups are backfilled once on first view
+    if not backfilled:
+        rollups = await run_db(rebuild_pet_rollups, pet_id)
 
-    # Calculate averages
-    for category in summary:
-        if summary[category]["total"] > 0:
-            summary[category]["avg_daily"] = round(summary[category]["this_week"] / 7, 1)
-            # Keep only most recent 5 entries
-            summary[category]["recent_entries"] = sorted(
-                summary[category]["recent_entries"], key=lambda x: x["timestamp"], reverse=True
-            )[:5]
-
-    return {"summary": dict(summary)}
+    return {"summary": summarize_rollups(rollups)}
 
 
 @app.post("/api/pets/{pet_id}/daily_routine")
@@ -603,38 +633,16 @@ async def generate_daily_routine_headlines(pet_id: str, request: Request):
         start_date = f"{date}T00:00:00"
         end_date = f"{date}T23:59:59"
 
-        query = (
-            db.collection("pets")
-            .document(pet_id)
-            .collection("analytics")
-            .where("timestamp", ">=", start_date)
-            .where("timestamp", "<=", end_date)
-        )
-
-        daily_data = []
-        for doc in query.stream():
-            data_entry = doc.to_dict()
-            data_entry["id"] = doc.id
-            daily_data.append(data_entry)
-
-        # Get historical data for context (last 30 days)
+        # Get historical data for context (last 30 days) and the pet name alongside the day's entries
         historical_start = (datetime.utcnow() - timedelta(days=30)).isoformat()
-        historical_query = (
-            db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", historical_start)
+        daily_data, historical_data, pet_name = await asyncio.gather(
+            query_pet_collection(pet_id, "analytics", since=start_date, until=end_date),
+            query_pet_collection(pet_id, "analytics", since=historical_start),
+            get_pet_name(pet_id),
         )
 
-        historical_data = []
-        for doc in historical_query.stream():
-            hist_entry = doc.to_dict()
-            hist_entry["id"] = doc.id
-            historical_data.append(hist_entry)
-
-        # Get pet name
-        pet_doc = db.collection("pets").document(pet_id).get()
-        pet_name = pet_doc.to_dict().get("name", "Pet") if pet_doc.exists else "Pet"
-
         # Generate AI headlines
-        headlines = pet_ai.generate_daily_headlines(pet_name, daily_data, historical_data, date)
+        headlines = await pet_ai.generate_daily_headlines(pet_name, daily_data, historical_data, date)
 
         return {"headlines": headlines, "date": date, "data_points": len(daily_data), "pet_name": pet_name}
 
@@ -652,22 +660,10 @@ async def generate_daily_routine_headlines_fallback(pet_id: str, request: Reques
     start_date = f"{date}T00:00:00"
     end_date = f"{date}T23:59:59"
 
-    query = (
-        db.collection("pets")
-        .document(pet_id)
-        .collection("analytics")
-        .where("timestamp", ">=", start_date)
-        .where("timestamp", "<=", end_date)
+    daily_data, pet_name = await asyncio.gather(
+        query_pet_collection(pet_id, "analytics", since=start_date, until=end_date), get_pet_name(pet_id)
     )
 
-    daily_data = []
-    for doc in query.stream():
-        daily_data.append(doc.to_dict())
-
-    # Get pet name
-    pet_doc = db.collection("pets").document(pet_id).get()
-    pet_name = pet_doc.to_dict().get("name", "Pet") if pet_doc.exists else "Pet"
-
     # Generate headlines based on the data
     headlines = generate_routine_headlines(pet_name, daily_data, date)
 
@@ -682,20 +678,12 @@ async def get_health_insights(pet_id: str, days: int = 30):
 
         # Get analytics data for the specified timeframe
         cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
-        query = db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", cutoff_date)
-
-        analytics_data = []
-        for doc in query.stream():
-            data_entry = doc.to_dict()
-            data_entry["id"] = doc.id
-            analytics_data.append(data_entry)
-
-        # Get pet name
-        pet_doc = db.collection("pets").document(pet_id).get()
-        pet_name = pet_doc.to_dict().get("name", "Pet") if pet_doc.exists else "Pet"
+        analytics_data, pet_name = await asyncio.gather(
+            query_pet_collection(pet_id, "analytics", since=cutoff_date), get_pet_name(pet_id)
+        )
 
         # Generate AI insights
-        insights = pet_ai.generate_health_insights(pet_name, analytics_data, days)
+        insights = await pet_ai.generate_health_insights(pet_name, analytics_data, days)
 
         return {"insights": insights, "timeframe_days": days, "data_points": len(analytics_data), "pet_name": pet_name}
 
@@ -716,64 +704,27 @@ async def get_health_insights(pet_id: str, days: int = 30):
 
 
 @app.get("/api/pets/{pet_id}/visualizations")
-async def get_visualization_data(pet_id: str, chart_type: str = "all", days: int = 30):
+async def get_visualization_data(pet_id: str, request: Request, response: Response, chart_type: str = "all", days: int = 30):
     """Get data for various chart visualizations including voice recordings"""
+    version = await run_db(get_data_version, pet_id)
+    cached = not_modified(request, response, make_etag(pet_id, version, "visualizations", chart_type, days))
+    if cached:
+        return cached
+
+    # Charts are relative to today, so the date is part of the key along with the data version
+    cache_key = (pet_id, chart_type, days, version, datetime.utcnow().strftime("%Y-%m-%d"))
+    cached = visualization_cache.get(cache_key)
+    if cached is not None:
+        response.headers["Server-Timing"] = "cache;desc=hit"
+        return Response(content=cached, media_type="application/json", headers=dict(response.headers))
+
     try:
         visualization_service = get_visualization_service()
 
-        # Get analytics data
-        cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
-        query = db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", cutoff_date)
-
-        analytics_data = []
-        for doc in query.stream():
-            data_entry = doc.to_dict()
-            data_entry["id"] = doc.id
-            analytics_data.append(data_entry)
-
-        # Also include voice-notes as daily activities for charts
-        voice_query = db.collection("pets").document(pet_id).collection("voice-notes").where("timestamp", ">=", cutoff_date)
-
-        for doc in voice_query.stream():
-            data = doc.to_dict()
-            # Convert voice note to analytics format for visualization
-            voice_entry = {
-                "id": doc.id,
-                "category": "daily_activity",
-                "source": "voice_note",
-                "transcript": data.get("transcript", ""),
-                "summary": data.get("summary", ""),
-                "timestamp": data.get("timestamp", ""),
-                "notes": f"Voice recording: {data.get('summary', '')[:100]}...",
-            }
-            analytics_data.append(voice_entry)
-
-        # Also include text input notes as daily activities for charts
-        text_query = db.collection("pets").document(pet_id).collection("textinput").where("timestamp", ">=", cutoff_date)
-
-        for doc in text_query.stream():
-            data = doc.to_dict()
-            content_type = data.get("content_type", "DAILY_ACTIVITY")
-
-            # Map content type to category for visualization
-            if content_type == "DAILY_ACTIVITY":
-                viz_category = "daily_activity"
-            elif content_type == "MEDICAL":
-                viz_category = "medical_notes"
-            else:
-                viz_category = "mixed_notes"
-
-            text_entry = {
-                "id": doc.id,
-                "category": viz_category,
-                "source": "text_input",
-                "input": data.get("input", ""),
-                "summary": data.get("summary", ""),
-                "content_type": content_type,
-                "timestamp": data.get("timestamp", ""),
-                "notes": f"Text note: {data.get('summary', '')[:100]}...",
-            }
-            analytics_data.append(text_entry)
+        # Get analytics data plus voice-notes and text input notes as daily activities for charts
+        timeline = await load_pet_timeline(pet_id, days=days)
+        response.headers["Server-Timing"] = server_timing_header(timeline["timings_ms"])
+        analytics_data = timeline["entries"]
 
         visualizations = {}
 
@@ -801,9 +752,16 @@ async def get_visualization_data(pet_id: str, chart_type: str = "all", days: int
         if chart_type == "all" or chart_type == "summary":
             visualizations["summary_metrics"] = visualization_service.generate_summary_metrics(analytics_data, days)
 
-        return {"visualizations": visualizations, "data_points": len(analytics_data), "timeframe_days": days}
+        result = json_response(
+            {"visualizations": visualizations, "data_points": len(analytics_data), "timeframe_days": days}, response
+        )
+        # Cache the encoded body, so hits skip serialization as well
+        visualization_cache.set(cache_key, result.body, size=len(result.body))
+        return result
 
     except Exception as e:
+        # Don't let clients revalidate a transient failure into a 304
+        del response.headers["ETag"]
         return {"error": f"Failed to generate visualizations: {str(e)}", "visualizations": {}, "data_points": 0}
 
 
@@ -896,6 +854,7 @@ async def clear_pet_cache(pet_id: str):
     try:
         intelligent_chatbot_service = get_intelligent_chatbot_service()
         intelligent_chatbot_service.clear_pet_cache(pet_id)
+        await run_db(bump_data_version, pet_id)
 
         return {"status": "success", "message": f"Cache cleared for pet {pet_id}"}
 
@@ -932,8 +891,13 @@ async def get_cache_status(pet_id: str):
 
 
 @app.post("/api/pets/{pet_id}/chat")
-async def chat_with_assistant(pet_id: str, request: Request):
-    """Chat with AI Assistant using Intelligent RAG with Smart Visualization"""
+async def chat_with_assistant(pet_id: str, request: Request, stream: bool = False):
+    """Chat with AI Assistant using Intelligent RAG with Smart Visualization
+
+    With ``?stream=true`` the answer is sent as Server-Sent Events: ``token`` events
+    while it is generated, then a ``done`` event with the usual response fields,
+    sources and visualizations.
+    """
     try:
         intelligent_chatbot_service = get_intelligent_chatbot_service()
 
@@ -943,6 +907,9 @@ async def chat_with_assistant(pet_id: str, request: Request):
         if not query:
             return {"error": "Query is required"}
 
+        if stream:
+            return event_stream(f"chat {pet_id}", intelligent_chatbot_service.stream_intelligent_response(pet_id, query))
+
         # Generate intelligent response with optional visualization
         response = await intelligent_chatbot_service.generate_intelligent_response(pet_id, query)
 
@@ -987,36 +954,70 @@ async def search_knowledge_base(pet_id: str, request: Request):
         return {"status": "error", "error": f"Failed to search knowledge base: {str(e)}"}
 
 
-@app.get("/api/pets/{pet_id}/assistant_summary")
-async def get_assistant_summary(pet_id: str):
-    """Get AI-powered health summary for assistant dashboard using cached data"""
+ASSISTANT_SUMMARY_QUERY = (
+    "Provide a comprehensive health summary with insights, patterns, and recommendations based on all available health data."
+)
+
+
+async def assistant_summary_context(pet_id: str, generate: bool = True):
+    """RAG answer (or just its context, with ``generate=False``) for the summary query; uses cached pet data when available"""
+    intelligent_chatbot_service = get_intelligent_chatbot_service()
+    simple_rag_service = get_simple_rag_service()
+
+    # Check if we have cached data first
+    cached_data = intelligent_chatbot_service.get_cached_pet_data(pet_id)
+
+    if cached_data:
+        print("Using cached data for assistant summary")
+        # Use cached data for faster summary generation
+        response = await simple_rag_service.generate_rag_response_with_cache(
+            pet_id, ASSISTANT_SUMMARY_QUERY, cached_data, generate=generate
+        )
+    else:
+        print("🔍 No cached data available, using standard RAG processing")
+        # Fallback to standard method if no cache
+        response = await simple_rag_service.generate_rag_response(pet_id, ASSISTANT_SUMMARY_QUERY, generate=generate)
+    return response, cached_data is not None
+
+
+async def stream_assistant_summary(pet_id: str):
     try:
-        intelligent_chatbot_service = get_intelligent_chatbot_service()
+        response, used_cache = await assistant_summary_context(pet_id, generate=False)
+        summary = []
+        async for text in get_simple_rag_service().stream_gpt_response(
+            ASSISTANT_SUMMARY_QUERY, response.get("context", ""), pet_id, response.get("pet_data")
+        ):
+            summary.append(text)
+            yield "token", {"text": text}
+        yield "done", {
+            "status": "success",
+            "summary": "".join(summary),
+            "data_sources": response.get("sources", []),
+            "timestamp": datetime.utcnow().isoformat(),
+            "used_cache": used_cache,
+        }
+    except Exception as e:
+        yield "done", {"status": "error", "error": f"Failed to generate assistant summary: {str(e)}"}
 
-        # Check if we have cached data first
-        cached_data = intelligent_chatbot_service.get_cached_pet_data(pet_id)
 
-        if cached_data:
-            print("Using cached data for assistant summary")
-            simple_rag_service = get_simple_rag_service()
+@app.get("/api/pets/{pet_id}/assistant_summary")
+async def get_assistant_summary(pet_id: str, stream: bool = False):
+    """Get AI-powered health summary for assistant dashboard using cached data
 
-            # Use cached data for faster summary generation
-            summary_query = "Provide a comprehensive health summary with insights, patterns, and recommendations based on all available health data."
-            response = await simple_rag_service.generate_rag_response_with_cache(pet_id, summary_query, cached_data)
-        else:
-            print("🔍 No cached data available, using standard RAG processing")
-            simple_rag_service = get_simple_rag_service()
+    With ``?stream=true`` the summary is sent as Server-Sent Events, like /chat.
+    """
+    if stream:
+        return event_stream(f"assistant summary {pet_id}", stream_assistant_summary(pet_id))
 
-            # Fallback to standard method if no cache
-            summary_query = "Provide a comprehensive health summary with insights, patterns, and recommendations based on all available health data."
-            response = await simple_rag_service.generate_rag_response(pet_id, summary_query)
+    try:
+        response, used_cache = await assistant_summary_context(pet_id)
 
         return {
             "status": "success",
             "summary": response.get("response", ""),
             "data_sources": response.get("sources", []),
             "timestamp": datetime.utcnow().isoformat(),
-            "used_cache": cached_data is not None,
+            "used_cache": used_cache,
         }
 
     except Exception as e:
@@ -1036,7 +1037,18 @@ async def test_endpoint():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "services": {"firebase": "connected", "storage": "available", "api": "operational"}}
+    return {
+        "status": "healthy",
+        "services": {"firebase": "connected", "storage": "available", "api": "operational"},
+        "caches": {"visualizations": visualization_cache.stats(), "llm": llm_cache.stats()},
+        "openai": openai_pool.stats(),
+        "streaming": {
+            "responses": len(_stream_ttft_ms),
+            "ttft_ms_median": statistics.median(_stream_ttft_ms) if _stream_ttft_ms else None,
+        },
+        "recordings": recording_sessions.stats(),
+        "silence_trimming": audio_processing.stats(),
+    }
 
 
 # Serve index last to avoid route shadowing
@@ -0,0 +1,284 @@
+"""
+Silence trimming for LINEAR16 audio before it goes to Speech-to-Text.
+
+Owners pause while they think, and recordings often start and end with a few
+seconds of nothing. Speech-to-Text bills per second of audio and takes longer
+on longer uploads, so silence is cut before recognition:
+
+    trimmed, report = trim_silence(audio_data)   # an AudioBuffer
+    report["removed_bytes"]  # bytes of silence that were not sent
+
+Each 30 ms frame of 16-bit samples counts as speech when its RMS energy is
+above both an absolute floor (``VAD_MIN_RMS``) and a multiple of the
+recording's own noise floor (the quietest 10% of frames), capped at a fraction
+of its loudest frame so that a recording without pauses isn't all silence. Speech frames are
+padded by ``VAD_PADDING_MS`` on both sides so word onsets and trailing
+consonants survive. Leading and trailing silence is dropped, and pauses longer
+than ``VAD_MAX_PAUSE_MS`` are shortened to that length. All of this is
+vectorized with NumPy over the int16 buffer.
+
+Batch recognition takes about a minute of audio per request, so longer audio
+is cut into segments at pauses first:
+
+    segments = split_at_silence(trimmed, max_seconds=55)
+
+Recordings are collected in an ``AudioBuffer``, which keeps the audio in one
+block (memory, then a temporary file once it's long) and hands it to the
+functions above without copying it. The trimmed audio is an ``AudioBuffer``
+too, so a long recording is never held in memory twice.
+"""
+
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Frame length for the energy measurement
+VAD_FRAME_MS = 30
+
+# RMS below this is silence however quiet the room is (about -50 dBFS)
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", "100"))
+
+# A frame is speech when it is this many times louder than the recording's noise floor
+VAD_NOISE_FACTOR = 3.0
+
+# Speech kept on each side of a voiced stretch, and the longest pause left in
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+VAD_MAX_PAUSE_MS = int(os.getenv("VAD_MAX_PAUSE_MS", "700"))
+
+# A recording starts with room for 10 seconds of 16 kHz audio and doubles as needed
+AUDIO_BUFFER_INITIAL_BYTES = 16000 * 2 * 10
+
+# Recordings longer than this (16 MB is about 8 minutes) move from memory to a temporary file
+AUDIO_BUFFER_SPILL_BYTES = int(os.getenv("AUDIO_BUFFER_SPILL_MB", "16")) * 1024 * 1024
+
+# Frames measured at once, so the float copy of a long recording is never made in full
+_RMS_BLOCK_FRAMES = 2000
+
+_stats_lock = threading.Lock()
+_stats = {"trimmed": 0, "original_bytes": 0, "removed_bytes": 0}
+
+
+def _dilate(mask: np.ndarray, width: int) -> np.ndarray:
+    """Extend every True run in ``mask`` by ``width`` elements on both sides"""
+    if width <= 0 or not mask.any():
+        return mask
+    # A frame is kept when any speech frame lies within ``width`` of it
+    counts = np.concatenate(([0], np.cumsum(mask)))
+    index = np.arange(len(mask))
+    upper = np.minimum(index + width + 1, len(mask))
+    lower = np.maximum(index - width, 0)
+    return counts[upper] - counts[lower] > 0
+
+
+def _frame_rms(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS energy of each frame (the last, partial frame included)"""
+    frame_count = -(-len(samples) // frame_length)
+    whole = len(samples) // frame_length
+    rms = np.empty(frame_count, dtype=np.float32)
+    for start in range(0, whole, _RMS_BLOCK_FRAMES):
+        stop = min(start + _RMS_BLOCK_FRAMES, whole)
+        frames = samples[start * frame_length : stop * frame_length].reshape(-1, frame_length).astype(np.float32)
+        rms[start:stop] = np.einsum("ij,ij->i", frames, frames) / frame_length
+    if whole < frame_count:
+        tail = samples[whole * frame_length :].astype(np.float32)
+        rms[whole] = np.dot(tail, tail) / frame_length
+    return np.sqrt(rms, out=rms)
+
+
+def _speech_mask(rms: np.ndarray) -> np.ndarray:
+    noise_floor = np.percentile(rms, 10)
+    # Without any quiet frames the "noise floor" is the speech itself
+    threshold = min(noise_floor * VAD_NOISE_FACTOR, rms.max() / VAD_NOISE_FACTOR)
+    return rms > max(VAD_MIN_RMS, threshold)
+
+
+def speech_frames(samples: np.ndarray, rate: int, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """Boolean speech mask with one entry per frame (the last, partial frame included)"""
+    return _speech_mask(_frame_rms(samples, max(1, rate * frame_ms // 1000)))
+
+
+def trim_silence(
+    audio_data: bytes,
+    rate: int = 16000,
+    padding_ms: int = None,
+    max_pause_ms: int = None,
+) -> Tuple["AudioBuffer", Dict[str, Any]]:
+    """Drop leading and trailing silence and shorten long pauses in 16-bit mono PCM
+
+    Returns the trimmed audio and a report of what was removed. Audio without
+    any speech comes back empty. ``audio_data`` can be any buffer (a memoryview
+    from ``AudioBuffer.view`` too). The trimmed audio is written to a new
+    ``AudioBuffer``, straight to its temporary file when it's longer than the
+    spill size; read it with ``view()`` and ``close()`` it when done.
+    """
+    padding_ms = VAD_PADDING_MS if padding_ms is None else padding_ms
+    max_pause_ms = VAD_MAX_PAUSE_MS if max_pause_ms is None else max_pause_ms
+    # An odd trailing byte can't be part of a sample
+    samples = np.frombuffer(audio_data, dtype="<i2", count=len(audio_data) // 2)
+    frame_length = max(1, rate * VAD_FRAME_MS // 1000)
+
+    if len(samples):
+        speech = _dilate(speech_frames(samples, rate), padding_ms // VAD_FRAME_MS)
+        keep = speech.copy()
+        if speech.any():
+            # Inside the recording, keep up to max_pause of each pause (padding included):
+            # half after the speech, half before the next
+            voiced = np.flatnonzero(speech)
+            gaps = np.flatnonzero(np.diff(voiced) > 1)
+            half_pause = max(0, max_pause_ms // 2 - padding_ms) // VAD_FRAME_MS
+            for gap in gaps:
+                start, stop = voiced[gap] + 1, voiced[gap + 1]
+                if stop - start > 2 * half_pause:
+                    keep[start : start + half_pause] = True
+                    keep[stop - half_pause : stop] = True
+                else:
+                    keep[start:stop] = True
+        # Copy the kept stretches straight into the result
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.view(np.int8), [0]))))
+        offsets = np.minimum(edges * frame_length, len(samples)) * 2
+        size = int(np.sum(offsets[1::2] - offsets[0::2]))
+        # Known to be long: skip the in-memory stage entirely
+        trimmed = AudioBuffer(initial_bytes=size, on_disk=size > AUDIO_BUFFER_SPILL_BYTES)
+        source = memoryview(audio_data).cast("B")
+        for start, stop in zip(offsets[0::2].tolist(), offsets[1::2].tolist()):
+            trimmed.append(source[start:stop])
+        source.release()
+    else:
+        trimmed = AudioBuffer(initial_bytes=0)
+
+    report = {
+        "original_bytes": len(audio_data),
+        "trimmed_bytes": len(trimmed),
+        "removed_bytes": len(audio_data) - len(trimmed),
+        "removed_seconds": round((len(audio_data) - len(trimmed)) / (2 * rate), 2),
+    }
+    with _stats_lock:
+        _stats["trimmed"] += 1
+        _stats["original_bytes"] += report["original_bytes"]
+        _stats["removed_bytes"] += report["removed_bytes"]
+    return trimmed, report
+
+
+def split_at_silence(audio_data: bytes, rate: int = 16000, max_seconds: float = 55.0) -> List[memoryview]:
+    """Cut 16-bit mono PCM into consecutive segments of at most ``max_seconds``
+
+    Each cut goes at the last silent frame in the second half of a segment's
+    allowed length, so segments stay long and words aren't split. Speech that
+    runs on without a pause is cut at its quietest frame. The segments are
+    views of ``audio_data``, not copies.
+    """
+    samples = np.frombuffer(audio_data, dtype="<i2", count=len(audio_data) // 2)
+    view = memoryview(audio_data).cast("B")[: len(samples) * 2]
+    frame_length = max(1, rate * VAD_FRAME_MS // 1000)
+    max_frames = max(2, int(max_seconds * 1000) // VAD_FRAME_MS)
+    frame_count = -(-len(samples) // frame_length)
+    if frame_count <= max_frames:
+        return [view] if len(samples) else []
+
+    rms = _frame_rms(samples, frame_length)
+    speech = _speech_mask(rms)
+    cuts = [0]
+    while frame_count - cuts[-1] > max_frames:
+        start, stop = cuts[-1] + max_frames // 2, cuts[-1] + max_frames
+        silent = np.flatnonzero(~speech[start:stop])
+        cuts.append(start + int(silent[-1] if len(silent) else np.argmin(rms[start:stop])))
+    cuts.append(frame_count)
+    step = frame_length * 2
+    return [view[first * step : last * step] for first, last in zip(cuts, cuts[1:])]
+
+
+class AudioBuffer:
+    """Append-only buffer for the 16-bit PCM of one recording
+
+    Chunks are copied into a single preallocated bytearray that doubles when
+    it's full, instead of being kept as thousands of small bytes objects and
+    joined when recording stops. Past ``spill_bytes`` the audio moves to an
+    anonymous temporary file, or it starts there with ``on_disk=True``, for
+    audio already known to be long. ``view()`` gives the recording without
+    copying it: a memoryview of the bytearray, or of a memory map of the file.
+    """
+
+    def __init__(self, spill_bytes: int = None, initial_bytes: int = AUDIO_BUFFER_INITIAL_BYTES, on_disk: bool = False):
+        self.spill_bytes = AUDIO_BUFFER_SPILL_BYTES if spill_bytes is None else spill_bytes
+        self.chunks = 0
+        self._memory = bytearray(0 if on_disk else min(initial_bytes, self.spill_bytes))
+        self._file = None
+        self._size = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        if on_disk:
+            self._spill()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def append(self, data):
+        with self._lock:
+            if self._closed:
+                # A recorder thread that outlived stop()
+                return
+            end = self._size + len(data)
+            if self._file is None and end > len(self._memory):
+                if end > self.spill_bytes:
+                    self._spill()
+                else:
+                    self._grow(end)
+            if self._file is not None:
+                self._file.write(data)
+            else:
+                self._memory[self._size : end] = data
+            self._size = end
+            self.chunks += 1
+
+    def _grow(self, needed):
+        # A new array rather than a resize, which a view still in use would block
+        grown = bytearray(min(max(needed, 2 * len(self._memory)), self.spill_bytes))
+        memoryview(grown)[: self._size] = memoryview(self._memory)[: self._size]
+        self._memory = grown
+
+    def _spill(self):
+        self._file = tempfile.TemporaryFile(prefix="recording-")
+        self._file.write(memoryview(self._memory)[: self._size])
+        self._memory = bytearray()
+
+    @contextmanager
+    def view(self):
+        """The audio so far, as a memoryview that is only valid inside the ``with`` block"""
+        with self._lock:
+            size = self._size
+            mapped = None
+            if self._file is not None and size:
+                self._file.flush()
+                mapped = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+                view = memoryview(mapped)
+            else:
+                view = memoryview(self._memory)[:size]
+        try:
+            yield view
+        finally:
+            view.release()
+            if mapped is not None:
+                mapped.close()
+
+    def close(self):
+        """Free the audio; later appends are ignored"""
+        with self._lock:
+            self._closed = True
+            self._memory = bytearray()
+            if self._file is not None:
+                self._file.close()
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        removed_share = _stats["removed_bytes"] / _stats["original_bytes"] if _stats["original_bytes"] else 0.0
+        return {**_stats, "removed_share": round(removed_share, 3)}
@@ -0,0 +1,140 @@
+"""
+Benchmark JSON serialization and compression of the dashboard payloads.
+
+Builds a synthetic 365-day pet history, renders the analytics list and the
+full set of visualization charts, and compares:
+- FastAPI's default path (jsonable_encoder + json.dumps) against orjson
+- wire bytes uncompressed, gzip and brotli (when installed)
+
+Usage:
+    python benchmarks/bench_json_responses.py [--days 365] [--per-day 8] [--repeat 20]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from json_responses import BROTLI_QUALITY, GZIP_LEVEL, dumps, orjson
+from visualization_service import PetVisualizationService
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATEGORIES = ("diet", "exercise", "energy_levels", "medication", "mood", "sleep", "grooming", "bowel_movements")
+
+
+def synthetic_history(days: int, per_day: int, seed: int = 7):
+    """Analytics entries plus voice and text notes, shaped like the timeline entries the API returns"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    entries = []
+    for day in range(days):
+        for i in range(per_day):
+            timestamp = (now - timedelta(days=day, minutes=rng.randint(0, 1439))).isoformat()
+            category = rng.choice(CATEGORIES)
+            entry = {
+                "id": f"{day}-{i}",
+                "category": category,
+                "source": "manual_entry",
+                "timestamp": timestamp,
+                "notes": "Ate well and played fetch in the park for a while. " * rng.randint(0, 3),
+            }
+            if category == "exercise":
+                entry.update({"type": rng.choice(["walk", "run", "fetch"]), "duration": rng.randint(5, 90)})
+            elif category in ("energy_levels", "mood"):
+                entry["level"] = rng.randint(1, 5)
+            elif category == "diet":
+                entry.update({"food": "kibble", "type": "meal", "quantity": rng.randint(1, 3)})
+            elif category == "medication":
+                entry.update({"name": "Apoquel", "dose": "16mg", "time": "08:00"})
+            entries.append(entry)
+        entries.append(
+            {
+                "id": f"{day}-voice",
+                "category": "daily_activity",
+                "source": "voice_note",
+                "transcript": "Max seemed a little tired after the long walk but ate his dinner. " * 4,
+                "summary": "Tired after walk, normal appetite",
+                "timestamp": (now - timedelta(days=day)).isoformat(),
+            }
+        )
+    return entries
+
+
+def visualizations(entries, days: int):
+    service = PetVisualizationService()
+    return {
+        "visualizations": {
+            "weekly_activity": service.generate_weekly_activity_chart(entries),
+            "energy_distribution": service.generate_energy_distribution_chart(entries),
+            "diet_frequency": service.generate_diet_frequency_chart(entries),
+            "health_overview": service.generate_health_overview_chart(entries),
+            "exercise_histogram": service.generate_exercise_duration_histogram(entries),
+            "medication_adherence": service.generate_medication_adherence_chart(entries),
+            "activity_heatmap": service.generate_activity_heatmap_data(entries),
+            "summary_metrics": service.generate_summary_metrics(entries, days),
+        },
+        "data_points": len(entries),
+        "timeframe_days": days,
+    }
+
+
+def default_encode(content) -> bytes:
+    """What FastAPI does for a dict returned from an endpoint without a response model"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def time_ms(fn, content, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(content)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def report(name: str, content, repeat: int):
+    before_ms = time_ms(default_encode, content, repeat)
+    after_ms = time_ms(dumps, content, repeat)
+    body = dumps(content)
+
+    print(f"\n{name}")
+    print(f"  serialize  default {before_ms:8.2f} ms   orjson {after_ms:8.2f} ms   ({before_ms / after_ms:.1f}x)")
+    print(f"  wire bytes identity {len(default_encode(content)):>10,}")
+    print(f"             gzip-{GZIP_LEVEL}   {len(gzip.compress(body, compresslevel=GZIP_LEVEL)):>10,}")
+    if brotli is not None:
+        print(f"             br-{BROTLI_QUALITY}     {len(brotli.compress(body, quality=BROTLI_QUALITY)):>10,}")
+    else:
+        print("             br        (pip install brotli to measure)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard JSON serialization and compression.")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=int, default=8, help="Analytics entries per day")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed; the 'orjson' column measures the standard library fallback")
+
+    entries = synthetic_history(args.days, args.per_day)
+    print(f"Synthetic history: {len(entries):,} entries over {args.days} days")
+
+    report(f"/analytics?days={args.days}", {"data": entries, "next_cursor": None}, args.repeat)
+    report(f"/visualizations?days={args.days}", visualizations(entries, args.days), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
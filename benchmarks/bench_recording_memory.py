@@ -0,0 +1,75 @@
+"""
+Benchmark the memory used to record and transcribe a long browser recording.
+
+Feeds a recording session 100 ms chunks of a steady tone, as the WebSocket
+delivers them, then stops it. Recognition is answered by an in-process fake
+client that returns no results, so only buffering, silence trimming and
+segmenting are measured. Reports the Python heap peak (tracemalloc) while
+recording and including the transcription.
+
+Usage:
+    python benchmarks/bench_recording_memory.py [--minutes 30]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transcribe
+
+# 100 ms of a 220 Hz tone at 16 kHz, loud enough to count as speech
+CHUNK = (3000 * np.sin(2 * np.pi * 220 * np.arange(1600) / 16000)).astype("<i2").tobytes()
+
+
+def fake_speech_client(requests):
+    """Answers every recognize call with no results, counting the calls"""
+
+    def recognize(config, audio):
+        requests.append(len(audio.content))
+        return SimpleNamespace(results=[])
+
+    return SimpleNamespace(recognize=recognize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=30)
+    args = parser.parse_args()
+
+    requests = []
+    transcribe.get_speech_client = lambda: fake_speech_client(requests)
+    chunk_count = int(args.minutes * 60 * 10)
+    audio_bytes = chunk_count * len(CHUNK)
+
+    transcribe.start_recording("bench", "pet", streaming=False, source="browser")
+    session = transcribe.recording_sessions.get(("bench", "pet", "default"))
+    chunk = bytearray(CHUNK)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(chunk_count):
+        # A new bytes object per chunk, as the WebSocket delivers them
+        session.add_chunk(bytes(chunk))
+    recording_peak = tracemalloc.get_traced_memory()[1]
+    recorded = time.perf_counter()
+    result = transcribe.stop_recording("bench", "pet")
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(
+        f"{args.minutes:g}-minute recording: {audio_bytes / 1e6:.1f} MB of audio, spilled to a file: {session.audio_data.spilled}"
+    )
+    print(f"  recording:                peak {recording_peak / 1e6:6.1f} MB  ({recorded - start:.2f}s)")
+    print(f"  with trimming and splits: peak {peak / 1e6:6.1f} MB  ({time.perf_counter() - recorded:.2f}s)")
+    print(f"  {len(requests)} recognize requests, transcript: {result.get('transcript')!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Async Firestore access for the FastAPI endpoints and AI services.
+
+The firebase_admin client is synchronous: every ``.get()`` / ``.stream()`` call
+blocks the calling thread until the RPC completes. Calling it directly from an
+``async def`` endpoint stalls the whole event loop, so one slow history query
+holds up every other request on the worker. These helpers run the blocking
+calls on a bounded thread pool and return awaitables, which lets concurrent
+requests overlap while keeping the same client, documents and indexes.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from firestore_store import db
+
+# Upper bound on concurrent Firestore RPCs issued from one API worker
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore")
+
+
+async def run_db(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking Firestore call on the shared executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+def pet_collection(pet_id: str, name: str):
+    """Reference to a subcollection under ``pets/{pet_id}``"""
+    return db.collection("pets").document(pet_id).collection(name)
+
+
+def _collect(query) -> List[Dict]:
+    results = []
+    for doc in query.stream():
+        data = doc.to_dict()
+        data["id"] = doc.id
+        results.append(data)
+    return results
+
+
+async def stream_documents(query) -> List[Dict]:
+    """Stream a query off the event loop, returning dicts tagged with their document id"""
+    return await run_db(_collect, query)
+
+
+async def get_document(ref) -> Optional[Dict]:
+    """Fetch a single document, returning its data or None when it does not exist"""
+    snapshot = await run_db(ref.get)
+    if not snapshot.exists:
+        return None
+    return snapshot.to_dict() or {}
+
+
+async def get_pet(pet_id: str) -> Optional[Dict]:
+    """Async counterpart of ``firestore_store.get_pet_by_id``"""
+    try:
+        data = await get_document(db.collection("pets").document(pet_id))
+        return {"id": pet_id, **data} if data is not None else None
+    except Exception as e:
+        print(f"Error getting pet by ID: {e}")
+        return None
+
+
+async def get_pet_name(pet_id: str, default: str = "Pet") -> str:
+    """Display name for a pet, falling back to ``default``"""
+    data = await get_document(db.collection("pets").document(pet_id))
+    return data.get("name", default) if data else default
+
+
+async def query_pet_collection(
+    pet_id: str, collection: str, since: str = None, until: str = None, category: str = None
+) -> List[Dict]:
+    """Query ``pets/{pet_id}/{collection}`` by ISO timestamp range and optional category"""
+    query = pet_collection(pet_id, collection)
+
+    if category:
+        query = query.where("category", "==", category)
+    if since:
+        query = query.where("timestamp", ">=", since)
+    if until:
+        query = query.where("timestamp", "<=", until)
+
+    return await stream_documents(query)
@@ -4,6 +4,7 @@ import firebase_admin
 from firebase_admin import credentials, firestore, storage
 from dotenv import load_dotenv
 from datetime import datetime
+import time
 import uuid
 import os
 
@@ -14,28 +15,81 @@ if not firebase_admin._apps:
 
 db = firestore.client()
 
+# Seconds a cached pet profile is served before it is re-read, in case it was changed outside this process
+PET_PROFILE_CACHE_TTL = int(os.getenv("PET_PROFILE_CACHE_TTL", "300"))
+
+# Pet profiles read by get_pets_by_user_id: pet_id -> (profile, loaded_at)
+_pet_profile_cache = {}
+
 
 # Store voice transcript + summary
 def store_to_firestore(user_id, pet_id, transcript, summary):
-    db.collection("pets").document(pet_id).collection("voice-notes").add(
-        {"transcript": transcript, "summary": summary, "timestamp": datetime.utcnow().isoformat()}
-    )
+    from pet_timeline import record_ingest
+
+    entry_data = {"transcript": transcript, "summary": summary, "timestamp": datetime.utcnow().isoformat()}
+    _, doc_ref = db.collection("pets").document(pet_id).collection("voice-notes").add(entry_data)
+    record_ingest(pet_id, "voice-notes", doc_ref.id, entry_data)
 
 
 # Store PDF summary
-def store_pdf_summary(user_id, pet_id, summary, timestamp, file_name, file_url):
-    db.collection("pets").document(pet_id).collection("records").add(
-        {"summary": summary, "file_name": file_name, "file_url": file_url, "timestamp": timestamp}
-    )
+def store_pdf_summary(user_id, pet_id, summary, timestamp, file_name, file_url, content_hash=None):
+    from pet_timeline import record_ingest
+
+    record = {"summary": summary, "file_name": file_name, "file_url": file_url, "timestamp": timestamp}
+    pet_ref = db.collection("pets").document(pet_id)
+    doc_ref = pet_ref.collection("records").document()
+    batch = db.batch()
+    if content_hash:
+        # Index the record by the SHA-256 of its PDF, so a re-upload finds it (see find_pdf_record)
+        record["content_hash"] = content_hash
+        batch.set(
+            pet_ref.collection("record_hashes").document(content_hash),
+            {"record_id": doc_ref.id, **record},
+        )
+    batch.set(doc_ref, record)
+    batch.commit()
+    record_ingest(pet_id, "records", doc_ref.id, record)
+    return doc_ref.id
+
+
+def find_pdf_record(pet_id, content_hash):
+    """The record already created for this pet from a PDF with the same SHA-256, if any"""
+    snapshot = db.collection("pets").document(pet_id).collection("record_hashes").document(content_hash).get()
+    return snapshot.to_dict() if snapshot.exists else None
 
 
 # Get pets linked to a user
 def get_pets_by_user_id(user_id):
+    start = time.perf_counter()
     user_doc = db.collection("users").document(user_id).get()
     if not user_doc.exists:
         return []
     pet_ids = user_doc.to_dict().get("pets", [])
-    return [{"id": pid, **db.collection("pets").document(pid).get().to_dict()} for pid in pet_ids]
+
+    now = time.monotonic()
+    profiles = {}
+    for pid in pet_ids:
+        cached = _pet_profile_cache.get(pid)
+        if cached and now - cached[1] < PET_PROFILE_CACHE_TTL:
+            profiles[pid] = cached[0]
+
+    # Read every uncached pet in one batched call instead of one round trip per pet
+    missing = [pid for pid in dict.fromkeys(pet_ids) if pid not in profiles]
+    if missing:
+        for pet_doc in db.get_all([db.collection("pets").document(pid) for pid in missing]):
+            if pet_doc.exists:
+                profiles[pet_doc.id] = {"id": pet_doc.id, **pet_doc.to_dict()}
+                _pet_profile_cache[pet_doc.id] = (profiles[pet_doc.id], now)
+
+    pets = [dict(profiles[pid]) for pid in pet_ids if pid in profiles]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Loaded {len(pets)} pets for user {user_id} in {elapsed_ms:.1f} ms ({len(missing)} read from Firestore)")
+    return pets
+
+
+def invalidate_pet_profile(pet_id):
+    """Drop a pet's cached profile after its document changes"""
+    _pet_profile_cache.pop(pet_id, None)
 
 
 # Get individual pet by ID
@@ -80,6 +134,7 @@ def add_pet_to_page_and_user(user_id, pet_data, page_id):
 
     # Create or update pet
     db.collection("pets").document(pet_id).set(pet_document)
+    invalidate_pet_profile(pet_id)
 
     # Link pet to user and page
     db.collection("users").document(user_id).set(
@@ -154,8 +209,12 @@ def get_analytics_summary(pet_id, days=30):
 
 
 # Store voice/text daily activities in analytics collection for dashboard visibility
-def store_analytics_from_voice(pet_id, transcript, summary, classification):
-    """Store daily activity data from voice/text input into analytics collection"""
+def store_analytics_from_voice(pet_id, transcript, summary, classification, doc_id=None):
+    """Store daily activity data from voice/text input into analytics collection
+
+    With ``doc_id`` the entry is written to that document, so storing it again
+    (e.g. when a job is retried) replaces it instead of adding a duplicate.
+    """
     try:
         # Map activity keywords to analytics categories
         keywords = classification.get('keywords', [])
@@ -197,8 +256,16 @@ def store_analytics_from_voice(pet_id, transcript, summary, classification):
             "notes": f"Daily activity recorded via voice/text: {summary[:100]}...",
         }
 
-        # Store in analytics collection
-        db.collection("pets").document(pet_id).collection("analytics").add(analytics_entry)
+        # Store in analytics collection and mirror it to the timeline and summary rollups
+        from pet_timeline import record_ingest
+
+        analytics = db.collection("pets").document(pet_id).collection("analytics")
+        if doc_id:
+            doc_ref = analytics.document(doc_id)
+            doc_ref.set(analytics_entry)
+        else:
+            _, doc_ref = analytics.add(analytics_entry)
+        record_ingest(pet_id, "analytics", doc_ref.id, analytics_entry)
         print(f"Stored daily activity as '{best_category}' in analytics collection")
 
     except Exception as e:
@@ -4,15 +4,17 @@ Uses OpenAI Function Calling to intelligently decide when and what visualization
 Includes pet data caching to avoid repeated database queries
 """
 
+import asyncio
 import os
 import json
-import openai
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 import re
 from collections import Counter
 
-from firestore_store import db, get_pet_by_id
+from firestore_async import get_pet, query_pet_collection
+from openai_pool import chat_completion, stream_chat_completion
+from pet_timeline import ALL_COLLECTIONS, load_pet_timeline
 from visualization_service import PetVisualizationService
 from simple_rag_service import SimplePetHealthRAGService
 
@@ -21,7 +23,6 @@ class IntelligentChatbotService:
     """Enhanced chatbot that uses OpenAI Function Calling for smart visualization decisions with data caching"""
 
     def __init__(self):
-        self.openai_client = openai.OpenAI()
         self.rag_service = SimplePetHealthRAGService()
         self.visualization_service = PetVisualizationService()
 
@@ -47,49 +48,15 @@ class IntelligentChatbotService:
         print(f"🔄 Preloading data for pet {pet_id} (last {days} days)")
 
         try:
-            cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
-
-            # Get pet basic info
-            pet_info = get_pet_by_id(pet_id)
-
-            # Get analytics data
-            analytics_query = (
-                db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", cutoff_date)
-            )
-
-            analytics_data = []
-            for doc in analytics_query.stream():
-                data = doc.to_dict()
-                analytics_data.append(data)
-
-            # Get voice notes
-            voice_query = (
-                db.collection("pets").document(pet_id).collection("voice-notes").where("timestamp", ">=", cutoff_date)
+            # Get pet basic info and all four collections concurrently
+            pet_info, timeline = await asyncio.gather(
+                get_pet(pet_id), load_pet_timeline(pet_id, days=days, collections=ALL_COLLECTIONS)
             )
 
-            voice_notes = []
-            for doc in voice_query.stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                voice_notes.append(data)
-
-            # Get text inputs
-            text_query = db.collection("pets").document(pet_id).collection("textinput").where("timestamp", ">=", cutoff_date)
-
-            text_inputs = []
-            for doc in text_query.stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                text_inputs.append(data)
-
-            # Get medical records
-            records_query = db.collection("pets").document(pet_id).collection("records").where("timestamp", ">=", cutoff_date)
-
-            medical_records = []
-            for doc in records_query.stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                medical_records.append(data)
+            analytics_data = timeline["documents"]["analytics"]
+            voice_notes = timeline["documents"]["voice-notes"]
+            text_inputs = timeline["documents"]["textinput"]
+            medical_records = timeline["documents"]["records"]
 
             # Cache all data
             cached_data = {
@@ -121,6 +88,7 @@ class IntelligentChatbotService:
                     "medical_records": len(medical_records),
                     "pet_name": pet_info.get('name', 'Unknown') if pet_info else 'Unknown',
                     "cache_valid_until": (datetime.utcnow() + timedelta(minutes=self.cache_expiry_minutes)).isoformat(),
+                    "timings_ms": timeline["timings_ms"],
                 },
             }
 
@@ -401,14 +369,7 @@ class IntelligentChatbotService:
             print(f"🔍 Cache miss - querying database for pet {pet_id}")
             cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
 
-            analytics_query = (
-                db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", cutoff_date)
-            )
-
-            analytics_data = []
-            for doc in analytics_query.stream():
-                data = doc.to_dict()
-                analytics_data.append(data)
+            analytics_data = await query_pet_collection(pet_id, "analytics", since=cutoff_date)
 
             print(f"📊 Retrieved {len(analytics_data)} analytics entries from database")
             return analytics_data
@@ -466,26 +427,26 @@ class IntelligentChatbotService:
             print(f"Error executing visualization function {function_name}: {e}")
             return None
 
-    async def generate_intelligent_response(self, pet_id: str, query: str) -> Dict[str, Any]:
-        """Generate intelligent response using OpenAI Function Calling for visualization decisions"""
+    async def _prepare_chat(self, pet_id: str, query: str) -> Tuple[str, Dict[str, Any]]:
+        """System prompt for the function-calling completion, and the RAG context it was built from"""
 
         # Try to use cached data for better performance
         cached_data = self.get_cached_pet_data(pet_id)
 
-        # Get RAG response first to provide context (pass cached data if available)
+        # Retrieve RAG context only; the answer itself comes from the single function-calling completion
         if cached_data:
             print("🚀 Using cached data for RAG processing")
-            rag_response = await self.rag_service.generate_rag_response_with_cache(pet_id, query, cached_data)
+            rag_response = await self.rag_service.generate_rag_response_with_cache(pet_id, query, cached_data, generate=False)
         else:
             print("🔍 No cache available - using standard RAG processing")
-            rag_response = await self.rag_service.generate_rag_response(pet_id, query)
+            rag_response = await self.rag_service.generate_rag_response(pet_id, query, generate=False)
 
         # Get pet information for context (from cache if available)
         if cached_data and cached_data.get('pet_info'):
             pet_data = cached_data['pet_info']
             print("Using cached pet info")
         else:
-            pet_data = get_pet_by_id(pet_id)
+            pet_data = await get_pet(pet_id)
             print("🔍 Queried pet info from database")
 
         pet_info = ""
@@ -538,11 +499,90 @@ For summary requests, analyze the pet's data and provide detailed text insights
 - Recent observations and notable changes
 
 Context from Pet's Health Data:
-{rag_response.get('context_used', 'Limited context available')}"""
+{rag_response.get('context') or 'Limited context available'}"""
+        return system_prompt, rag_response
+
+    async def _add_visualizations(self, pet_id: str, tool_calls: List[Tuple[str, str]], response_data: Dict[str, Any]):
+        """Run the visualization functions OpenAI asked for, given as (name, JSON arguments) pairs"""
+        print(f"🔧 OpenAI requested {len(tool_calls)} function call(s)")
+
+        # Get analytics data once for all visualizations
+        analytics_data = await self.get_pet_analytics_data(pet_id)
+        print(f"📊 Retrieved {len(analytics_data)} analytics data points")
+
+        visualizations = {}
+
+        for function_name, arguments in tool_calls:
+            function_args = json.loads(arguments or "{}")
+
+            print(f"🎯 Executing function: {function_name}")
+            print(f"   Reason: {function_args.get('reason', 'No reason provided')}")
+
+            # Execute the visualization function
+            if analytics_data:
+                chart_data = self._execute_visualization_function(function_name, analytics_data, function_args)
+                if chart_data:
+                    visualizations[function_name] = chart_data
+                    print(f"   Generated {function_name}")
+                else:
+                    print(f"   Failed to generate {function_name}")
+            else:
+                print(f"   No analytics data available for {function_name}")
+
+            # Track function calls made
+            response_data["function_calls_made"].append(
+                {
+                    "function": function_name,
+                    "reason": function_args.get('reason', 'No reason provided'),
+                    "success": function_name in visualizations,
+                }
+            )
+
+        # Add visualizations to response if any were generated
+        if visualizations:
+            response_data["visualizations"] = visualizations
+            response_data["data_points"] = len(analytics_data)
+            print(f"Added {len(visualizations)} visualizations to response")
+
+            # Enhance the text response to mention the visualizations
+            if response_data["response"]:
+                response_data[
+                    "response"
+                ] += f"\n\n📊 I've also prepared {len(visualizations)} visualization(s) to help you better understand the data patterns."
+        else:
+            print("No visualizations were generated despite function calls")
+
+    def _base_response(self, text: str, rag_response: Dict[str, Any], tool_calls_requested: bool) -> Dict[str, Any]:
+        # If no text content but function calls were made, provide default text
+        if not text and tool_calls_requested:
+            text = "I'm analyzing your pet's data and preparing visualizations to help answer your question."
+
+        return {
+            "status": "success",
+            "response": text,
+            "sources": rag_response.get("sources", []),
+            "context_used": rag_response.get("context_used", False),
+            "timestamp": datetime.utcnow().isoformat(),
+            "function_calls_made": [],
+        }
+
+    def _error_response(self, error: Exception, rag_response: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "response": f"I'm having trouble processing your request: {str(error)}",
+            "sources": rag_response.get("sources", []),
+            "context_used": rag_response.get("context_used", False),
+            "timestamp": datetime.utcnow().isoformat(),
+            "error": str(error),
+        }
+
+    async def generate_intelligent_response(self, pet_id: str, query: str) -> Dict[str, Any]:
+        """Generate intelligent response using OpenAI Function Calling for visualization decisions"""
+        system_prompt, rag_response = await self._prepare_chat(pet_id, query)
 
         try:
             # Call OpenAI with function calling enabled
-            response = self.openai_client.chat.completions.create(
+            response = await chat_completion(
                 model="gpt-4",
                 messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
                 tools=self.available_functions,
@@ -553,73 +593,12 @@ Context from Pet's Health Data:
 
             # Process the response
             message = response.choices[0].message
-
-            # Prepare the base response
-            base_response_text = message.content or ""
-
-            # If no text content but function calls were made, provide default text
-            if not base_response_text and message.tool_calls:
-                base_response_text = "I'm analyzing your pet's data and preparing visualizations to help answer your question."
-
-            response_data = {
-                "status": "success",
-                "response": base_response_text,
-                "sources": rag_response.get("sources", []),
-                "context_used": rag_response.get("context_used", False),
-                "timestamp": datetime.utcnow().isoformat(),
-                "function_calls_made": [],
-            }
+            response_data = self._base_response(message.content or "", rag_response, bool(message.tool_calls))
 
             # Handle function calls if any were made
             if message.tool_calls:
-                print(f"🔧 OpenAI requested {len(message.tool_calls)} function call(s)")
-
-                # Get analytics data once for all visualizations
-                analytics_data = await self.get_pet_analytics_data(pet_id)
-                print(f"📊 Retrieved {len(analytics_data)} analytics data points")
-
-                visualizations = {}
-
-                for tool_call in message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-
-                    print(f"🎯 Executing function: {function_name}")
-                    print(f"   Reason: {function_args.get('reason', 'No reason provided')}")
-
-                    # Execute the visualization function
-                    if analytics_data:
-                        chart_data = self._execute_visualization_function(function_name, analytics_data, function_args)
-                        if chart_data:
-                            visualizations[function_name] = chart_data
-                            print(f"   Generated {function_name}")
-                        else:
-                            print(f"   Failed to generate {function_name}")
-                    else:
-                        print(f"   No analytics data available for {function_name}")
-
-                    # Track function calls made
-                    response_data["function_calls_made"].append(
-                        {
-                            "function": function_name,
-                            "reason": function_args.get('reason', 'No reason provided'),
-                            "success": function_name in visualizations,
-                        }
-                    )
-
-                # Add visualizations to response if any were generated
-                if visualizations:
-                    response_data["visualizations"] = visualizations
-                    response_data["data_points"] = len(analytics_data)
-                    print(f"Added {len(visualizations)} visualizations to response")
-
-                    # Enhance the text response to mention the visualizations
-                    if response_data["response"]:
-                        response_data[
-                            "response"
-                        ] += f"\n\n📊 I've also prepared {len(visualizations)} visualization(s) to help you better understand the data patterns."
-                else:
-                    print("No visualizations were generated despite function calls")
+                tool_calls = [(tool_call.function.name, tool_call.function.arguments) for tool_call in message.tool_calls]
+                await self._add_visualizations(pet_id, tool_calls, response_data)
             else:
                 print("🔍 No function calls were made - providing text-only response")
 
@@ -627,11 +606,44 @@ Context from Pet's Health Data:
 
         except Exception as e:
             print(f"Error in generate_intelligent_response: {e}")
-            return {
-                "status": "error",
-                "response": f"I'm having trouble processing your request: {str(e)}",
-                "sources": rag_response.get("sources", []),
-                "context_used": rag_response.get("context_used", False),
-                "timestamp": datetime.utcnow().isoformat(),
-                "error": str(e),
-            }
+            return self._error_response(e, rag_response)
+
+    async def stream_intelligent_response(self, pet_id: str, query: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Streaming generate_intelligent_response: yields ("token", {"text"}) events while the answer is
+        generated, then a final ("done", response) event with the same fields, sources and visualizations"""
+        # Set before anything can fail, so a RAG or Firestore error still ends the stream with a "done" event
+        rag_response = {}
+        try:
+            system_prompt, rag_response = await self._prepare_chat(pet_id, query)
+            text = []
+            # Tool call names and arguments arrive in fragments, keyed by the call's index
+            tool_calls = {}
+            async for chunk in stream_chat_completion(
+                model="gpt-4",
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
+                tools=self.available_functions,
+                tool_choice="auto",
+                temperature=0.3,
+                max_tokens=800,
+            ):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    text.append(delta.content)
+                    yield "token", {"text": delta.content}
+                for tool_call in delta.tool_calls or []:
+                    name, arguments = tool_calls.get(tool_call.index, ("", ""))
+                    if tool_call.function is not None:
+                        name += tool_call.function.name or ""
+                        arguments += tool_call.function.arguments or ""
+                    tool_calls[tool_call.index] = (name, arguments)
+
+            response_data = self._base_response("".join(text), rag_response, bool(tool_calls))
+            if tool_calls:
+                await self._add_visualizations(pet_id, [tool_calls[index] for index in sorted(tool_calls)], response_data)
+            yield "done", response_data
+
+        except Exception as e:
+            print(f"Error in stream_intelligent_response: {e}")
+            yield "done", self._error_response(e, rag_response)
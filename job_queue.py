@@ -0,0 +1,279 @@
+"""
+Persistent background job queue backed by a local SQLite database.
+
+Slow work (the OpenAI enrichment of notes) is recorded as a job and picked up
+by a small pool of worker threads, so endpoints can respond as soon as the
+raw data is stored. Jobs survive restarts: anything still pending, or running
+when the process died, is picked up again by the next worker pool. Delivery
+is at-least-once, so handlers should be safe to run twice.
+
+Several processes (e.g. uvicorn workers) can share one database. A claimed
+job records its owner and a lease that the owner renews while it runs; only
+a job whose lease has run out is taken over by another worker.
+
+    job_id = enqueue("enrich_note", {"pet_id": ..., ...})
+    get_job(job_id)  # {"id", "kind", "status", "result", "error", "attempts", ...}
+
+Job status moves pending -> running -> done, or back to pending for a retry,
+and to failed once ``JOB_MAX_ATTEMPTS`` is reached.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", os.path.join("data", "jobs.sqlite3"))
+
+# Worker threads started by start_workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Attempts per job before it is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Seconds a claimed job stays with its worker without a renewal; after that another process may take it over
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+
+# Seconds an idle worker waits before checking for jobs it wasn't woken for
+POLL_INTERVAL = 2.0
+
+# Identifies this process's claims in a database shared with other processes
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# kind -> (handler, on_failure)
+_handlers: Dict[str, tuple] = {}
+
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_workers = []
+_lease_renewer = None
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect() -> sqlite3.Connection:
+    # One connection per thread; SQLite serializes the writers
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    path = JOB_QUEUE_DB
+    if path not in connections:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        with _schema_lock:
+            if path not in _schema_ready:
+                connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        result TEXT,
+                        error TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        claimed_by TEXT,
+                        lease_expires_at REAL
+                    )""")
+                # Databases created before leases existed
+                columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+                for column, kind in (("claimed_by", "TEXT"), ("lease_expires_at", "REAL")):
+                    if column not in columns:
+                        connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+                connection.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, created_at)")
+                _schema_ready.add(path)
+        connections[path] = connection
+    return connections[path]
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def register_handler(kind: str, handler: Callable[[Dict], Any], on_failure: Callable[[Dict, str], Any] = None):
+    """Run ``handler(payload)`` for jobs of ``kind``
+
+    Its return value is stored as the job result. ``on_failure(payload, error)``
+    runs once a job has used up its attempts; its return value becomes the
+    result of the failed job.
+    """
+    _handlers[kind] = (handler, on_failure)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def enqueue(kind: str, payload: Dict, job_id: str = None) -> str:
+    """Persist a new pending job and wake a worker; returns the job id"""
+    job_id = job_id or new_job_id()
+    now = time.time()
+    _connect().execute(
+        "INSERT INTO jobs (id, kind, payload, status, attempts, created_at, updated_at) VALUES (?, ?, ?, 'pending', 0, ?, ?)",
+        (job_id, kind, json.dumps(payload), now, now),
+    )
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """A job's current state, or None if it doesn't exist"""
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def _claim_next() -> Optional[Dict[str, Any]]:
+    connection = _connect()
+    # IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        kinds = list(_handlers)
+        now = time.time()
+        # Pending jobs, and running ones whose worker stopped renewing its lease
+        row = connection.execute(
+            f"SELECT * FROM jobs WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < ?)) "
+            f"AND kind IN ({','.join('?' * len(kinds))}) ORDER BY created_at LIMIT 1",
+            [now, *kinds],
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, claimed_by = ?, "
+                "lease_expires_at = ? WHERE id = ?",
+                (now, WORKER_ID, now + JOB_LEASE_SECONDS, row["id"]),
+            )
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    job = _row_to_job(row)
+    job["attempts"] += 1
+    job["claimed_by"] = WORKER_ID
+    return job
+
+
+def _finish(job_id: str, status: str, result: Any = None, error: str = None):
+    # Only while this process still holds the job; one that lost its lease leaves it to the new owner
+    _connect().execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, claimed_by = NULL, lease_expires_at = NULL "
+        "WHERE id = ? AND claimed_by = ?",
+        (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, WORKER_ID),
+    )
+
+
+def renew_leases() -> int:
+    """Extend the leases of the jobs this process is running; returns how many"""
+    now = time.time()
+    cursor = _connect().execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE status = 'running' AND claimed_by = ?",
+        (now + JOB_LEASE_SECONDS, WORKER_ID),
+    )
+    return cursor.rowcount
+
+
+def _renew_leases_forever():
+    while not _stopping.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            renew_leases()
+        except Exception as e:
+            print(f"Job lease renewal error: {e}")
+
+
+def run_job(job: Dict[str, Any]):
+    """Run one claimed job and record its outcome"""
+    handler, on_failure = _handlers[job["kind"]]
+    try:
+        _finish(job["id"], "done", handler(job["payload"]))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if job["attempts"] < JOB_MAX_ATTEMPTS:
+            print(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, will retry: {error}")
+            _finish(job["id"], "pending", error=error)
+            _wakeup.set()
+            return
+        print(f"Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {error}")
+        result = None
+        if on_failure is not None:
+            try:
+                result = on_failure(job["payload"], error)
+            except Exception as failure_error:
+                print(f"Failure handler for job {job['id']} raised: {failure_error}")
+        _finish(job["id"], "failed", result, error)
+
+
+def run_pending() -> int:
+    """Run queued jobs in the calling thread until none are left; returns how many ran"""
+    count = 0
+    while _handlers:
+        job = _claim_next()
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
+    return count
+
+
+def _worker_loop():
+    while not _stopping.is_set():
+        try:
+            if run_pending():
+                continue
+        except Exception as e:
+            print(f"Job worker error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def recover_interrupted_jobs() -> int:
+    """Return jobs left running by a process that stopped renewing their leases to the queue
+
+    Jobs other live processes are running keep their owner.
+    """
+    now = time.time()
+    cursor = _connect().execute(
+        "UPDATE jobs SET status = 'pending', updated_at = ?, claimed_by = NULL, lease_expires_at = NULL "
+        "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+        (now, now),
+    )
+    if cursor.rowcount:
+        print(f"Requeued {cursor.rowcount} interrupted jobs")
+    return cursor.rowcount
+
+
+def start_workers(count: int = None):
+    """Start the worker pool, requeueing jobs whose owner is gone"""
+    global _lease_renewer
+    if _workers:
+        return
+    recover_interrupted_jobs()
+    _stopping.clear()
+    for index in range(count or JOB_WORKERS):
+        worker = threading.Thread(target=_worker_loop, name=f"job-worker-{index}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    _lease_renewer = threading.Thread(target=_renew_leases_forever, name="job-lease-renewer", daemon=True)
+    _lease_renewer.start()
+    _wakeup.set()
+    print(f"Started {len(_workers)} job workers ({JOB_QUEUE_DB})")
+
+
+def stop_workers(timeout: float = 5.0):
+    """Stop the worker pool; running jobs finish, queued ones wait for the next start"""
+    _stopping.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+    if _lease_renewer is not None:
+        _lease_renewer.join(timeout)
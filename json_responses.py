@@ -0,0 +1,83 @@
+"""
+Fast JSON responses and compression for the API.
+
+Chart.js configs and year-long analytics lists are the largest bodies the API
+sends. ``ORJSONResponse`` encodes them with orjson, and endpoints that return
+one directly also skip FastAPI's ``jsonable_encoder`` pass over the content.
+``add_compression`` compresses bodies above a size threshold with brotli when
+``brotli-asgi`` is installed and gzip otherwise; small bodies are sent as-is,
+where compression would cost more CPU than it saves on the wire.
+
+Streaming endpoints send ``text/event-stream`` bodies built with ``sse_event``.
+Those are never compressed, because the compressor would hold tokens back until
+its buffer fills.
+
+Benchmark: ``python benchmarks/bench_json_responses.py``
+"""
+
+import json
+import os
+from typing import Any
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Endpoints that can stream Server-Sent Events; brotli-asgi would buffer them (Starlette's gzip skips event streams itself)
+STREAMING_PATHS = (r"^/api/pets/[^/]+/chat$", r"^/api/pets/[^/]+/assistant_summary$")
+
+# Low levels compress JSON nearly as well as the maximum at a fraction of the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes, with orjson when available"""
+    if orjson is not None:
+        # Firestore can hand back types orjson doesn't know (e.g. GeoPoint); stringify those
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, falling back to the standard library"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, response: Response = None) -> ORJSONResponse:
+    """Encode ``content`` directly, keeping headers already set on FastAPI's injected ``response``"""
+    return ORJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """One Server-Sent Events message carrying ``data`` as JSON"""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+def add_compression(app):
+    """Compress responses above ``COMPRESSION_MIN_SIZE`` with brotli, or gzip when brotli isn't installed"""
+    if BrotliMiddleware is not None:
+        # Clients that don't accept br still get gzip
+        app.add_middleware(
+            BrotliMiddleware,
+            quality=BROTLI_QUALITY,
+            minimum_size=COMPRESSION_MIN_SIZE,
+            gzip_fallback=True,
+            excluded_handlers=STREAMING_PATHS,
+        )
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE, compresslevel=GZIP_LEVEL)
@@ -0,0 +1,239 @@
+"""
+Content-addressed cache of OpenAI results.
+
+Client retries, duplicate uploads and re-run fixtures send the same text
+through the same prompt again. Results are keyed by a SHA-256 of everything
+that shapes the output (model, prompt template version, input text,
+temperature and any other request options), so a repeated input skips the
+network entirely:
+
+    key = cache_key("gpt-4o", NOTE_ANALYSIS_PROMPT_VERSION, text, 0.2, max_tokens=400)
+    result = llm_cache.get(key)
+    if result is None:
+        result = ...  # call OpenAI
+        llm_cache.set(key, result)
+
+Lookups go to a size-bounded in-memory LRU first and then to a SQLite file
+(``data/llm_cache.sqlite3`` by default) that survives restarts and is shared
+by every worker process. Entries expire after ``LLM_CACHE_TTL`` seconds, and
+the disk tier drops its least recently used entries once it grows past
+``LLM_CACHE_MAX_DISK_BYTES``. Coroutines use ``aget``/``aset``, which run
+the disk tier in a worker thread instead of blocking the event loop. Only successful completions should be cached;
+fallback text from an API error must be recomputed next time.
+
+Bump a prompt's version constant whenever its template changes, so results
+from the old prompt are no longer served.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from response_cache import ResponseCache
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", os.path.join("data", "llm_cache.sqlite3"))
+
+# Seconds a cached result stays valid
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+LLM_CACHE_MEMORY_BYTES = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(8 * 1024 * 1024)))
+LLM_CACHE_MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(model: str, prompt_version: str, text: str, temperature: float, **options) -> str:
+    """SHA-256 over everything that determines a completion"""
+    material = json.dumps(
+        {"model": model, "prompt": prompt_version, "input": text, "temperature": temperature, "options": options},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Two-tier (memory LRU, then SQLite) cache of JSON-serializable results with a TTL"""
+
+    def __init__(self, path: str, ttl: int, memory_bytes: int, max_disk_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        # Values are stored as (expires_at, value)
+        self.memory = ResponseCache(memory_bytes)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        # One connection per thread, as in job_queue
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            return connection
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        connection.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                key TEXT PRIMARY KEY,
+                                value TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                expires_at REAL NOT NULL,
+                                last_used REAL NOT NULL
+                            )""")
+                        connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+                        connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+                        # Running total of the size column, kept by triggers so every process sees the same number
+                        # without summing the table on each write; seeded once for files from before it existed
+                        connection.execute(
+                            "CREATE TABLE IF NOT EXISTS llm_cache_total (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+                        )
+                        connection.execute(
+                            "INSERT OR IGNORE INTO llm_cache_total (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM llm_cache"
+                        )
+                        connection.execute("""CREATE TRIGGER IF NOT EXISTS llm_cache_total_insert AFTER INSERT ON llm_cache
+                            BEGIN UPDATE llm_cache_total SET bytes = bytes + new.size; END""")
+                        connection.execute(
+                            """CREATE TRIGGER IF NOT EXISTS llm_cache_total_update AFTER UPDATE OF size ON llm_cache
+                            BEGIN UPDATE llm_cache_total SET bytes = bytes + new.size - old.size; END"""
+                        )
+                        connection.execute("""CREATE TRIGGER IF NOT EXISTS llm_cache_total_delete AFTER DELETE ON llm_cache
+                            BEGIN UPDATE llm_cache_total SET bytes = bytes - old.size; END""")
+                        connection.execute("COMMIT")
+                    except sqlite3.Error:
+                        connection.execute("ROLLBACK")
+                        raise
+                    self._schema_ready = True
+        except sqlite3.Error as e:
+            # The disk tier is an optimization; without it the memory tier still works
+            print(f"LLM cache disk tier unavailable ({self.path}): {e}")
+            return None
+        self._local.connection = connection
+        return connection
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        cached = self.memory.get(key)
+        if cached is not None and cached[0] > time.time():
+            self._count("memory_hits")
+            return cached[1]
+        return None
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        connection = self._connect()
+        if connection is not None:
+            try:
+                now = time.time()
+                row = connection.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    connection.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[0])
+                    self.memory.set(key, (row[1], value), size=len(row[0]))
+                    self._count("disk_hits")
+                    return value
+            except sqlite3.Error as e:
+                print(f"LLM cache read failed: {e}")
+
+        self._count("misses")
+        return None
+
+    def get(self, key: str) -> Optional[Any]:
+        cached = self._memory_get(key)
+        if cached is not None:
+            return cached
+        return self._disk_get(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """``get`` for coroutines: the memory tier inline, the disk tier in a worker thread"""
+        cached = self._memory_get(key)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self._disk_get, key)
+
+    def _memory_set(self, key: str, value: Any):
+        encoded = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, (expires_at, value), size=len(encoded))
+        return encoded, expires_at
+
+    def _disk_set(self, key: str, encoded: str, expires_at: float):
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            connection.execute(
+                """INSERT INTO llm_cache (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size,
+                    expires_at = excluded.expires_at, last_used = excluded.last_used""",
+                (key, encoded, len(encoded), expires_at, time.time()),
+            )
+            self._trim(connection)
+        except sqlite3.Error as e:
+            print(f"LLM cache write failed: {e}")
+
+    def set(self, key: str, value: Any):
+        self._disk_set(key, *self._memory_set(key, value))
+
+    async def aset(self, key: str, value: Any):
+        """``set`` for coroutines: the disk write runs in a worker thread"""
+        await asyncio.to_thread(self._disk_set, key, *self._memory_set(key, value))
+
+    def _disk_bytes(self, connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT bytes FROM llm_cache_total WHERE id = 0").fetchone()[0]
+
+    def _trim(self, connection: sqlite3.Connection):
+        connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        total = self._disk_bytes(connection)
+        # Drop least recently used entries until the file is back under its bound
+        removed = 0
+        while total > self.max_disk_bytes:
+            oldest = connection.execute("SELECT key, size FROM llm_cache ORDER BY last_used LIMIT 64").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if total <= self.max_disk_bytes:
+                    break
+                connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        with self._lock:
+            self.disk_evictions += removed
+
+    def clear(self):
+        self.memory.clear()
+        connection = self._connect()
+        if connection is not None:
+            connection.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": self.memory.stats()["entries"],
+            "memory_bytes": self.memory.current_bytes,
+            "memory_evictions": self.memory.evictions,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+llm_cache = LLMCache(LLM_CACHE_DB, LLM_CACHE_TTL, LLM_CACHE_MEMORY_BYTES, LLM_CACHE_MAX_DISK_BYTES)
@@ -5,7 +5,7 @@ import argparse
 from dotenv import load_dotenv
 import openai
 from transcribe import transcribe_audio
-from summarize_openai import summarize_text, classify_pet_content
+from summarize_openai import analyze_pet_note
 from firestore_store import store_to_firestore, store_analytics_from_voice
 
 # Load env variables
@@ -22,11 +22,10 @@ def main(user_id, pet_id):
         transcript = transcribe_audio(duration_seconds=20)
         print("\n TRANSCRIPT:\n", transcript)
 
-        summary = summarize_text(transcript)
+        # Summarize and classify in one call; the classification tells us if it's daily activity
+        classification = analyze_pet_note(transcript)
+        summary = classification.pop("summary")
         print("\n SUMMARY:\n", summary)
-
-        # Classify content to check if it's daily activity
-        classification = classify_pet_content(transcript)
         print(f"\n CLASSIFICATION: {classification}")
 
         # Store to voice-notes collection
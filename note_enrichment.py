@@ -0,0 +1,130 @@
+"""
+Background AI enrichment of voice notes and text inputs.
+
+The note endpoints store the raw note with ``status: "pending"`` and a job id,
+mirrors it to the timeline and summary rollups, then queues an ``enrich_note``
+job. The job fills in the summary and classification, updates the note's
+timeline entry (moving it between rollups if its category changed), and
+copies daily-activity text notes to analytics. Every step replaces what an
+earlier attempt wrote, so a retried job never counts a note twice. Clients poll
+``GET /api/jobs/{job_id}``; the finished job's result has the same shape the
+endpoints used to return inline.
+"""
+
+from datetime import datetime
+from typing import Dict
+
+from firestore_async import pet_collection
+from job_queue import enqueue, new_job_id, register_handler
+
+ENRICH_NOTE_JOB = "enrich_note"
+
+# Field holding the note text in each collection
+NOTE_TEXT_FIELDS = {"textinput": "input", "voice-notes": "transcript"}
+
+
+def create_pending_note(pet_id: str, collection: str, text: str) -> Dict:
+    """Store a raw note, mirror it to the timeline and queue its enrichment; returns ``{"doc_id", "job_id"}``"""
+    from pet_timeline import record_ingest
+
+    ref = pet_collection(pet_id, collection).document()
+    job_id = new_job_id()
+    note = {
+        NOTE_TEXT_FIELDS[collection]: text,
+        "summary": "",
+        "status": "pending",
+        "job_id": job_id,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    # The note is written before its job is queued, so a worker can never pick up a job for a missing note
+    ref.set(note)
+    # Mirrored now so the note shows up right away; enrichment replaces this entry
+    record_ingest(pet_id, collection, ref.id, note)
+    enqueue(ENRICH_NOTE_JOB, {"pet_id": pet_id, "collection": collection, "doc_id": ref.id}, job_id=job_id)
+    return {"doc_id": ref.id, "job_id": job_id}
+
+
+def _note_result(collection: str, note: Dict) -> Dict:
+    content_type = note.get("content_type", "MIXED")
+    result = {
+        "status": "success",
+        "summary": note.get("summary", ""),
+        "content_type": content_type,
+        "confidence": note.get("confidence", 0.5),
+        "keywords": note.get("keywords", []),
+    }
+    if collection == "voice-notes":
+        result["transcript"] = note.get("transcript", "")
+        result["message"] = f"Processed {content_type.lower()} voice note"
+    else:
+        result["message"] = f"Added {content_type.lower()} note with AI summary"
+    return result
+
+
+def _store_enrichment(pet_id: str, collection: str, doc_id: str, note: Dict, fields: Dict):
+    from firestore_store import store_analytics_from_voice
+    from pet_timeline import record_ingest
+
+    ref = pet_collection(pet_id, collection).document(doc_id)
+    ref.update(fields)
+    note.update(fields)
+    record_ingest(pet_id, collection, doc_id, note)
+
+    # Daily activity text notes also show up in analytics for dashboard visibility
+    if collection == "textinput" and note.get("content_type") == "DAILY_ACTIVITY":
+        classification = {
+            "classification": note["content_type"],
+            "confidence": note.get("confidence", 0.5),
+            "keywords": note.get("keywords", []),
+        }
+        # Keyed by the note, so a retry overwrites the copy rather than adding another
+        store_analytics_from_voice(pet_id, note["input"], note["summary"], classification, doc_id=f"{collection}_{doc_id}")
+
+    # Marked done last, so a retry after a crash redoes the mirroring rather than skipping it
+    ref.update({"status": "done"})
+    note["status"] = "done"
+
+
+def enrich_note(payload: Dict) -> Dict:
+    """Summarize and classify a pending note, then mirror it to the timeline and analytics"""
+    from summarize_openai import analyze_pet_note
+
+    pet_id, collection, doc_id = payload["pet_id"], payload["collection"], payload["doc_id"]
+    snapshot = pet_collection(pet_id, collection).document(doc_id).get()
+    if not snapshot.exists:
+        return {"status": "error", "message": "Note no longer exists"}
+
+    note = snapshot.to_dict()
+    # Already enriched by an earlier attempt of this job
+    if note.get("status") == "done":
+        return _note_result(collection, note)
+
+    text = note.get(NOTE_TEXT_FIELDS[collection], "")
+    # Strict: an API error fails the attempt, so the queue retries it and finally stores the note unenriched
+    analysis = analyze_pet_note(text, strict=True)
+
+    fields = {
+        "summary": analysis["summary"],
+        "content_type": analysis.get("classification", "MIXED"),
+        "confidence": analysis.get("confidence", 0.5),
+        "keywords": analysis.get("keywords", []),
+    }
+    _store_enrichment(pet_id, collection, doc_id, note, fields)
+    print(f"Enriched {collection} note {doc_id} for pet {pet_id} as {fields['content_type']}")
+    return _note_result(collection, note)
+
+
+def store_unenriched_note(payload: Dict, error: str) -> Dict:
+    """Keep a note visible on the dashboard when its enrichment keeps failing"""
+    pet_id, collection, doc_id = payload["pet_id"], payload["collection"], payload["doc_id"]
+    snapshot = pet_collection(pet_id, collection).document(doc_id).get()
+    if not snapshot.exists:
+        return {"status": "error", "message": "Note no longer exists"}
+
+    note = snapshot.to_dict()
+    fields = {"summary": "Note saved. AI processing unavailable.", "content_type": "TRANSCRIPTION_ONLY"}
+    _store_enrichment(pet_id, collection, doc_id, note, fields)
+    return {**_note_result(collection, note), "status": "stopped", "message": "Note saved, AI processing unavailable"}
+
+
+register_handler(ENRICH_NOTE_JOB, enrich_note, on_failure=store_unenriched_note)
@@ -0,0 +1,286 @@
+"""
+One shared AsyncOpenAI client for every service.
+
+Summaries, PDF parsing, RAG answers, the chatbot and analytics insights all
+send their completions through this module instead of holding their own
+blocking ``OpenAI()`` client. The client lives on a dedicated event loop
+thread with a single tuned httpx connection pool, and a global semaphore caps
+how many requests are in flight at once. That way concurrent chat, summary
+and insight requests overlap rather than queueing behind each other or
+blocking the API's event loop.
+
+    response = await chat_completion(model="gpt-4o", messages=[...])  # async endpoints and services
+    response = chat_completion_sync(model="gpt-4o", messages=[...])   # job workers and CLI scripts
+
+    async for chunk in stream_chat_completion(model="gpt-4", messages=[...]):  # token by token
+        ...
+
+All take the same keyword arguments as ``client.chat.completions.create``,
+plus an optional ``max_attempts``.
+
+Requests are paced by token buckets for requests per minute
+(``OPENAI_RPM_LIMIT``) and tokens per minute (``OPENAI_TPM_LIMIT``), so the
+process runs steadily at the provider's limit instead of bursting into 429s.
+Rate limits, timeouts, connection errors and 5xx responses are retried with
+jittered exponential backoff; while waiting, a request gives up its
+concurrency slot. When the provider sends ``Retry-After``, every request
+waits that long, rather than all of them retrying into the same limit at once.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+# Requests to OpenAI in flight at once, across the whole process
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+# Connection pool; idle keep-alive connections skip the TLS handshake on the next request
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "16"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "8"))
+OPENAI_KEEPALIVE_EXPIRY = 60.0
+
+# Seconds to wait for a completion; connecting should be quick
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = 5.0
+
+# Provider limits for the account; 0 disables a bucket
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+
+# Attempts per request, and the backoff between them in seconds
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+OPENAI_BACKOFF_BASE = 1.0
+OPENAI_BACKOFF_MAX = 30.0
+
+# Completion budget charged to the token bucket when a request doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# Created on the client loop the first time they're needed
+_client = None
+_semaphore = None
+
+# Monotonic time before which no request is sent, set from Retry-After
+_paused_until = 0.0
+
+_stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously up to ``per_minute``
+
+    Only used from the client loop, so it needs no thread locking. Waiters are
+    served in arrival order. ``clock`` and ``sleep`` can be replaced in tests.
+    """
+
+    def __init__(self, per_minute: int, clock=time.monotonic, sleep=asyncio.sleep):
+        self.capacity = per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(per_minute)
+        self.updated = clock()
+        self._lock = None
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        if self.capacity <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # A request larger than the whole bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await self.sleep((amount - self.tokens) * 60 / self.capacity)
+                self._refill()
+            self.tokens -= amount
+
+    def settle(self, charged: float, used: float):
+        """Correct an estimate once the real usage is known; overuse leaves the bucket in debt"""
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + charged - used)
+
+
+request_bucket = TokenBucket(OPENAI_RPM_LIMIT)
+token_bucket = TokenBucket(OPENAI_TPM_LIMIT)
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Rough token cost of a request: about four characters per prompt token plus the completion budget"""
+    characters = sum(len(str(message.get("content") or "")) for message in kwargs.get("messages", []))
+    characters += len(str(kwargs.get("tools") or ""))
+    return characters // 4 + (kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from the Retry-After headers of an error response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying after ``attempt`` (0-based) failed with ``error``"""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        # A little jitter on top, so the paused requests don't all come back in the same instant
+        return min(retry_after, OPENAI_BACKOFF_MAX) + random.uniform(0, OPENAI_BACKOFF_BASE)
+    # Full jitter: spread retries over the whole backoff window
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2**attempt))
+
+
+def _client_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openai-client", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def get_client() -> AsyncOpenAI:
+    """The shared client; only use it from coroutines running on the client loop"""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        )
+        # Retries are handled in _create, where they respect the shared limits
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+    return _client
+
+
+async def _create(kwargs: Dict[str, Any], max_attempts: int = None, on_chunk: Callable[[Any], None] = None):
+    global _semaphore, _paused_until
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    max_attempts = max_attempts or OPENAI_MAX_ATTEMPTS
+    estimate = estimate_tokens(kwargs)
+
+    for attempt in range(max_attempts):
+        pause = _paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await request_bucket.acquire(1)
+        await token_bucket.acquire(estimate)
+
+        streamed = False
+        try:
+            _stats["requests"] += 1
+            async with _semaphore:
+                response = await get_client().chat.completions.create(**kwargs)
+                if on_chunk is not None:
+                    # A stream holds its concurrency slot until the last chunk
+                    async for chunk in response:
+                        streamed = True
+                        on_chunk(chunk)
+        except RETRYABLE_ERRORS as e:
+            if isinstance(e, openai.RateLimitError):
+                _stats["rate_limited"] += 1
+            # Chunks already handed out can't be taken back, so a broken stream isn't retried
+            if attempt == max_attempts - 1 or streamed:
+                _stats["failures"] += 1
+                raise
+            delay = retry_delay(e, attempt)
+            if _retry_after(e) is not None:
+                # The provider told everyone to back off, not just this request
+                _paused_until = max(_paused_until, time.monotonic() + delay)
+            _stats["retries"] += 1
+            print(f"OpenAI {type(e).__name__} (attempt {attempt + 1}/{max_attempts}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        except Exception:
+            _stats["failures"] += 1
+            raise
+
+        usage = getattr(response, "usage", None)
+        if getattr(usage, "total_tokens", None):
+            token_bucket.settle(estimate, usage.total_tokens)
+        return response
+
+
+async def chat_completion(*, max_attempts: int = None, **kwargs):
+    """Await a chat completion from any event loop"""
+    future = asyncio.run_coroutine_threadsafe(_create(kwargs, max_attempts), _client_loop())
+    return await asyncio.wrap_future(future)
+
+
+async def stream_chat_completion(*, max_attempts: int = None, **kwargs) -> AsyncIterator[Any]:
+    """Yield the chunks of a streamed chat completion, from any event loop
+
+    Closing the iterator early (e.g. when the browser disconnects) stops the request.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    done = object()
+
+    def on_chunk(chunk):
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+    future = asyncio.run_coroutine_threadsafe(_create({**kwargs, "stream": True}, max_attempts, on_chunk), _client_loop())
+    # Runs on the client loop after the last on_chunk, so it is queued behind every chunk
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(chunks.put_nowait, done))
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        future.result()
+    finally:
+        future.cancel()
+
+
+def chat_completion_sync(*, max_attempts: int = None, **kwargs):
+    """Run a chat completion from a thread without an event loop (job workers, CLI scripts)"""
+    return asyncio.run_coroutine_threadsafe(_create(kwargs, max_attempts), _client_loop()).result()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "rpm_limit": OPENAI_RPM_LIMIT,
+        "tpm_limit": OPENAI_TPM_LIMIT,
+        "max_concurrency": OPENAI_MAX_CONCURRENCY,
+    }
@@ -0,0 +1,162 @@
+"""
+Text extraction for uploaded PDFs.
+
+Kept apart from pdf_parser so that worker processes only import PyMuPDF, not
+Firestore or OpenAI. Pages of a small document are read in the calling thread.
+A document with at least ``PDF_PROCESS_POOL_MIN_PAGES`` pages is split into
+contiguous page ranges, and each range is read in a separate process, because
+PyMuPDF holds the GIL while it lays out a page:
+
+    pages = extract_page_texts(pdf)        # one string per page
+    chunks = chunk_pages(pages, 12000)     # [(first_page, last_page, text), ...]
+
+``pdf`` is a file path or the document's bytes (bytes, or a memoryview from
+``pdf_buffer``). Workers always open the document by path: bytes are written
+once to a temporary file rather than pickled to every worker.
+"""
+
+import io
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import List, Tuple
+
+import fitz
+
+# Documents with at least this many pages are extracted in the process pool
+PDF_PROCESS_POOL_MIN_PAGES = int(os.getenv("PDF_PROCESS_POOL_MIN_PAGES", "40"))
+
+# Worker processes for extraction; 1 reads every document in the calling thread
+PDF_EXTRACT_PROCESSES = int(os.getenv("PDF_EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@contextmanager
+def pdf_buffer(upload):
+    """Zero-copy view of an uploaded file's bytes, for ``extract_page_texts``
+
+    FastAPI spools uploads to a SpooledTemporaryFile: small ones stay in a
+    BytesIO, larger ones roll over to an anonymous temp file. The view is a
+    memoryview of the BytesIO, or of a read-only memory map of the temp file,
+    so the document is never copied into a second buffer. It doesn't move the
+    file position, so the same upload can be streamed to storage at the same time.
+    """
+    # Unwrap the SpooledTemporaryFile without forcing a rollover (its fileno() would)
+    raw = getattr(upload, "_file", upload)
+    if isinstance(raw, io.BytesIO):
+        view = raw.getbuffer()
+        try:
+            yield view
+        finally:
+            view.release()
+        return
+
+    raw.flush()
+    if not os.fstat(raw.fileno()).st_size:
+        # mmap can't map an empty file
+        yield b""
+        return
+    mapped = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        view.release()
+        mapped.close()
+
+
+def _open(pdf):
+    return fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream=pdf, filetype="pdf")
+
+
+def _page_range_texts(pdf, start: int, stop: int) -> List[str]:
+    doc = _open(pdf)
+    try:
+        return [doc[number].get_text() for number in range(start, stop)]
+    finally:
+        doc.close()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the API process runs threads (OpenAI loop, Firestore pool)
+            _pool = ProcessPoolExecutor(PDF_EXTRACT_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def extract_page_texts(pdf) -> List[str]:
+    """Text of each page, in order"""
+    doc = _open(pdf)
+    try:
+        page_count = doc.page_count
+        if page_count < PDF_PROCESS_POOL_MIN_PAGES or PDF_EXTRACT_PROCESSES <= 1:
+            return [page.get_text() for page in doc]
+    finally:
+        doc.close()
+
+    if isinstance(pdf, str):
+        return _extract_in_pool(pdf, page_count)
+    # Workers can't share a memoryview; a temporary file is written straight from it and read by path
+    with tempfile.NamedTemporaryFile(prefix="upload-", suffix=".pdf") as copy:
+        copy.write(pdf)
+        copy.flush()
+        return _extract_in_pool(copy.name, page_count)
+
+
+def _extract_in_pool(path: str, page_count: int) -> List[str]:
+    step = -(-page_count // PDF_EXTRACT_PROCESSES)
+    pool = _get_pool()
+    futures = [
+        pool.submit(_page_range_texts, path, start, min(start + step, page_count)) for start in range(0, page_count, step)
+    ]
+    return [text for future in futures for text in future.result()]
+
+
+def chunk_pages(pages: List[str], max_chars: int) -> List[Tuple[int, int, str]]:
+    """Group consecutive pages into chunks of at most ``max_chars`` characters
+
+    Returns ``(first_page, last_page, text)`` with 1-based page numbers. A chunk
+    only breaks between pages, unless a single page is longer than
+    ``max_chars``. Such a page is split into chunks of its own. Blank pages are
+    skipped.
+    """
+    chunks = []
+    first = last = None
+    parts = []
+    size = 0
+    for number, text in enumerate(pages, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        if parts and size + len(text) + 1 > max_chars:
+            chunks.append((first, last, "\n".join(parts)))
+            parts, size = [], 0
+        if len(text) > max_chars:
+            for offset in range(0, len(text), max_chars):
+                chunks.append((number, number, text[offset : offset + max_chars]))
+            continue
+        if not parts:
+            first = number
+        parts.append(text)
+        last = number
+        size += len(text) + 1
+    if parts:
+        chunks.append((first, last, "\n".join(parts)))
+    return chunks
+
+
+def shutdown_pool():
+    """Stop the worker processes, if they were started"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
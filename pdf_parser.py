@@ -1,46 +1,152 @@
 # pdf_parser.py
 
-import fitz
+import asyncio
 import os
-from openai import OpenAI
 from datetime import datetime
+
 from firestore_store import store_pdf_summary
-from dotenv import load_dotenv
+from firestore_async import run_db
+from llm_cache import cache_key, llm_cache
+from openai_pool import chat_completion
+from pdf_extract import chunk_pages, extract_page_texts
+
+# Part of the LLM cache key; bump when the prompts below change
+PDF_PROMPT_VERSION = "pdf-parser-v2"
+
+# Characters of document text per request; longer documents are summarized in chunks
+PDF_CHUNK_CHARS = 12000
+
+# Chunk summaries of one document requested at once
+PDF_SUMMARY_CONCURRENCY = int(os.getenv("PDF_SUMMARY_CONCURRENCY", "4"))
+
+SUMMARY_PROMPT = (
+    "You are a veterinary assistant AI. Summarize this medical document. "
+    "Extract key points like symptoms, diagnosis, treatments, medications, and vet advice. "
+    "Keep it concise and useful for a pet health timeline."
+)
+
+CHUNK_PROMPT = (
+    "You are a veterinary assistant AI. Summarize these pages of a longer medical document. "
+    "Extract key points like symptoms, diagnosis, test results, treatments, medications, dates, and vet advice. "
+    "Keep exact values and drug names; leave out anything that is not medically relevant."
+)
+
+REDUCE_PROMPT = (
+    "You are a veterinary assistant AI. These are summaries of consecutive sections of one medical document. "
+    "Combine them into a single summary covering the whole document: symptoms, diagnosis, test results, "
+    "treatments, medications, and vet advice. Merge repeated points and keep it concise and useful for a pet health timeline."
+)
+
+SUMMARY_ERROR = "Summary could not be generated due to OpenAI error."
+
+
+async def _complete(prompt_version, system_prompt, text):
+    """One GPT-4o summary of ``text``, unless the same request was answered before"""
+    # The system prompt is part of the key, so a chunk and a reduce over the same text are cached apart
+    key = cache_key("gpt-4o", prompt_version, text, 0.5, system_prompt=system_prompt)
+    summary = await llm_cache.aget(key)
+    if summary is not None:
+        return summary
+    response = await chat_completion(
+        model="gpt-4o",
+        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": text}],
+        temperature=0.5,
+    )
+    summary = response.choices[0].message.content.strip()
+    await llm_cache.aset(key, summary)
+    return summary
+
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def _pages(first, last):
+    return f"Page {first}" if first == last else f"Pages {first}-{last}"
 
 
-def extract_text_and_summarize(file_path, user_id, pet_id, file_name, file_url):
-    # Step 1: Extract PDF text
-    doc = fitz.open(file_path)
-    text = "\n".join([page.get_text() for page in doc])
-    doc.close()
+async def _map_chunks(chunks, semaphore):
+    """Summarize every chunk in parallel; returns ``(first_page, last_page, summary)``"""
 
-    # Step 2: Summarize using GPT-4o (new SDK style)
+    async def summarize_chunk(first, last, text):
+        async with semaphore:
+            return first, last, await _complete(PDF_PROMPT_VERSION, CHUNK_PROMPT, f"{_pages(first, last)}:\n{text}")
+
+    results = await asyncio.gather(*(summarize_chunk(*chunk) for chunk in chunks), return_exceptions=True)
+    partials = []
+    for (first, last, _), result in zip(chunks, results):
+        if isinstance(result, Exception):
+            print(f"OpenAI error on {_pages(first, last).lower()}:", result)
+            partials.append((first, last, "(this section could not be summarized)"))
+        else:
+            partials.append(result)
+    if all(isinstance(result, Exception) for result in results):
+        raise results[0]
+    return partials
+
+
+async def _reduce(partials, semaphore):
+    """Combine chunk summaries, in several rounds if they don't fit in one request"""
+    while True:
+        sections = [f"{_pages(first, last)}:\n{summary}" for first, last, summary in partials]
+        combined = "\n\n".join(sections)
+        groups = []
+        size = 0
+        for partial, section in zip(partials, sections):
+            if groups and size + len(section) + 2 <= PDF_CHUNK_CHARS:
+                groups[-1].append(partial)
+                size += len(section) + 2
+            else:
+                groups.append([partial])
+                size = len(section)
+        if len(combined) <= PDF_CHUNK_CHARS or len(partials) == 1:
+            # Fits in one request, or is down to a single (long) section
+            return await _complete(PDF_PROMPT_VERSION, REDUCE_PROMPT, combined)
+        if len(groups) == len(partials):
+            # No two summaries fit together; pair them anyway so every round halves the count
+            print(
+                f"{len(partials)} section summaries are each over half of {PDF_CHUNK_CHARS} characters; combining them in pairs"
+            )
+            groups = [partials[index : index + 2] for index in range(0, len(partials), 2)]
+
+        async def reduce_group(group):
+            async with semaphore:
+                text = "\n\n".join(f"{_pages(first, last)}:\n{summary}" for first, last, summary in group)
+                return group[0][0], group[-1][1], await _complete(PDF_PROMPT_VERSION, REDUCE_PROMPT, text)
+
+        partials = list(await asyncio.gather(*(reduce_group(group) for group in groups)))
+
+
+async def summarize_pdf(pdf) -> str:
+    """Summary of the whole document, however long
+
+    The page text is split into chunks of up to ``PDF_CHUNK_CHARS`` characters at
+    page boundaries. A document that fits in one chunk gets a single request.
+    Otherwise the chunks are summarized in parallel (map), and the partial
+    summaries are combined into the final summary (reduce).
+    """
+    # Step 1: Extract PDF text, off the event loop (large documents use the process pool)
+    pages = await asyncio.to_thread(extract_page_texts, pdf)
+    chunks = chunk_pages(pages, PDF_CHUNK_CHARS)
+
+    # Step 2: Summarize using GPT-4o (new SDK style); every request is cached
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a veterinary assistant AI. Summarize this medical document. "
-                        "Extract key points like symptoms, diagnosis, treatments, medications, and vet advice. "
-                        "Keep it concise and useful for a pet health timeline."
-                    ),
-                },
-                {"role": "user", "content": text[:12000]},
-            ],
-            temperature=0.5,
-        )
-        summary = response.choices[0].message.content.strip()
+        if len(chunks) <= 1:
+            return await _complete(PDF_PROMPT_VERSION, SUMMARY_PROMPT, chunks[0][2] if chunks else "")
+        semaphore = asyncio.Semaphore(PDF_SUMMARY_CONCURRENCY)
+        print(f"Summarizing {len(pages)}-page PDF in {len(chunks)} chunks")
+        partials = await _map_chunks(chunks, semaphore)
+        return await _reduce(partials, semaphore)
     except Exception as e:
         print("OpenAI error:", e)
-        summary = "Summary could not be generated due to OpenAI error."
+        return SUMMARY_ERROR
 
-    # Step 3: Store in Firestore
+
+async def store_summary(user_id, pet_id, summary, file_name, file_url, content_hash=None):
+    # Step 3: Store in Firestore; failed summaries aren't indexed, so uploading the file again retries them
     timestamp = datetime.utcnow().isoformat()
-    store_pdf_summary(user_id, pet_id, summary, timestamp, file_name, file_url)
+    if summary == SUMMARY_ERROR:
+        content_hash = None
+    return await run_db(store_pdf_summary, user_id, pet_id, summary, timestamp, file_name, file_url, content_hash)
+
 
+async def extract_text_and_summarize(pdf, user_id, pet_id, file_name, file_url):
+    summary = await summarize_pdf(pdf)
+    await store_summary(user_id, pet_id, summary, file_name, file_url)
     return {"summary": summary}
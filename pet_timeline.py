@@ -0,0 +1,536 @@
+"""
+Pet timeline shared by the dashboard endpoints and AI services.
+
+Analytics entries, voice notes, text inputs and medical records live in
+separate subcollections. Every ingest path also writes a pre-normalized copy
+to ``pets/{pet_id}/timeline``: category and source resolved, timestamp parsed
+to epoch seconds and numeric fields cast. Reads then run a single range query
+on ``timestamp_epoch`` instead of one query per collection plus per-document
+reshaping.
+
+Pets whose history predates the timeline fall back to querying the
+subcollections concurrently until they are backfilled, either in the
+background on first read or with:
+
+    python pet_timeline.py --pet_id <pet_id>
+    python pet_timeline.py --all
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from firebase_admin import firestore
+
+from firestore_store import db, invalidate_pet_profile
+from firestore_async import pet_collection, query_pet_collection, run_db, stream_documents
+from response_cache import bump_data_version
+
+# Collections merged into dashboard timelines
+DASHBOARD_COLLECTIONS = ("analytics", "voice-notes", "textinput")
+
+# Dashboard collections plus uploaded medical records, used for RAG context
+ALL_COLLECTIONS = DASHBOARD_COLLECTIONS + ("records",)
+
+# Categories that voice notes and text inputs can be mapped to
+NOTE_CATEGORIES = ("daily_activity", "medical_notes", "mixed_notes")
+
+TIMELINE_COLLECTION = "timeline"
+
+# Entry fields stored as numbers on the timeline when they parse as one
+NUMERIC_FIELDS = (
+    "duration",
+    "level",
+    "value",
+    "quantity",
+    "amount",
+    "weight",
+    "temperature",
+    "confidence",
+    "classification_confidence",
+)
+
+# Fields always read by projected queries, needed to group, order and page entries
+PROJECTION_FIELDS = ("id", "category", "source", "timestamp", "timestamp_epoch", "source_id", "source_collection")
+
+# Firestore batches accept at most 500 writes
+BATCH_WRITE_LIMIT = 500
+
+# Pets known to have a complete timeline in this process
+_timeline_ready_pets = set()
+
+# Background backfills started from the read path, keyed by pet id
+_backfill_tasks = {}
+
+
+def content_type_to_category(content_type: str) -> str:
+    """Map a note's AI classification to its dashboard category"""
+    if content_type == "DAILY_ACTIVITY":
+        return "daily_activity"
+    elif content_type == "MEDICAL":
+        return "medical_notes"
+    return "mixed_notes"
+
+
+def voice_note_to_entry(data: Dict) -> Dict:
+    """Convert a voice note document to analytics format"""
+    return {
+        "id": data.get("id"),
+        "category": "daily_activity",
+        "source": "voice_note",
+        "transcript": data.get("transcript", ""),
+        "summary": data.get("summary", ""),
+        "timestamp": data.get("timestamp", ""),
+        "notes": f"Voice recording: {data.get('summary', '')[:100]}...",
+    }
+
+
+def text_input_to_entry(data: Dict) -> Dict:
+    """Convert a text input document to analytics format"""
+    content_type = data.get("content_type", "DAILY_ACTIVITY")
+    return {
+        "id": data.get("id"),
+        "category": content_type_to_category(content_type),
+        "source": "text_input",
+        "input": data.get("input", ""),
+        "summary": data.get("summary", ""),
+        "content_type": content_type,
+        "timestamp": data.get("timestamp", ""),
+        "notes": f"Text note: {data.get('summary', '')[:100]}...",
+    }
+
+
+def record_to_entry(data: Dict) -> Dict:
+    """Convert a medical record document to analytics format"""
+    return {
+        "id": data.get("id"),
+        "category": "medical_records",
+        "source": "pdf_upload",
+        "summary": data.get("summary", ""),
+        "file_name": data.get("file_name", ""),
+        "file_url": data.get("file_url", ""),
+        "timestamp": data.get("timestamp", ""),
+    }
+
+
+def to_timeline_entry(collection: str, data: Dict) -> Dict:
+    """Normalize a document from any pet subcollection into a timeline entry"""
+    if collection == "voice-notes":
+        return voice_note_to_entry(data)
+    elif collection == "textinput":
+        return text_input_to_entry(data)
+    elif collection == "records":
+        return record_to_entry(data)
+    return data
+
+
+def parse_epoch(timestamp: Any) -> Optional[float]:
+    """Parse a stored timestamp to epoch seconds, treating naive values as UTC"""
+    if isinstance(timestamp, datetime):
+        parsed = timestamp
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(timestamp))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def normalize_timestamp(timestamp: Any) -> Optional[str]:
+    """Naive UTC ISO form of a timestamp, the form stored documents use; None when it can't be parsed
+
+    Stored timestamps are compared and sliced as strings (daily counts use the
+    first 10 characters), so offsets like ``+02:00`` must be converted first.
+    """
+    epoch = parse_epoch(timestamp)
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def _cast_number(value: Any) -> Any:
+    if isinstance(value, bool) or not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def build_timeline_document(collection: str, doc_id: str, data: Dict) -> Dict:
+    """Normalize a stored document into its ``timeline`` form"""
+    # Keep the raw fields too, so the timeline can stand in for the source document
+    entry = {**data, **to_timeline_entry(collection, {**data, "id": doc_id})}
+    entry.update({"id": doc_id, "source_id": doc_id, "source_collection": collection})
+    entry.setdefault("source", "manual_entry")
+    entry.setdefault("category", "unknown")
+    entry["timestamp_epoch"] = parse_epoch(entry.get("timestamp", ""))
+    for field in NUMERIC_FIELDS:
+        if field in entry:
+            entry[field] = _cast_number(entry[field])
+    return entry
+
+
+def _timeline_ref(pet_id: str, collection: str, doc_id: str):
+    # Keyed by source document so re-running a backfill is idempotent
+    return pet_collection(pet_id, TIMELINE_COLLECTION).document(f"{collection}_{doc_id}")
+
+
+@firestore.transactional
+def _write_entry(transaction, pet_id: str, collection: str, doc_id: str, entry: Dict):
+    from analytics_rollups import update_rollups
+
+    ref = _timeline_ref(pet_id, collection, doc_id)
+    snapshot = ref.get(transaction=transaction)
+    if collection in DASHBOARD_COLLECTIONS:
+        # A new entry is counted; one stored before (a retry, or a note that was enriched) is counted again in its place
+        update_rollups(transaction, pet_id, removed=[snapshot.to_dict()] if snapshot.exists else [], added=[entry])
+    transaction.set(ref, entry)
+    bump_data_version(pet_id, transaction)
+
+
+def record_ingest(pet_id: str, collection: str, doc_id: str, data: Dict) -> Dict:
+    """Mirror a stored document to the timeline, update summary rollups and bump the data version
+
+    Safe to call again for the same document, e.g. when it changes: the
+    timeline entry is replaced and the rollups count it once. The data version
+    is bumped in the same transaction, so a response cached under the new
+    version always includes the entry.
+    """
+    entry = build_timeline_document(collection, doc_id, data)
+    try:
+        _write_entry(db.transaction(), pet_id, collection, doc_id, entry)
+    except Exception as e:
+        # The timeline and rollups are derived data; never fail the write that triggered them
+        print(f"Error writing timeline entry for pet {pet_id}: {e}")
+    return entry
+
+
+@firestore.transactional
+def _write_chunk(transaction, pet_id: str, collection: str, rows: List[tuple]):
+    from analytics_rollups import update_rollups
+
+    if collection in DASHBOARD_COLLECTIONS:
+        update_rollups(transaction, pet_id, removed=[], added=[entry for _, _, entry in rows])
+    for ref, data, entry in rows:
+        transaction.set(ref, data)
+        transaction.set(_timeline_ref(pet_id, collection, ref.id), entry)
+    bump_data_version(pet_id, transaction)
+
+
+def _write_chunks(collection: str, rows: List[tuple]):
+    """Group rows so each transaction stays within the write limit
+
+    Every document is written twice (the source document and its timeline
+    entry), plus one rollup document per category in the chunk and the pet
+    document's data version.
+    """
+    chunk, categories = [], set()
+    for row in rows:
+        category = row[2].get("category", "unknown") if collection in DASHBOARD_COLLECTIONS else None
+        writes = 2 * (len(chunk) + 1) + len(categories | {category} - {None}) + 1
+        if chunk and writes > BATCH_WRITE_LIMIT:
+            yield chunk
+            chunk, categories = [], set()
+        chunk.append(row)
+        categories.add(category)
+    if chunk:
+        yield chunk
+
+
+def ingest_batch(pet_id: str, collection: str, documents: List[Dict]) -> List[Dict]:
+    """Store new documents with transactional writes, mirroring each to the timeline
+
+    A chunk of documents, their timeline entries and the rollup updates for
+    them commit or fail together, along with a bump of the data version.
+    Returns one result per document, in order:
+    ``{"status": "success", "id": ...}`` or ``{"status": "error", "message": ...}``.
+    """
+    rows = []
+    for data in documents:
+        ref = pet_collection(pet_id, collection).document()
+        rows.append((ref, data, build_timeline_document(collection, ref.id, data)))
+
+    results: List[Dict] = []
+    committed = 0
+    for chunk in _write_chunks(collection, rows):
+        try:
+            _write_chunk(db.transaction(), pet_id, collection, chunk)
+        except Exception as e:
+            print(f"Error committing batch of {len(chunk)} {collection} documents for pet {pet_id}: {e}")
+            results.extend({"status": "error", "message": str(e)} for _ in chunk)
+            continue
+        results.extend({"status": "success", "id": ref.id} for ref, _, _ in chunk)
+        committed += len(chunk)
+
+    print(f"Stored {committed}/{len(documents)} {collection} documents for pet {pet_id}")
+    return results
+
+
+def backfill_pet_timeline(pet_id: str) -> int:
+    """Copy a pet's existing subcollection documents to the timeline and mark it complete"""
+    written = 0
+    batch = db.batch()
+    pending = 0
+
+    for collection in ALL_COLLECTIONS:
+        for doc in pet_collection(pet_id, collection).stream():
+            batch.set(_timeline_ref(pet_id, collection, doc.id), build_timeline_document(collection, doc.id, doc.to_dict()))
+            pending += 1
+            written += 1
+            if pending == BATCH_WRITE_LIMIT:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+
+    if pending:
+        batch.commit()
+
+    db.collection("pets").document(pet_id).set({"timeline_ready": True}, merge=True)
+    invalidate_pet_profile(pet_id)
+    _timeline_ready_pets.add(pet_id)
+    print(f"Backfilled {written} timeline entries for pet {pet_id}")
+    return written
+
+
+def backfill_all_timelines():
+    """Backfill the timeline for every pet"""
+    count = 0
+    for pet_doc in db.collection("pets").stream():
+        backfill_pet_timeline(pet_doc.id)
+        count += 1
+    print(f"Backfilled timelines for {count} pets")
+
+
+def timeline_ready(pet_id: str) -> bool:
+    """Whether the pet's timeline holds its full history"""
+    return bool(_timeline_status(pet_id))
+
+
+def _timeline_status(pet_id: str) -> Optional[bool]:
+    """True when the pet's timeline is complete, False when it needs a backfill, None for unknown pets"""
+    if pet_id in _timeline_ready_pets:
+        return True
+    snapshot = db.collection("pets").document(pet_id).get()
+    if not snapshot.exists:
+        return None
+    if (snapshot.to_dict() or {}).get("timeline_ready"):
+        _timeline_ready_pets.add(pet_id)
+        return True
+    return False
+
+
+def _schedule_backfill(pet_id: str):
+    if pet_id in _backfill_tasks:
+        return
+    task = asyncio.get_running_loop().create_task(run_db(backfill_pet_timeline, pet_id))
+    _backfill_tasks[pet_id] = task
+    task.add_done_callback(lambda _: _backfill_tasks.pop(pet_id, None))
+
+
+def _collection_matches(collection: str, category: Optional[str]) -> bool:
+    """Whether a collection can contain entries of the requested category"""
+    if not category:
+        return True
+    if collection == "voice-notes":
+        return category == "daily_activity"
+    if collection == "textinput":
+        return category in NOTE_CATEGORIES
+    if collection == "records":
+        return category == "medical_records"
+    return True
+
+
+def _project(entry: Dict, fields: Optional[Iterable[str]]) -> Dict:
+    if not fields:
+        return entry
+    keep = set(fields) | set(PROJECTION_FIELDS)
+    return {key: value for key, value in entry.items() if key in keep}
+
+
+def server_timing_header(timings_ms: Dict[str, float]) -> str:
+    """Format per-source timings as a ``Server-Timing`` header value"""
+    return ", ".join(f"{source};dur={elapsed}" for source, elapsed in timings_ms.items())
+
+
+async def load_pet_timeline(
+    pet_id: str,
+    days: Optional[int] = 30,
+    category: str = None,
+    collections: Iterable[str] = DASHBOARD_COLLECTIONS,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[Iterable[str]] = None,
+) -> Dict[str, Any]:
+    """Load a pet's timeline entries from the given collections
+
+    Returns a dict with:
+    - ``entries``: merged entries in analytics format, filtered to ``category``
+    - ``documents``: the documents per source collection, tagged with their id
+    - ``timings_ms``: query time per source in milliseconds
+    - ``next_cursor``: opaque cursor for the next page, or None on the last one
+
+    ``days=None`` loads the full history. With ``limit`` entries come newest
+    first, one page at a time, continuing after ``cursor``. ``fields``
+    restricts entries to those fields plus ``PROJECTION_FIELDS``.
+
+    Raises ValueError for a non-positive limit or an unknown cursor.
+    """
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be a positive integer")
+    targets = [collection for collection in collections if _collection_matches(collection, category)]
+
+    status = await run_db(_timeline_status, pet_id)
+    if status:
+        return await _load_from_timeline(pet_id, days, category, targets, limit, cursor, fields)
+
+    # Not backfilled yet: serve from the subcollections and migrate in the background
+    if status is False:
+        _schedule_backfill(pet_id)
+    return await _load_from_collections(pet_id, days, category, targets, limit, cursor, fields)
+
+
+async def _load_from_timeline(
+    pet_id: str,
+    days: Optional[int],
+    category: Optional[str],
+    targets: List[str],
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: Optional[Iterable[str]],
+):
+    start = time.perf_counter()
+
+    timeline = pet_collection(pet_id, TIMELINE_COLLECTION)
+    query = timeline
+    if category:
+        query = query.where("category", "==", category)
+    if days is not None:
+        query = query.where("timestamp_epoch", ">=", time.time() - days * 86400)
+    if fields:
+        # Only the requested columns are read from Firestore and serialized
+        query = query.select(sorted((set(fields) | set(PROJECTION_FIELDS)) - {"id"}))
+
+    next_cursor = None
+    if limit:
+        query = query.order_by("timestamp_epoch", direction=firestore.Query.DESCENDING)
+        after = None
+        if cursor:
+            after = await run_db(timeline.document(cursor).get)
+            if not after.exists:
+                raise ValueError(f"Unknown cursor: {cursor}")
+        docs, next_cursor = await run_db(_read_page, query, after, limit, targets)
+    else:
+        docs = await stream_documents(query)
+
+    entries: List[Dict] = []
+    documents: Dict[str, List[Dict]] = {collection: [] for collection in targets}
+    for entry in docs:
+        # stream_documents tags each entry with the timeline doc id; expose the source id
+        entry["id"] = entry.get("source_id", entry["id"])
+        collection = entry.get("source_collection")
+        if collection in documents:
+            documents[collection].append(entry)
+            entries.append(entry)
+
+    timings_ms = {TIMELINE_COLLECTION: round((time.perf_counter() - start) * 1000, 1)}
+    print(f"Loaded {len(entries)} timeline entries for pet {pet_id} ({server_timing_header(timings_ms)})")
+    return {"entries": entries, "documents": documents, "timings_ms": timings_ms, "next_cursor": next_cursor}
+
+
+def _read_page(query, after, limit: int, targets: List[str]):
+    """Up to ``limit`` timeline entries from ``targets``, newest first, plus the cursor for the next page
+
+    The timeline also holds collections the caller didn't ask for (e.g.
+    ``records``), which are skipped, so pages are read until ``limit``
+    matching entries are found or the timeline runs out.
+    """
+    entries = []
+    while True:
+        snapshots = list((query.start_after(after) if after is not None else query).limit(limit).stream())
+        for snapshot in snapshots:
+            entry = snapshot.to_dict()
+            if entry.get("source_collection") not in targets:
+                continue
+            entries.append({**entry, "id": snapshot.id})
+            if len(entries) == limit:
+                return entries, snapshot.id
+        if len(snapshots) < limit:
+            return entries, None
+        after = snapshots[-1]
+
+
+async def _load_from_collections(
+    pet_id: str,
+    days: Optional[int],
+    category: Optional[str],
+    targets: List[str],
+    limit: Optional[int],
+    cursor: Optional[str],
+    fields: Optional[Iterable[str]],
+):
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat() if days is not None else None
+
+    async def _timed_query(collection: str):
+        start = time.perf_counter()
+        docs = await query_pet_collection(
+            pet_id, collection, since=since, category=category if collection == "analytics" else None
+        )
+        return collection, docs, round((time.perf_counter() - start) * 1000, 1)
+
+    results = await asyncio.gather(*(_timed_query(collection) for collection in targets))
+
+    # (timeline doc id, collection, source document, entry)
+    rows = []
+    timings_ms: Dict[str, float] = {}
+
+    for collection, docs, elapsed in results:
+        timings_ms[collection] = elapsed
+        for data in docs:
+            entry = to_timeline_entry(collection, data)
+            if category and entry.get("category") != category:
+                continue
+            rows.append((f"{collection}_{data['id']}", collection, data, entry))
+
+    next_cursor = None
+    if limit:
+        # Same ordering and cursor format as the timeline query, so paging survives the backfill
+        rows.sort(key=lambda row: parse_epoch(row[3].get("timestamp", "")) or 0, reverse=True)
+        if cursor:
+            row_ids = [row[0] for row in rows]
+            if cursor not in row_ids:
+                raise ValueError(f"Unknown cursor: {cursor}")
+            rows = rows[row_ids.index(cursor) + 1 :]
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+
+    entries: List[Dict] = []
+    documents: Dict[str, List[Dict]] = {collection: [] for collection in targets}
+    for _, collection, data, entry in rows:
+        documents[collection].append(data)
+        entries.append(_project(entry, fields))
+
+    print(f"Loaded {len(entries)} timeline entries for pet {pet_id} ({server_timing_header(timings_ms)})")
+    return {"entries": entries, "documents": documents, "timings_ms": timings_ms, "next_cursor": next_cursor}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the unified pet timeline from existing subcollections.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--pet_id", help="Backfill a single pet")
+    group.add_argument("--all", action="store_true", help="Backfill every pet")
+    args = parser.parse_args()
+
+    if args.all:
+        backfill_all_timelines()
+    else:
+        backfill_pet_timeline(args.pet_id)
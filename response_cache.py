@@ -0,0 +1,135 @@
+"""
+In-process cache for computed API responses, keyed by per-pet data versions.
+
+Every ingest path bumps the pet's data version (see ``pet_timeline.record_ingest``),
+so a cached response is valid for as long as its key's version is current and
+never needs explicit invalidation. Stale entries simply stop being requested
+and age out of the LRU.
+
+The version is a counter on the pet document (``pets/{pet_id}.data_version``),
+so writes from any process (other API workers, job workers, the CLIs) change
+it. Endpoints read it once per request and use it for both the cache key and
+the ETag.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional
+
+from firebase_admin import firestore
+
+# Memory bound for the visualization response cache
+VISUALIZATION_CACHE_MAX_BYTES = int(os.getenv("VISUALIZATION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+DATA_VERSION_FIELD = "data_version"
+
+
+def _pet_ref(pet_id: str):
+    from firestore_store import db
+
+    return db.collection("pets").document(pet_id)
+
+
+def get_data_version(pet_id: str) -> str:
+    """Current data version for a pet (one Firestore read)"""
+    snapshot = _pet_ref(pet_id).get([DATA_VERSION_FIELD])
+    return str((snapshot.to_dict() or {}).get(DATA_VERSION_FIELD, 0)) if snapshot.exists else "0"
+
+
+def bump_data_version(pet_id: str, transaction=None):
+    """Mark a pet's data as changed, invalidating everything cached under the old version
+
+    Pass ``transaction`` to bump it atomically with the writes that changed the data.
+    """
+    update = {DATA_VERSION_FIELD: firestore.Increment(1)}
+    if transaction is not None:
+        transaction.set(_pet_ref(pet_id), update, merge=True)
+    else:
+        _pet_ref(pet_id).set(update, merge=True)
+
+
+def make_etag(pet_id: str, data_version: str, *params: Any) -> str:
+    """Weak ETag for a pet response, from its data version, today's date and the request parameters
+
+    The date is included because windowed responses ("last 30 days") change
+    from one day to the next even when no data was written. The tag is weak
+    because it identifies the data, not the bytes: the same response is sent
+    as brotli, gzip or uncompressed depending on Accept-Encoding.
+    """
+    key = repr((pet_id, data_version, datetime.utcnow().strftime("%Y-%m-%d"), params))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison, as RFC 9110 specifies for it)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or opaque in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory cost of a JSON-serializable value, in bytes"""
+    return len(json.dumps(value, default=str))
+
+
+class ResponseCache:
+    """LRU cache of response bodies bounded by their approximate size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def set(self, key: Hashable, value: Any, size: int = None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Larger than the whole cache: not worth evicting everything for
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+visualization_cache = ResponseCache(VISUALIZATION_CACHE_MAX_BYTES)
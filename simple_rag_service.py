@@ -5,18 +5,23 @@ Uses basic similarity without heavy ML dependencies to avoid NumPy conflicts
 
 import os
 import json
-import openai
 import requests
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 import re
 import math
 from collections import Counter
 
+from openai_pool import chat_completion, stream_chat_completion
+
+GPT_ERROR_RESPONSE = (
+    "I'm having trouble generating a response right now. Please try again or consult your veterinarian for immediate concerns."
+)
+
 print("Starting import of simple_rag_service dependencies...")
 
 try:
-    from firestore_store import db, get_pet_by_id
+    from firestore_async import get_pet
+    from pet_timeline import ALL_COLLECTIONS, load_pet_timeline
 
     print("firestore_store imported successfully")
 except Exception as e:
@@ -31,10 +36,6 @@ try:
 
         def __init__(self):
             print("Initializing SimplePetHealthRAGService...")
-            # OpenAI client
-            openai.api_key = os.getenv("OPENAI_API_KEY")
-            self.client = openai.OpenAI()
-
             # API keys for breed information
             self.dog_api_key = os.getenv("DOG_API_KEY")
             self.cat_api_key = os.getenv("CAT_API_KEY")
@@ -166,16 +167,14 @@ try:
         async def get_pet_data_for_rag(self, pet_id: str, days: int = 30) -> List[Dict]:
             """Retrieve pet data for RAG context"""
             documents = []
-            cutoff_date = (datetime.utcnow() - timedelta(days=days)).isoformat()
 
             try:
-                # Voice notes
-                voice_query = (
-                    db.collection("pets").document(pet_id).collection("voice-notes").where("timestamp", ">=", cutoff_date)
-                )
+                # Query all four collections concurrently
+                timeline = await load_pet_timeline(pet_id, days=days, collections=ALL_COLLECTIONS)
+                pet_documents = timeline["documents"]
 
-                for doc in voice_query.stream():
-                    data = doc.to_dict()
+                # Voice notes
+                for data in pet_documents["voice-notes"]:
                     content = f"Voice note: {data.get('transcript', '')} Summary: {data.get('summary', '')}"
 
                     documents.append(
@@ -184,17 +183,12 @@ try:
                             "type": "voice_note",
                             "timestamp": data.get("timestamp"),
                             "summary": data.get("summary"),
-                            "source_id": doc.id,
+                            "source_id": data["id"],
                         }
                     )
 
                 # Text input
-                text_query = (
-                    db.collection("pets").document(pet_id).collection("textinput").where("timestamp", ">=", cutoff_date)
-                )
-
-                for doc in text_query.stream():
-                    data = doc.to_dict()
+                for data in pet_documents["textinput"]:
                     content = f"Text input: {data.get('input', '')} Summary: {data.get('summary', '')}"
 
                     documents.append(
@@ -204,17 +198,12 @@ try:
                             "timestamp": data.get("timestamp"),
                             "summary": data.get("summary"),
                             "content_type": data.get("content_type"),
-                            "source_id": doc.id,
+                            "source_id": data["id"],
                         }
                     )
 
                 # Medical records (PDFs)
-                records_query = (
-                    db.collection("pets").document(pet_id).collection("records").where("timestamp", ">=", cutoff_date)
-                )
-
-                for doc in records_query.stream():
-                    data = doc.to_dict()
+                for data in pet_documents["records"]:
                     content = f"Medical record: {data.get('summary', '')}"
 
                     documents.append(
@@ -224,17 +213,12 @@ try:
                             "timestamp": data.get("timestamp"),
                             "summary": data.get("summary"),
                             "file_name": data.get("file_name"),
-                            "source_id": doc.id,
+                            "source_id": data["id"],
                         }
                     )
 
                 # Analytics data
-                analytics_query = (
-                    db.collection("pets").document(pet_id).collection("analytics").where("timestamp", ">=", cutoff_date)
-                )
-
-                for doc in analytics_query.stream():
-                    data = doc.to_dict()
+                for data in pet_documents["analytics"]:
 
                     # Build comprehensive content from analytics data
                     category = data.get('category', 'unknown')
@@ -287,7 +271,7 @@ try:
                             "category": data.get("category"),
                             "timestamp": data.get("timestamp"),
                             "notes": data.get("notes"),
-                            "source_id": doc.id,
+                            "source_id": data["id"],
                         }
                     )
 
@@ -340,15 +324,21 @@ try:
             results.sort(key=lambda x: x["score"], reverse=True)
             return results[:top_k]
 
-        async def generate_rag_response(self, pet_id: str, query: str, include_context: bool = True) -> Dict[str, Any]:
-            """Generate RAG-enhanced response for pet health query"""
+        async def generate_rag_response(
+            self, pet_id: str, query: str, include_context: bool = True, generate: bool = True
+        ) -> Dict[str, Any]:
+            """Generate RAG-enhanced response for pet health query
+
+            With ``generate=False`` only the context is retrieved: ``response`` is None and
+            the caller generates (or streams) the answer from ``context`` and ``pet_data``.
+            """
             try:
                 context_documents = []
                 knowledge_results = []
                 breed_info = {}
 
                 # Get pet information for breed-specific context
-                pet_data = get_pet_by_id(pet_id)
+                pet_data = await get_pet(pet_id)
                 if pet_data and pet_data.get("breed") and pet_data.get("animal_type"):
                     breed_info = await self.get_breed_information(pet_data.get("breed"), pet_data.get("animal_type"))
 
@@ -396,7 +386,7 @@ try:
 
                 # Always generate an intelligent response, even without pet data
                 context_text = self._prepare_context(context_documents)
-                response = await self._generate_gpt_response(query, context_text, pet_id, pet_data)
+                response = await self._generate_gpt_response(query, context_text, pet_id, pet_data) if generate else None
 
                 # Prepare sources
                 sources = [
@@ -416,6 +406,8 @@ try:
                 return {
                     "response": response,
                     "sources": sources,
+                    "context": context_text,
+                    "pet_data": pet_data,
                     "context_used": len(context_documents) > 0,
                     "breed_info_used": bool(breed_info),
                 }
@@ -430,9 +422,9 @@ try:
                 }
 
         async def generate_rag_response_with_cache(
-            self, pet_id: str, query: str, cached_data: Dict, include_context: bool = True
+            self, pet_id: str, query: str, cached_data: Dict, include_context: bool = True, generate: bool = True
         ) -> Dict[str, Any]:
-            """Generate RAG-enhanced response using cached pet data (faster)"""
+            """Generate RAG-enhanced response using cached pet data (faster); see generate_rag_response for ``generate``"""
             try:
                 context_documents = []
                 knowledge_results = []
@@ -473,7 +465,7 @@ try:
 
                 # Prepare context and generate response
                 context = self._prepare_context(context_documents)
-                response = await self._generate_gpt_response(query, context, pet_id, pet_data)
+                response = await self._generate_gpt_response(query, context, pet_id, pet_data) if generate else None
 
                 # Extract sources
                 sources = [
@@ -493,6 +485,8 @@ try:
                 return {
                     "response": response,
                     "sources": sources,
+                    "context": context,
+                    "pet_data": pet_data,
                     "context_used": len(context_documents) > 0,
                     "cached_data_used": True,
                     "breed_info_used": bool(breed_info),
@@ -501,7 +495,7 @@ try:
             except Exception as e:
                 print(f"Error in cached RAG response: {e}")
                 # Fallback to standard RAG if cache fails
-                return await self.generate_rag_response(pet_id, query, include_context)
+                return await self.generate_rag_response(pet_id, query, include_context, generate)
 
         def _prepare_cached_pet_documents(self, cached_data: Dict) -> List[Dict]:
             """Convert cached data into searchable documents"""
@@ -604,8 +598,8 @@ try:
 
             return "\n\n".join(context_parts)
 
-        async def _generate_gpt_response(self, query: str, context: str, pet_id: str, pet_data: Dict[str, Any] = None) -> str:
-            """Generate response using GPT with RAG context"""
+        def _build_system_prompt(self, context: str, pet_id: str, pet_data: Dict[str, Any] = None) -> str:
+            """System prompt for answering with RAG context"""
 
             # Build pet information for context
             pet_info = ""
@@ -657,9 +651,14 @@ Context from Pet's Health Data, Veterinary Knowledge, and Breed Information:
 {context}
 
 Remember: You are not replacing veterinary care but providing informed insights based on the pet's data, breed characteristics, and veterinary knowledge."""
+            return system_prompt
+
+        async def _generate_gpt_response(self, query: str, context: str, pet_id: str, pet_data: Dict[str, Any] = None) -> str:
+            """Generate response using GPT with RAG context"""
+            system_prompt = self._build_system_prompt(context, pet_id, pet_data)
 
             try:
-                response = self.client.chat.completions.create(
+                response = await chat_completion(
                     model="gpt-4",
                     messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
                     temperature=0.3,
@@ -670,7 +669,30 @@ Remember: You are not replacing veterinary care but providing informed insights
 
             except Exception as e:
                 print(f"Error generating GPT response: {e}")
-                return "I'm having trouble generating a response right now. Please try again or consult your veterinarian for immediate concerns."
+                return GPT_ERROR_RESPONSE
+
+        async def stream_gpt_response(
+            self, query: str, context: str, pet_id: str, pet_data: Dict[str, Any] = None
+        ) -> AsyncIterator[str]:
+            """Like _generate_gpt_response, but yields the answer's text as it is generated"""
+            system_prompt = self._build_system_prompt(context, pet_id, pet_data)
+            streamed = False
+            try:
+                async for chunk in stream_chat_completion(
+                    model="gpt-4",
+                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
+                    temperature=0.3,
+                    max_tokens=800,
+                ):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        streamed = True
+                        yield chunk.choices[0].delta.content
+
+            except Exception as e:
+                print(f"Error streaming GPT response: {e}")
+                # Text already sent can't be taken back; only answer with the apology if nothing was
+                if not streamed:
+                    yield GPT_ERROR_RESPONSE
 
         def _get_breed_health_info(self, breed_name: str, animal_type: str) -> str:
             """Get breed-specific health considerations (can be expanded with more detailed info)"""
@@ -1,25 +1,19 @@
 # summarize_openai.py
-import os
-from openai import OpenAI
+import json
 from dotenv import load_dotenv
-import time
+from llm_cache import cache_key, llm_cache
+from openai_pool import chat_completion_sync
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Part of the LLM cache key; bump when the matching prompt changes so old results stop being served
+NOTE_ANALYSIS_PROMPT_VERSION = "note-analysis-v1"
+PDF_SUMMARY_PROMPT_VERSION = "pdf-summary-v1"
 
-def summarize_text(text, max_retries=3):
-    """
-    Summarize text using OpenAI GPT-4o with intelligent context detection
-    Handles MEDICAL concerns, DAILY ACTIVITIES, and MIXED content
-    """
-    if not text or len(text.strip()) == 0:
-        return "No content to summarize"
-
-    # Enhanced system prompt for comprehensive pet care tracking
-    system_prompt = """You are an intelligent pet care assistant AI that analyzes ALL aspects of pet life - both medical concerns and daily activities.
+# One prompt for both the summary and the classification, so each note costs a single call
+NOTE_ANALYSIS_PROMPT = """You are an intelligent pet care assistant AI that analyzes ALL aspects of pet life - both medical concerns and daily activities.
 
-    Your task is to summarize pet-related voice notes or text input with intelligent context detection and appropriate tone.
+    For each pet voice note or text input, write a summary with intelligent context detection and appropriate tone, and classify the content.
     
     **For MEDICAL content, focus on:**
     - Key symptoms or health observations
@@ -47,54 +41,132 @@ def summarize_text(text, max_retries=3):
     - Prioritize any health concerns while acknowledging positive activities
     - Note correlations between activities and health/mood
     
-    **Output Guidelines:**
+    **Summary Guidelines:**
     - **Tone**: Use encouraging, positive tone for daily activities; professional, caring tone for medical concerns
     - **Length**: 2-4 sentences, concise but informative
     - **Actionability**: Include relevant timestamps, frequencies, or next steps when mentioned
-    - **Categories**: Identify primary content type (MEDICAL, DAILY_ACTIVITY, or MIXED)
     - **Insights**: Add helpful observations about patterns or behaviors
     
-    **Examples:**
+    **Summary Examples:**
     - **Medical**: "Pet showing limping behavior on left hind leg since morning. Recommend veterinary evaluation for potential injury. Monitor for worsening symptoms."
     - **Daily**: "Had an energetic 30-minute walk at Central Park today! Showed great social skills with other dogs and maintained excellent leash behavior. Very happy and well-exercised."
     - **Mixed**: "Normal eating and enthusiastic play session in the yard, but owner noticed slight coughing during activity. Monitor respiratory symptoms and consider limiting strenuous exercise until assessed."
-    - **Training**: "Successfully learned 'sit' and 'stay' commands during today's 15-minute training session. Responds well to positive reinforcement with treats. Ready to progress to more complex commands."
-    - **Routine**: "Perfect morning routine: ate breakfast enthusiastically, enjoyed 20-minute walk, now relaxing in favorite sunny spot. Energy level appears normal and mood is content."
     
-    Always provide helpful, accurate summaries that celebrate positive moments while taking health concerns seriously."""
+    **Classification:**
+    - **MEDICAL**: Health concerns, symptoms, injuries, veterinary visits, medications, illness, pain, behavioral changes indicating health issues, appetite loss, lethargy due to illness, emergency situations
+    - **DAILY_ACTIVITY**: Normal daily life including exercise, regular meals, play, sleep, grooming, training, social interactions, routine behaviors, energy levels, mood changes due to activities, environmental enrichment, achievements, fun experiences
+    - **MIXED**: Contains both medical concerns AND daily activities, or daily activities with health implications
+    
+    **Classification Guidelines:**
+    - Prioritize MEDICAL if any health concerns are mentioned
+    - Choose DAILY_ACTIVITY for normal, healthy pet behaviors and activities
+    - Use MIXED when health and activities are both significantly present
+    - Consider context: "tired after play" = DAILY_ACTIVITY, "lethargic without cause" = MEDICAL
+    
+    Always provide helpful, accurate summaries that celebrate positive moments while taking health concerns seriously.
+    
+    Respond in JSON format:
+    {
+        "summary": "2-4 sentence summary of the note",
+        "classification": "MEDICAL" | "DAILY_ACTIVITY" | "MIXED",
+        "confidence": 0.0-1.0,
+        "keywords": ["key", "words", "found"],
+        "reasoning": "brief explanation of classification decision",
+        "primary_activities": ["main activities or concerns mentioned"]
+    }"""
+
+# Fields of analyze_pet_note's result returned by classify_pet_content
+CLASSIFICATION_FIELDS = ("classification", "confidence", "keywords", "reasoning", "primary_activities")
+
+
+def analyze_pet_note(text, max_retries=3, strict=False):
+    """
+    Summarize and classify a pet note with one GPT-4o JSON-mode call
+    Returns summary, classification (MEDICAL, DAILY_ACTIVITY or MIXED), confidence,
+    keywords, reasoning and primary_activities
+    With ``strict``, an API error is raised instead of returning the fallback analysis,
+    so a background job can retry the note rather than store a guessed classification
+    """
+    if not text or len(text.strip()) == 0:
+        return {
+            "summary": "No content to summarize",
+            "classification": "UNKNOWN",
+            "confidence": 0.0,
+            "keywords": [],
+            "reasoning": "Empty input",
+            "primary_activities": [],
+        }
+
+    note_text = text[:4000]
+    key = cache_key("gpt-4o", NOTE_ANALYSIS_PROMPT_VERSION, note_text, 0.2, max_tokens=400)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        print("Note analysis served from cache")
+        return dict(cached)
+
+    try:
+        # Retries with backoff happen in openai_pool, paced by the shared rate limits
+        response = chat_completion_sync(
+            max_attempts=max_retries,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": NOTE_ANALYSIS_PROMPT},
+                {"role": "user", "content": f"Please analyze, summarize and classify this pet note:\n\n{note_text}"},
+            ],
+            temperature=0.2,
+            max_tokens=400,
+            response_format={"type": "json_object"},  # Force JSON response format
+        )
+
+        response_content = response.choices[0].message.content.strip()
+        print(f"🔍 Raw note analysis response: {response_content[:100]}...")
 
-    for attempt in range(max_retries):
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": f"Please analyze and summarize this pet note. Determine if it's medical, daily activity, or mixed content:\n\n{text[:4000]}",
-                    },
-                ],
-                temperature=0.3,
-                max_tokens=200,
-            )
-
-            summary = response.choices[0].message.content.strip()
-            print(f"Summary generated: {summary[:100]}...")
-            return summary
-
-        except Exception as e:
-            print(f"OpenAI API error (attempt {attempt + 1}/{max_retries}): {e}")
-
-            if attempt < max_retries - 1:
-                # Exponential backoff
-                wait_time = 2**attempt
-                print(f"⏳ Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                # Final fallback
-                return f"Unable to generate AI summary due to API error. Original text: {text[:200]}..."
-
-    return "Summary generation failed after multiple attempts."
+            result = json.loads(response_content)
+        except json.JSONDecodeError:
+            # Fallback: keep the text as the summary and classify it by keywords
+            print("⚠️ JSON parsing failed, attempting text extraction...")
+            result = {"summary": response_content, **extract_classification_from_text(response_content, text)}
+
+        # Validate required fields
+        if not result.get("summary"):
+            result["summary"] = "Summary generation failed."
+        if not result.get("classification"):
+            result["classification"] = "MIXED"
+        if not isinstance(result.get("confidence"), (int, float)):
+            result["confidence"] = 0.5
+        if not result.get("keywords"):
+            result["keywords"] = []
+        if not result.get("reasoning"):
+            result["reasoning"] = "Classification completed"
+        if not result.get("primary_activities"):
+            result["primary_activities"] = []
+
+        print(f"Summary generated: {result['summary'][:100]}...")
+        print(f"📊 Content classified as: {result['classification']} (confidence: {result['confidence']})")
+        # Callers may modify the result; the cache keeps its own copy
+        llm_cache.set(key, dict(result))
+        return result
+
+    except Exception as e:
+        print(f"OpenAI API error after {max_retries} attempts: {e}")
+        if strict:
+            raise
+
+    # Final fallback
+    print("🔄 Using fallback classification...")
+    return {
+        "summary": f"Unable to generate AI summary due to API error. Original text: {text[:200]}...",
+        **fallback_classification(text),
+    }
+
+
+def summarize_text(text, max_retries=3):
+    """
+    Summarize a pet note (MEDICAL, DAILY_ACTIVITY or MIXED content)
+    Callers that also need the classification should use analyze_pet_note directly
+    """
+    return analyze_pet_note(text, max_retries)["summary"]
 
 
 def summarize_pdf_text(pdf_text, max_retries=3):
@@ -127,136 +199,47 @@ def summarize_pdf_text(pdf_text, max_retries=3):
     
     Keep it comprehensive but readable for pet owners."""
 
-    for attempt in range(max_retries):
-        try:
-            # Truncate very long PDF text to prevent token limits
-            truncated_text = pdf_text[:12000] if len(pdf_text) > 12000 else pdf_text
-
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user",
-                        "content": f"Please analyze and summarize this veterinary medical document:\n\n{truncated_text}",
-                    },
-                ],
-                temperature=0.2,
-                max_tokens=500,
-            )
-
-            summary = response.choices[0].message.content.strip()
-            print(f"PDF Summary generated: {summary[:100]}...")
-            return summary
-
-        except Exception as e:
-            print(f"OpenAI API error for PDF (attempt {attempt + 1}/{max_retries}): {e}")
-
-            if attempt < max_retries - 1:
-                wait_time = 2**attempt
-                print(f"⏳ Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                return f"Unable to generate AI summary for PDF due to API error. Document contains medical information that should be reviewed manually."
-
-    return "PDF summary generation failed after multiple attempts."
+    # Truncate very long PDF text to prevent token limits
+    truncated_text = pdf_text[:12000] if len(pdf_text) > 12000 else pdf_text
+    key = cache_key("gpt-4o", PDF_SUMMARY_PROMPT_VERSION, truncated_text, 0.2, max_tokens=500)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        print("PDF summary served from cache")
+        return cached
+
+    try:
+        response = chat_completion_sync(
+            max_attempts=max_retries,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": f"Please analyze and summarize this veterinary medical document:\n\n{truncated_text}",
+                },
+            ],
+            temperature=0.2,
+            max_tokens=500,
+        )
+
+        summary = response.choices[0].message.content.strip()
+        print(f"PDF Summary generated: {summary[:100]}...")
+        llm_cache.set(key, summary)
+        return summary
+
+    except Exception as e:
+        print(f"OpenAI API error for PDF after {max_retries} attempts: {e}")
+        return "Unable to generate AI summary for PDF due to API error. Document contains medical information that should be reviewed manually."
 
 
 def classify_pet_content(text, max_retries=3):
     """
     Classify pet content as MEDICAL, DAILY_ACTIVITY, or MIXED
     Returns classification and confidence score
+    Callers that also need the summary should use analyze_pet_note directly
     """
-    if not text or len(text.strip()) == 0:
-        return {
-            "classification": "UNKNOWN",
-            "confidence": 0.0,
-            "keywords": [],
-            "reasoning": "Empty input",
-            "primary_activities": [],
-        }
-
-    classification_prompt = """You are a comprehensive pet content classifier. Analyze the following text and classify it accurately:
-
-    **MEDICAL**: Health concerns, symptoms, injuries, veterinary visits, medications, illness, pain, behavioral changes indicating health issues, appetite loss, lethargy due to illness, emergency situations
-
-    **DAILY_ACTIVITY**: Normal daily life including exercise, regular meals, play, sleep, grooming, training, social interactions, routine behaviors, energy levels, mood changes due to activities, environmental enrichment, achievements, fun experiences
-
-    **MIXED**: Contains both medical concerns AND daily activities, or daily activities with health implications
-
-    **Classification Guidelines:**
-    - Prioritize MEDICAL if any health concerns are mentioned
-    - Choose DAILY_ACTIVITY for normal, healthy pet behaviors and activities
-    - Use MIXED when health and activities are both significantly present
-    - Consider context: "tired after play" = DAILY_ACTIVITY, "lethargic without cause" = MEDICAL
-    
-    **Keywords to help classify:**
-    - Medical: symptoms, vet, medication, pain, injury, sick, illness, emergency, limping, vomiting, diarrhea, loss of appetite, concerning behavior
-    - Daily: walk, play, eat/meal, sleep, training, grooming, bath, park, exercise, happy, energetic, social, learn, achieve, routine, fun
-    
-    Respond in JSON format:
-    {
-        "classification": "MEDICAL" | "DAILY_ACTIVITY" | "MIXED",
-        "confidence": 0.0-1.0,
-        "keywords": ["key", "words", "found"],
-        "reasoning": "brief explanation of classification decision",
-        "primary_activities": ["main activities or concerns mentioned"]
-    }"""
-
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": classification_prompt},
-                    {"role": "user", "content": f"Classify this pet content:\n\n{text[:2000]}"},
-                ],
-                temperature=0.1,  # Lower temperature for more consistent JSON output
-                max_tokens=200,  # Increased token limit
-                response_format={"type": "json_object"},  # Force JSON response format
-            )
-
-            import json
-
-            response_content = response.choices[0].message.content.strip()
-            print(f"🔍 Raw classification response: {response_content[:100]}...")
-
-            # Try to parse JSON
-            try:
-                result = json.loads(response_content)
-            except json.JSONDecodeError:
-                # Fallback: try to extract classification from text
-                print("⚠️ JSON parsing failed, attempting text extraction...")
-                result = extract_classification_from_text(response_content, text)
-
-            # Validate required fields
-            if not result.get("classification"):
-                result["classification"] = "MIXED"
-            if not isinstance(result.get("confidence"), (int, float)):
-                result["confidence"] = 0.5
-            if not result.get("keywords"):
-                result["keywords"] = []
-            if not result.get("reasoning"):
-                result["reasoning"] = "Classification completed"
-            if not result.get("primary_activities"):
-                result["primary_activities"] = []
-
-            print(
-                f"📊 Content classified as: {result.get('classification', 'UNKNOWN')} (confidence: {result.get('confidence', 0.0)})"
-            )
-            return result
-
-        except Exception as e:
-            print(f"Classification error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                wait_time = 2**attempt
-                print(f"⏳ Retrying classification in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print("🔄 Using fallback classification...")
-                return fallback_classification(text)
-
-    return fallback_classification(text)
+    analysis = analyze_pet_note(text, max_retries)
+    return {field: analysis[field] for field in CLASSIFICATION_FIELDS}
 
 
 def extract_classification_from_text(response_text, original_text):
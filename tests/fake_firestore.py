@@ -0,0 +1,306 @@
+"""
+In-memory stand-in for the Firestore client, for tests of the write and read paths.
+
+Covers what the app uses: documents and subcollections, ``where`` / ``order_by`` /
+``limit`` / ``start_after`` / ``select`` queries, batches, the ``Increment``,
+``ArrayUnion`` and ``ArrayRemove`` transforms, and transactions. Transactions are optimistic, like
+the real service from a client's point of view: a transaction whose reads
+(documents or query results) changed before it commits is retried.
+
+``install()`` must run before ``firestore_store`` is imported, so that module
+picks up the fake client instead of loading credentials.
+"""
+
+import copy
+import uuid
+
+from google.cloud.firestore_v1 import transforms
+
+# Attempts per transaction before it gives up, as in the client library
+MAX_TRANSACTION_ATTEMPTS = 5
+
+
+class TransactionConflict(Exception):
+    pass
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+def _apply_write(existing, data, merge):
+    result = copy.deepcopy(existing or {}) if merge else {}
+    for key, value in data.items():
+        if "." in key:
+            head, rest = key.split(".", 1)
+            result[head] = _apply_write(result.get(head) or {}, {rest: value}, True)
+        elif isinstance(value, transforms.Increment):
+            result[key] = (result.get(key) or 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            result[key] = list(result.get(key) or []) + [item for item in value.values if item not in (result.get(key) or [])]
+        elif isinstance(value, transforms.ArrayRemove):
+            result[key] = [item for item in result.get(key) or [] if item not in value.values]
+        elif merge and isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = _apply_write(result[key], value, True)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+_OPERATORS = {
+    "==": lambda value, operand: value == operand,
+    "<": lambda value, operand: value is not None and value < operand,
+    "<=": lambda value, operand: value is not None and value <= operand,
+    ">": lambda value, operand: value is not None and value > operand,
+    ">=": lambda value, operand: value is not None and value >= operand,
+    "in": lambda value, operand: value in operand,
+}
+
+
+class FakeQuery:
+    def __init__(self, client, path, filters=(), orders=(), limit=None, after=None, fields=None):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._after = after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "after": self._after,
+            "fields": self._fields,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._path, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def stream(self, transaction=None):
+        if transaction is not None:
+            transaction._read_collection(self._path)
+        rows = [
+            (path, data)
+            for path, data in self._client.collection_documents(self._path)
+            if all(_OPERATORS[op](data.get(field), operand) for field, op, operand in self._filters)
+        ]
+        if any(field != "__name__" for field, _ in self._orders):
+            # Firestore leaves out documents without the ordered field
+            rows = [row for row in rows if all(row[1].get(field) is not None for field, _ in self._orders)]
+        for field, direction in reversed(self._orders):
+            rows.sort(key=lambda row: row[1].get(field), reverse=direction == "DESCENDING")
+        if self._after is not None:
+            paths = [path for path, _ in rows]
+            rows = rows[paths.index(self._after.reference.path) + 1 :]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        for path, data in rows:
+            if self._fields is not None:
+                data = {key: value for key, value in data.items() if key in self._fields}
+            yield FakeSnapshot(FakeDocumentReference(self._client, path), copy.deepcopy(data))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.split("/")[-1]
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, f"{self._path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.split("/")[-1]
+
+    def collection(self, name):
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            transaction._read_document(self.path)
+        return FakeSnapshot(self, copy.deepcopy(self._client.documents.get(self.path)))
+
+    def set(self, data, merge=False):
+        self._client.write(self.path, data, merge)
+
+    def update(self, data):
+        if self.path not in self._client.documents:
+            raise KeyError(f"No document to update: {self.path}")
+        self._client.write(self.path, data, True)
+
+    def delete(self):
+        self._client.delete(self.path)
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(lambda: self._client.write(ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._writes.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._writes.append(lambda: self._client.delete(ref.path))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can hold at most 500 writes")
+        self._client.commits += 1
+        for write in self._writes:
+            write()
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    def __init__(self, client):
+        super().__init__(client)
+        self._document_versions = {}
+        self._collection_versions = {}
+
+    def _read_document(self, path):
+        if self._writes:
+            raise ValueError("Transactions must read before they write")
+        self._document_versions.setdefault(path, self._client.versions.get(path, 0))
+
+    def _read_collection(self, path):
+        if self._writes:
+            raise ValueError("Transactions must read before they write")
+        self._collection_versions.setdefault(path, self._client.collection_version(path))
+
+    def commit(self):
+        changed = [path for path, version in self._document_versions.items() if self._client.versions.get(path, 0) != version]
+        changed += [
+            path for path, version in self._collection_versions.items() if self._client.collection_version(path) != version
+        ]
+        if changed:
+            raise TransactionConflict(f"Read data changed before commit: {changed}")
+        super().commit()
+
+
+def transactional(fn):
+    """Stand-in for ``firestore.transactional``: retries the function when its reads changed"""
+
+    def run(transaction, *args, **kwargs):
+        for attempt in range(MAX_TRANSACTION_ATTEMPTS):
+            attempt_transaction = transaction if attempt == 0 else FakeTransaction(transaction._client)
+            result = fn(attempt_transaction, *args, **kwargs)
+            try:
+                attempt_transaction.commit()
+                return result
+            except TransactionConflict:
+                attempt_transaction._client.transaction_retries += 1
+        raise TransactionConflict(f"Transaction failed after {MAX_TRANSACTION_ATTEMPTS} attempts")
+
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.documents = {}
+        # Bumped on every write, per document path, so transactions can detect changes
+        self.versions = {}
+        self.commits = 0
+        self.transaction_retries = 0
+
+    def collection(self, name):
+        return FakeCollectionReference(self, name)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        for ref in refs:
+            yield ref.get()
+
+    def write(self, path, data, merge):
+        self.documents[path] = _apply_write(self.documents.get(path), data, merge)
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def delete(self, path):
+        self.documents.pop(path, None)
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def collection_documents(self, path):
+        prefix = path + "/"
+        return [
+            (doc_path, data)
+            for doc_path, data in sorted(self.documents.items())
+            if doc_path.startswith(prefix) and "/" not in doc_path[len(prefix) :]
+        ]
+
+    def collection_version(self, path):
+        prefix = path + "/"
+        return tuple(
+            sorted(
+                (doc_path, version)
+                for doc_path, version in self.versions.items()
+                if doc_path.startswith(prefix) and "/" not in doc_path[len(prefix) :]
+            )
+        )
+
+
+fake_db = FakeFirestore()
+
+
+def install():
+    """Point ``firebase_admin.firestore`` at the fake client; returns it"""
+    import firebase_admin
+    from firebase_admin import firestore
+
+    if not firebase_admin._apps:
+        # firestore_store only loads credentials when no app is initialized
+        firebase_admin._apps["[DEFAULT]"] = object()
+    firestore.client = lambda *args, **kwargs: fake_db
+    firestore.transactional = transactional
+    return fake_db
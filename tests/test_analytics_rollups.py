@@ -0,0 +1,113 @@
+"""
+Tests for summary rollups, the timeline they are built from, and batched ingest.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import analytics_rollups
+import pet_timeline
+from analytics_rollups import load_rollups, rebuild_pet_rollups
+from pet_timeline import ingest_batch, record_ingest
+
+
+@pytest.fixture(autouse=True)
+def empty_database(monkeypatch):
+    fake_db.reset()
+    monkeypatch.setattr(pet_timeline, "_timeline_ready_pets", set())
+    fake_db.collection("pets").document("rex").set({"name": "Rex"})
+
+
+def days_ago(days, time="08:00:00"):
+    return f"{(datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')}T{time}"
+
+
+def add_document(collection, data):
+    _, ref = fake_db.collection("pets").document("rex").collection(collection).add(data)
+    return ref.id
+
+
+def totals():
+    rollups, _ = load_rollups("rex")
+    return {category: rollup["total"] for category, rollup in rollups.items() if rollup["total"]}
+
+
+def test_rebuild_counts_history_then_updates_incrementally():
+    """Test that a rebuild counts existing documents once and later ingests adjust the totals."""
+    add_document("analytics", {"category": "diet", "timestamp": days_ago(3)})
+    add_document("analytics", {"category": "diet", "timestamp": days_ago(2)})
+    add_document("voice-notes", {"transcript": "walked", "summary": "Walk", "timestamp": days_ago(2, "09:00:00")})
+
+    rebuild_pet_rollups("rex")
+    assert totals() == {"diet": 2, "daily_activity": 1}
+    assert load_rollups("rex")[1] is True
+
+    note = {"input": "Vomited twice", "summary": "", "timestamp": days_ago(1, "10:00:00")}
+    note_id = add_document("textinput", note)
+    record_ingest("rex", "textinput", note_id, note)
+    assert totals() == {"diet": 2, "daily_activity": 2}
+
+    # Storing the same note again (a retry) doesn't count it twice
+    record_ingest("rex", "textinput", note_id, note)
+    assert totals() == {"diet": 2, "daily_activity": 2}
+
+    # Reclassifying it moves it to the new category
+    record_ingest("rex", "textinput", note_id, {**note, "summary": "Vomiting", "content_type": "MEDICAL"})
+    assert totals() == {"diet": 2, "daily_activity": 1, "medical_notes": 1}
+    daily = load_rollups("rex")[0]["daily_activity"]
+    assert daily["daily_counts"] == {days_ago(2)[:10]: 1}
+    assert [entry["id"] for entry in daily["recent_entries"]] != [note_id]
+
+    # A rebuild agrees with the incremental updates
+    assert {category: rollup["total"] for category, rollup in rebuild_pet_rollups("rex").items()} == totals()
+
+
+def test_entry_ingested_during_rebuild_is_counted_once(monkeypatch):
+    """Test that an ingest landing between the rebuild's reads and its commit is neither lost nor doubled."""
+    add_document("analytics", {"category": "diet", "timestamp": "2024-05-01T08:00:00"})
+    pet_timeline.backfill_pet_timeline("rex")
+
+    empty_rollup = analytics_rollups._empty_rollup
+    concurrent = []
+
+    def ingest_meanwhile(category):
+        if not concurrent:
+            entry = {"category": "exercise", "timestamp": "2024-05-01T09:00:00"}
+            concurrent.append(add_document("analytics", entry))
+            record_ingest("rex", "analytics", concurrent[0], entry)
+        return empty_rollup(category)
+
+    monkeypatch.setattr(analytics_rollups, "_empty_rollup", ingest_meanwhile)
+    rebuild_pet_rollups("rex")
+
+    assert fake_db.transaction_retries >= 1
+    assert totals() == {"diet": 1, "exercise": 1}
+
+
+def test_ingest_batch_commits_documents_timeline_and_rollups_together():
+    """Test that a large batch is split within the write limit and every entry is stored and counted once."""
+    categories = ["diet", "exercise", "mood"]
+    documents = [
+        {"category": categories[number % 3], "timestamp": f"2024-05-{number % 28 + 1:02d}T08:00:00", "level": "3"}
+        for number in range(600)
+    ]
+
+    results = ingest_batch("rex", "analytics", documents)
+
+    assert [result["status"] for result in results] == ["success"] * 600
+    assert len({result["id"] for result in results}) == 600
+    timeline = fake_db.collection("pets").document("rex").collection("timeline").get()
+    assert len(timeline) == 600
+    assert all(snapshot.to_dict()["level"] == 3 for snapshot in timeline)
+    assert totals() == {"diet": 200, "exercise": 200, "mood": 200}
+    assert fake_db.commits >= 3
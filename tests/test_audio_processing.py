@@ -0,0 +1,139 @@
+"""
+Tests for silence trimming of LINEAR16 audio.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processing import AudioBuffer, split_at_silence, trim_silence
+
+RATE = 16000
+
+
+def room_noise(seconds, rng):
+    return rng.normal(0, 20, int(seconds * RATE))
+
+
+def voice(seconds, rng):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return 3000 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 20, len(t))
+
+
+def pcm(*parts):
+    return np.concatenate(parts).astype("<i2").tobytes()
+
+
+def contents(buffer):
+    with buffer.view() as audio:
+        return bytes(audio)
+
+
+def test_leading_trailing_silence_and_long_pauses_are_removed():
+    """Test that edges are trimmed to the padding and a long pause is shortened to the maximum."""
+    rng = np.random.default_rng(1)
+    audio = pcm(room_noise(2, rng), voice(1, rng), room_noise(4, rng), voice(1, rng), room_noise(3, rng))
+
+    trimmed, report = trim_silence(audio, RATE, padding_ms=210, max_pause_ms=840)
+
+    seconds = len(trimmed) / 2 / RATE
+    # 0.21 s padding + 1 s + 0.84 s pause + 1 s + 0.21 s padding, give or take a frame at each edge
+    assert abs(seconds - 3.26) < 0.13
+    assert report["original_bytes"] == len(audio)
+    assert report["removed_bytes"] == len(audio) - len(trimmed)
+    assert report["removed_seconds"] > 6.5
+
+
+def test_short_pauses_are_kept():
+    """Test that pauses shorter than the maximum are left alone."""
+    rng = np.random.default_rng(2)
+    audio = pcm(voice(1, rng), room_noise(0.5, rng), voice(1, rng))
+    trimmed, report = trim_silence(audio, RATE, padding_ms=210, max_pause_ms=840)
+    assert contents(trimmed) == audio
+    assert report["removed_bytes"] == 0
+
+
+def test_audio_without_speech_comes_back_empty():
+    """Test that pure room noise (and a stray odd byte) leaves nothing to send."""
+    rng = np.random.default_rng(3)
+    assert contents(trim_silence(pcm(room_noise(3, rng)), RATE)[0]) == b""
+    trimmed, report = trim_silence(b"\x01", RATE)
+    assert contents(trimmed) == b""
+    assert report["removed_bytes"] == 1
+
+
+def test_long_audio_is_split_at_pauses():
+    """Test that segments stay under the limit, break inside pauses and add up to the original audio."""
+    rng = np.random.default_rng(4)
+    parts = []
+    for _ in range(6):
+        parts += [voice(1.5, rng), room_noise(0.6, rng)]
+    audio = pcm(*parts)
+
+    segments = split_at_silence(audio, RATE, max_seconds=3)
+
+    assert len(segments) >= 4
+    assert b"".join(segments) == audio
+    assert all(len(segment) <= 3 * RATE * 2 for segment in segments)
+    for segment in segments[1:]:
+        # Every cut lands in room noise, not in the middle of the tone
+        assert np.abs(np.frombuffer(segment[:960], dtype="<i2")).max() < 500
+    assert split_at_silence(audio[:RATE], RATE, max_seconds=3) == [audio[:RATE]]
+
+
+def test_audio_buffer_grows_then_spills_to_a_file():
+    """Test that the buffer keeps every byte in order while growing in memory and after moving to a file."""
+    chunks = [bytes([number]) * 3200 for number in range(40)]
+    buffer = AudioBuffer(spill_bytes=64000, initial_bytes=10000)
+
+    for chunk in chunks[:15]:
+        buffer.append(chunk)
+    assert not buffer.spilled
+    with buffer.view() as audio:
+        assert audio == b"".join(chunks[:15])
+        # Growing while a view is held leaves the view as it was
+        buffer.append(chunks[15])
+        assert len(audio) == 15 * 3200
+
+    for chunk in chunks[16:]:
+        buffer.append(chunk)
+    assert buffer.spilled
+    assert buffer.chunks == 40
+    with buffer.view() as audio:
+        assert audio == b"".join(chunks)
+        trimmed, report = trim_silence(audio, RATE, padding_ms=0, max_pause_ms=0)
+        assert report["original_bytes"] == len(buffer)
+        trimmed.close()
+
+    buffer.close()
+    buffer.append(chunks[0])
+    assert buffer.chunks == 40
+
+
+def test_audio_buffer_can_start_on_disk():
+    """Test that a buffer created on disk writes its first chunk to a file and reads it back."""
+    buffer = AudioBuffer(on_disk=True)
+    assert buffer.spilled
+    buffer.append(b"\1\0" * 1600)
+    with buffer.view() as audio:
+        assert audio == b"\1\0" * 1600
+    buffer.close()
+
+
+def test_long_trimmed_audio_goes_straight_to_a_file(monkeypatch):
+    """Test that trimmed audio over the spill size is written to a temporary file, not built in memory."""
+    import audio_processing
+
+    monkeypatch.setattr(audio_processing, "AUDIO_BUFFER_SPILL_BYTES", 64000)
+    rng = np.random.default_rng(5)
+    audio = pcm(room_noise(1, rng), voice(3, rng), room_noise(1, rng))
+
+    trimmed, report = trim_silence(audio, RATE, padding_ms=0, max_pause_ms=0)
+    assert trimmed.spilled
+    assert len(trimmed) == report["trimmed_bytes"] > 64000
+    assert contents(trimmed) in audio
+    trimmed.close()
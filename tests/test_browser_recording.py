@@ -0,0 +1,97 @@
+"""
+Tests for the browser recording WebSocket, with transcription stubbed out.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import api_server
+import job_queue
+import transcribe
+
+URL = "/api/recordings/ws?uid=user-1&pet=rex&session_id=tab-1&streaming=false"
+KEY = ("user-1", "rex", "tab-1")
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    fake_db.reset()
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_DB", str(tmp_path / "jobs.sqlite3"))
+    sessions = transcribe.RecordingSessions(idle_timeout=60)
+    monkeypatch.setattr(transcribe, "recording_sessions", sessions)
+    monkeypatch.setattr(api_server, "recording_sessions", sessions)
+    received = []
+    monkeypatch.setattr(transcribe, "_transcribe_audio_data", lambda audio: received.append(bytes(audio)) or "Rex ate")
+    sessions.received = received
+    return sessions
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_chunks_then_stop_saves_the_note(sessions):
+    """Test that uploaded chunks are transcribed together on stop and the note is saved."""
+    with TestClient(api_server.app).websocket_connect(URL) as websocket:
+        assert websocket.receive_json()["type"] == "started"
+        websocket.send_bytes(b"\1\0" * 1600)
+        websocket.send_bytes(b"\2\0" * 1600)
+        websocket.send_json({"type": "stop"})
+        result = websocket.receive_json()
+
+    assert result["type"] == "result"
+    assert result["status"] == "pending"
+    assert result["transcript"] == "Rex ate"
+    assert sessions.received == [b"\1\0" * 1600 + b"\2\0" * 1600]
+    # A stopped session stays readable
+    assert sessions.get(KEY).transcript == "Rex ate"
+
+
+def test_disconnect_drops_the_session(sessions):
+    """Test that closing the socket mid-recording abandons the session and frees its key."""
+    with TestClient(api_server.app).websocket_connect(URL) as websocket:
+        assert websocket.receive_json()["type"] == "started"
+        websocket.send_bytes(b"\0" * 3200)
+        session = sessions.get(KEY)
+
+    wait_for(lambda: sessions.get(KEY) is None)
+    assert not session.is_recording
+    assert sessions.received == []
+
+
+def test_oversized_chunk_is_rejected(sessions):
+    """Test that a chunk over the size limit closes the socket with 1009 and drops the session."""
+    with TestClient(api_server.app).websocket_connect(URL) as websocket:
+        assert websocket.receive_json()["type"] == "started"
+        websocket.send_bytes(b"\0" * (api_server.RECORDING_MAX_CHUNK_BYTES + 2))
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert closed.value.code == 1009
+    wait_for(lambda: sessions.get(KEY) is None)
+    assert sessions.received == []
+
+
+def test_second_connection_for_a_recording_session_is_refused(sessions):
+    """Test that a key already recording is reported as an error and the first session is left alone."""
+    client = TestClient(api_server.app)
+    with client.websocket_connect(URL) as first:
+        assert first.receive_json()["type"] == "started"
+        with client.websocket_connect(URL) as second:
+            assert second.receive_json()["message"] == "Already recording"
+        assert sessions.get(KEY).is_recording
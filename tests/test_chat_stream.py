@@ -0,0 +1,124 @@
+"""
+Tests for the streamed /chat answer, with the RAG context and OpenAI stubbed out.
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import api_server
+import intelligent_chatbot_service
+from intelligent_chatbot_service import IntelligentChatbotService
+
+URL = "/api/pets/rex/chat?stream=true"
+SOURCES = [{"collection": "voice-notes", "id": "note-1"}]
+
+
+def chunk(content=None, tool_calls=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def tool_call_fragment(name=None, arguments=None):
+    return SimpleNamespace(index=0, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def read_events(response):
+    """``(event, data)`` pairs of a Server-Sent Events body"""
+    events = []
+    for message in response.text.strip().split("\n\n"):
+        event, data = message.split("\n")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+@pytest.fixture
+def service(monkeypatch):
+    fake_db.reset()
+    service = IntelligentChatbotService()
+    monkeypatch.setattr(api_server, "_intelligent_chatbot_service", service)
+
+    async def prepare_chat(pet_id, query):
+        return "system prompt", {"context": "Rex walked", "sources": SOURCES, "context_used": True}
+
+    async def analytics_data(pet_id):
+        return [{"classification": "DAILY_ACTIVITY"}]
+
+    monkeypatch.setattr(service, "_prepare_chat", prepare_chat)
+    monkeypatch.setattr(service, "get_pet_analytics_data", analytics_data)
+    monkeypatch.setattr(
+        service, "_execute_visualization_function", lambda name, data, args: {"type": "line", "reason": args["reason"]}
+    )
+    return service
+
+
+def test_streamed_answer_ends_with_one_done_event(service, monkeypatch):
+    """Test that tokens are sent as they arrive, followed by a single done event with sources, charts and timings."""
+    requests = []
+
+    async def stream_chat_completion(**kwargs):
+        requests.append(kwargs)
+        yield chunk("Rex is ")
+        yield chunk("doing well.")
+        yield chunk(tool_calls=[tool_call_fragment("create_activity_chart", '{"reason": ')])
+        yield chunk(tool_calls=[tool_call_fragment(arguments='"trend"}')])
+
+    monkeypatch.setattr(intelligent_chatbot_service, "stream_chat_completion", stream_chat_completion)
+    response = TestClient(api_server.app).post(URL, json={"query": "Show Rex's activity"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = read_events(response)
+    assert events[:2] == [("token", {"text": "Rex is "}), ("token", {"text": "doing well."})]
+    assert [event for event, _ in events].count("done") == 1 and events[-1][0] == "done"
+    done = events[-1][1]
+    assert done["status"] == "success"
+    assert done["response"].startswith("Rex is doing well.")
+    assert done["sources"] == SOURCES
+    assert done["visualizations"] == {"create_activity_chart": {"type": "line", "reason": "trend"}}
+    assert set(done["timings_ms"]) == {"ttft", "total"}
+    assert done["timings_ms"]["ttft"] <= done["timings_ms"]["total"]
+    assert requests[0]["messages"][1] == {"role": "user", "content": "Show Rex's activity"}
+
+
+def test_failed_context_lookup_still_ends_the_stream(service, monkeypatch):
+    """Test that an error before OpenAI is called is reported in a done event rather than cutting the stream off."""
+
+    async def prepare_chat(pet_id, query):
+        raise RuntimeError("Firestore unavailable")
+
+    monkeypatch.setattr(service, "_prepare_chat", prepare_chat)
+    response = TestClient(api_server.app).post(URL, json={"query": "How is Rex?"})
+
+    assert response.status_code == 200
+    events = read_events(response)
+    assert [event for event, _ in events] == ["done"]
+    done = events[0][1]
+    assert done["status"] == "error"
+    assert done["error"] == "Firestore unavailable"
+    assert done["sources"] == []
+    assert done["timings_ms"]["ttft"] is None
+
+
+def test_failed_completion_ends_the_stream_after_its_tokens(service, monkeypatch):
+    """Test that an OpenAI error mid-answer is reported in a done event after the tokens already sent."""
+
+    async def stream_chat_completion(**kwargs):
+        yield chunk("Rex is ")
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(intelligent_chatbot_service, "stream_chat_completion", stream_chat_completion)
+    events = read_events(TestClient(api_server.app).post(URL, json={"query": "How is Rex?"}))
+
+    assert [event for event, _ in events] == ["token", "done"]
+    assert events[1][1]["status"] == "error"
+    assert events[1][1]["sources"] == SOURCES
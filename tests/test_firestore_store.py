@@ -0,0 +1,82 @@
+"""
+Tests for loading a user's pets with one batched read and a profile cache.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+from firebase_admin import firestore
+
+import firestore_store
+from firestore_store import add_pet_to_page_and_user, get_pets_by_user_id
+
+
+@pytest.fixture
+def batched_reads(monkeypatch):
+    """The pet IDs of every get_all call"""
+    fake_db.reset()
+    monkeypatch.setattr(firestore_store, "_pet_profile_cache", {})
+    reads = []
+    get_all = fake_db.get_all
+
+    def counting_get_all(refs, *args, **kwargs):
+        refs = list(refs)
+        reads.append([ref.id for ref in refs])
+        return get_all(refs, *args, **kwargs)
+
+    monkeypatch.setattr(fake_db, "get_all", counting_get_all)
+    for pet_id, name in (("max", "Max"), ("bella", "Bella"), ("rex", "Rex")):
+        fake_db.collection("pets").document(pet_id).set({"name": name, "breed": "Beagle"})
+    fake_db.collection("users").document("user-1").set({"pets": ["max", "bella", "rex"]})
+    return reads
+
+
+def test_pets_are_read_in_one_batch(batched_reads):
+    """Test that every pet of a user is fetched with a single get_all, in the user's order."""
+    pets = get_pets_by_user_id("user-1")
+    assert [pet["id"] for pet in pets] == ["max", "bella", "rex"]
+    assert pets[0]["name"] == "Max"
+    assert batched_reads == [["max", "bella", "rex"]]
+
+
+def test_second_load_is_served_from_the_cache(batched_reads):
+    """Test that loading the same pets again reads only the user document, and callers can't change the cache."""
+    get_pets_by_user_id("user-1")[0]["name"] = "Changed by caller"
+
+    pets = get_pets_by_user_id("user-1")
+    assert [pet["name"] for pet in pets] == ["Max", "Bella", "Rex"]
+    assert len(batched_reads) == 1
+
+
+def test_adding_a_pet_clears_its_cached_profile(batched_reads):
+    """Test that a new pet, or one saved again under the same name, is re-read on the next load and no other pet is."""
+    get_pets_by_user_id("user-1")
+    add_pet_to_page_and_user("user-1", {"name": "Rex", "animal_type": "dog", "breed": "Boxer"}, "page-1")
+    add_pet_to_page_and_user("user-1", {"name": "Luna", "animal_type": "cat"}, "page-1")
+
+    pets = get_pets_by_user_id("user-1")
+    assert [(pet["id"], pet["breed"]) for pet in pets] == [
+        ("max", "Beagle"),
+        ("bella", "Beagle"),
+        ("rex", "Boxer"),
+        ("luna", ""),
+    ]
+    assert batched_reads[1:] == [["rex", "luna"]]
+
+
+def test_removed_pet_is_not_returned(batched_reads):
+    """Test that a pet unlinked from the user disappears on the next load even though its profile is cached."""
+    get_pets_by_user_id("user-1")
+    fake_db.collection("users").document("user-1").update({"pets": firestore.ArrayRemove(["bella"])})
+
+    assert [pet["id"] for pet in get_pets_by_user_id("user-1")] == ["max", "rex"]
+    assert len(batched_reads) == 1
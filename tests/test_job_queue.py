@@ -0,0 +1,98 @@
+"""
+Tests for the SQLite-backed background job queue.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import job_queue
+
+
+@pytest.fixture(autouse=True)
+def queue_db(tmp_path, monkeypatch):
+    """Give each test its own queue database and handler registry."""
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(job_queue, "_handlers", {})
+    return tmp_path
+
+
+def test_job_runs_and_stores_result():
+    """Test that a queued job runs once and keeps its handler's result."""
+    job_queue.register_handler("double", lambda payload: {"value": payload["value"] * 2})
+    job_id = job_queue.enqueue("double", {"value": 21})
+    assert job_queue.get_job(job_id)["status"] == "pending"
+
+    assert job_queue.run_pending() == 1
+    job = job_queue.get_job(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"value": 42}
+    assert job["attempts"] == 1
+
+
+def test_failing_job_is_retried_then_handed_to_on_failure(monkeypatch):
+    """Test that a job is retried up to the attempt limit before its failure handler runs."""
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 3)
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError("upstream unavailable")
+
+    job_queue.register_handler("flaky", flaky, on_failure=lambda payload, error: {"fallback": True, "error": error})
+    job_id = job_queue.enqueue("flaky", {"n": 1})
+
+    job_queue.run_pending()
+    job = job_queue.get_job(job_id)
+    assert len(calls) == 3
+    assert job["status"] == "failed"
+    assert job["result"]["fallback"] is True
+    assert "upstream unavailable" in job["error"]
+
+
+def test_interrupted_jobs_are_requeued(monkeypatch):
+    """Test that jobs left running by a crashed process are picked up again once their lease runs out."""
+    job_queue.register_handler("noop", lambda payload: "ok")
+    job_id = job_queue.enqueue("noop", {})
+    job = job_queue._claim_next()
+    assert job["id"] == job_id
+    assert job_queue.get_job(job_id)["status"] == "running"
+
+    # The process dies here; while its lease lasts, a restarting process leaves the job alone
+    monkeypatch.setattr(job_queue, "WORKER_ID", "restarted-process")
+    assert job_queue.recover_interrupted_jobs() == 0
+    assert job_queue.run_pending() == 0
+
+    job_queue._connect().execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    assert job_queue.recover_interrupted_jobs() == 1
+    assert job_queue.run_pending() == 1
+    assert job_queue.get_job(job_id)["status"] == "done"
+
+
+def test_expired_lease_is_taken_over_and_the_old_owner_cannot_finish(monkeypatch):
+    """Test that another worker claims a job whose lease expired, and the original worker's late result is dropped."""
+    job_queue.register_handler("noop", lambda payload: "new owner")
+    job_id = job_queue.enqueue("noop", {})
+    stale = job_queue._claim_next()
+    assert job_queue.renew_leases() == 1
+    owner = job_queue.WORKER_ID
+
+    job_queue._connect().execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    monkeypatch.setattr(job_queue, "WORKER_ID", "other-process")
+    assert job_queue.run_pending() == 1
+    monkeypatch.setattr(job_queue, "WORKER_ID", owner)
+
+    job_queue._finish(stale["id"], "done", "old owner")
+    job = job_queue.get_job(job_id)
+    assert job["result"] == "new owner"
+    assert job["attempts"] == 2
+
+
+def test_unknown_job_returns_none():
+    """Test that looking up a missing job returns None."""
+    assert job_queue.get_job("missing") is None
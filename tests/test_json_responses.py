@@ -0,0 +1,47 @@
+"""
+Tests for the orjson-backed API responses.
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_responses import ORJSONResponse, dumps, sse_event
+
+
+def test_dumps_matches_standard_json():
+    """Test that encoded bodies decode to the same content as the standard library."""
+    content = {"data": [{"category": "diet", "level": 3, "notes": "Ate well 🐶"}], "next_cursor": None}
+    assert json.loads(dumps(content)) == content
+
+
+def test_dumps_handles_firestore_values():
+    """Test that datetimes and unknown types are serialized instead of raising."""
+
+    class GeoPoint:
+        def __str__(self):
+            return "GeoPoint(1, 2)"
+
+    decoded = json.loads(dumps({"timestamp": datetime(2024, 1, 2, 3, 4, 5), "where": GeoPoint()}))
+    assert decoded["timestamp"].startswith("2024-01-02T03:04:05")
+    assert decoded["where"] == "GeoPoint(1, 2)"
+
+
+def test_response_media_type():
+    """Test that responses are served as JSON."""
+    response = ORJSONResponse({"status": "healthy"})
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"status": "healthy"}
+
+
+def test_sse_event_is_one_message():
+    """Test that a Server-Sent Event keeps multi-line text on a single data line."""
+    message = sse_event("token", {"text": "Line one\nLine two"})
+    assert message.startswith(b"event: token\ndata: ")
+    assert message.endswith(b"\n\n")
+    assert message.count(b"\n") == 3
+    assert json.loads(message.split(b"data: ", 1)[1]) == {"text": "Line one\nLine two"}
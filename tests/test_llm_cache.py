@@ -0,0 +1,106 @@
+"""
+Tests for the content-addressed OpenAI result cache.
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_cache import LLMCache, cache_key
+
+
+def make_cache(tmp_path, ttl=3600, memory_bytes=1024 * 1024, max_disk_bytes=1024 * 1024):
+    return LLMCache(str(tmp_path / "llm_cache.sqlite3"), ttl, memory_bytes, max_disk_bytes)
+
+
+def test_cache_key_covers_every_input():
+    """Test that model, prompt version, text, temperature and options all change the key."""
+    key = cache_key("gpt-4o", "v1", "Max ate dinner", 0.2, max_tokens=400)
+    assert key == cache_key("gpt-4o", "v1", "Max ate dinner", 0.2, max_tokens=400)
+    assert key != cache_key("gpt-4o-mini", "v1", "Max ate dinner", 0.2, max_tokens=400)
+    assert key != cache_key("gpt-4o", "v2", "Max ate dinner", 0.2, max_tokens=400)
+    assert key != cache_key("gpt-4o", "v1", "Max ate breakfast", 0.2, max_tokens=400)
+    assert key != cache_key("gpt-4o", "v1", "Max ate dinner", 0.5, max_tokens=400)
+    assert key != cache_key("gpt-4o", "v1", "Max ate dinner", 0.2, max_tokens=200)
+
+
+def test_results_survive_a_restart(tmp_path):
+    """Test that a result written by one process is served from disk to the next."""
+    make_cache(tmp_path).set("key", {"summary": "Long walk"})
+
+    restarted = make_cache(tmp_path)
+    assert restarted.get("key") == {"summary": "Long walk"}
+    assert restarted.get("key") == {"summary": "Long walk"}
+    assert restarted.get("other") is None
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.667
+
+
+def test_expired_results_are_not_served(tmp_path):
+    """Test that entries older than the TTL count as misses in both tiers."""
+    cache = make_cache(tmp_path, ttl=-1)
+    cache.set("key", "summary")
+    assert cache.get("key") is None
+    assert make_cache(tmp_path).get("key") is None
+
+
+def test_disk_tier_drops_least_recently_used_entries(tmp_path):
+    """Test that the disk tier stays under its byte bound by evicting the oldest entries."""
+    cache = make_cache(tmp_path, memory_bytes=0, max_disk_bytes=250)
+    for index in range(5):
+        cache.set(f"key-{index}", "x" * 98)
+
+    assert cache.stats()["disk_evictions"] == 3
+    assert cache.get("key-0") is None
+    assert cache.get("key-4") == "x" * 98
+
+
+def test_disk_total_is_kept_without_summing_the_table(tmp_path):
+    """Test that the running byte total follows inserts, replacements, expiry and eviction, and expiry is indexed."""
+    cache = make_cache(tmp_path, memory_bytes=0, max_disk_bytes=250)
+    cache.set("key-0", "x" * 98)
+    cache.set("key-0", "x" * 48)
+    cache.set("key-1", "x" * 98)
+    cache.set("key-2", "x" * 98)
+    cache.set("key-3", "x" * 98)
+
+    assert cache.stats()["disk_evictions"] == 2
+    connection = sqlite3.connect(cache.path)
+    total = connection.execute("SELECT bytes FROM llm_cache_total").fetchone()[0]
+    assert total == connection.execute("SELECT SUM(size) FROM llm_cache").fetchone()[0] == 200
+    plan = connection.execute("EXPLAIN QUERY PLAN DELETE FROM llm_cache WHERE expires_at <= 0").fetchall()
+    assert "llm_cache_expires_at" in str(plan)
+
+    cache.clear()
+    assert connection.execute("SELECT bytes FROM llm_cache_total").fetchone()[0] == 0
+
+
+def test_async_lookups_read_the_disk_off_the_event_loop(tmp_path):
+    """Test that aget and aset touch SQLite from a worker thread and serve memory hits inline."""
+    make_cache(tmp_path).set("key", "Long walk")
+    cache = make_cache(tmp_path)
+    threads = []
+    connect = cache._connect
+
+    def recording_connect():
+        threads.append(threading.current_thread())
+        return connect()
+
+    cache._connect = recording_connect
+
+    async def lookups():
+        assert await cache.aget("key") == "Long walk"
+        assert await cache.aget("key") == "Long walk"
+        await cache.aset("other", "Vet visit")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(lookups())
+    assert len(threads) == 2
+    assert loop_thread not in threads
+    assert make_cache(tmp_path).get("other") == "Vet visit"
@@ -0,0 +1,95 @@
+"""
+Tests for background note enrichment and what it mirrors to the timeline, rollups and analytics.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import job_queue
+import pet_timeline
+import summarize_openai
+from analytics_rollups import load_rollups
+from note_enrichment import create_pending_note, enrich_note
+
+
+@pytest.fixture(autouse=True)
+def empty_database(tmp_path, monkeypatch):
+    fake_db.reset()
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(pet_timeline, "_timeline_ready_pets", set())
+    fake_db.collection("pets").document("rex").set({"name": "Rex"})
+    analysis = {
+        "summary": "Long walk in the park",
+        "classification": "DAILY_ACTIVITY",
+        "confidence": 0.9,
+        "keywords": ["walk"],
+    }
+    monkeypatch.setattr(summarize_openai, "analyze_pet_note", lambda text, **kwargs: analysis)
+
+
+def totals():
+    rollups, _ = load_rollups("rex")
+    return {category: rollup["total"] for category, rollup in rollups.items() if rollup["total"]}
+
+
+def test_pending_note_is_on_the_timeline_before_enrichment():
+    """Test that a new note is mirrored when it is created and enrichment replaces that entry."""
+    note = create_pending_note("rex", "textinput", "We walked for an hour")
+    timeline = fake_db.collection("pets").document("rex").collection("timeline").get()
+    assert [snapshot.to_dict()["source_id"] for snapshot in timeline] == [note["doc_id"]]
+    assert totals() == {"daily_activity": 1}
+
+    enrich_note({"pet_id": "rex", "collection": "textinput", "doc_id": note["doc_id"]})
+    entry = fake_db.collection("pets").document("rex").collection("timeline").document(f"textinput_{note['doc_id']}").get()
+    assert entry.to_dict()["summary"] == "Long walk in the park"
+
+
+def test_enriching_a_note_twice_counts_it_once():
+    """Test that running the job again, before or after the note is marked done, leaves the counts unchanged."""
+    note = create_pending_note("rex", "textinput", "We walked for an hour")
+    payload = {"pet_id": "rex", "collection": "textinput", "doc_id": note["doc_id"]}
+
+    enrich_note(payload)
+    expected = totals()
+    assert expected == {"daily_activity": 1, "exercise": 1}
+
+    enrich_note(payload)
+    assert totals() == expected
+
+    # A worker that crashed after mirroring but before marking the note done
+    fake_db.collection("pets").document("rex").collection("textinput").document(note["doc_id"]).update({"status": "pending"})
+    enrich_note(payload)
+    assert totals() == expected
+    analytics = fake_db.collection("pets").document("rex").collection("analytics").get()
+    assert [snapshot.id for snapshot in analytics] == [f"textinput_{note['doc_id']}"]
+
+
+def test_failed_analysis_is_retried_then_stored_unenriched(monkeypatch):
+    """Test that an OpenAI outage fails the job until its attempts run out, and the note is kept without a guessed category."""
+    calls = []
+
+    def unavailable(text, **kwargs):
+        calls.append(kwargs)
+        raise RuntimeError("OpenAI unavailable")
+
+    monkeypatch.setattr(summarize_openai, "analyze_pet_note", unavailable)
+    note = create_pending_note("rex", "textinput", "Rex seems to be limping badly")
+    job_queue.run_pending()
+
+    job = job_queue.get_job(note["job_id"])
+    assert job["status"] == "failed"
+    assert job["attempts"] == len(calls) == job_queue.JOB_MAX_ATTEMPTS
+    assert all(call.get("strict") for call in calls)
+    assert job["result"]["status"] == "stopped"
+    stored = fake_db.collection("pets").document("rex").collection("textinput").document(note["doc_id"]).get().to_dict()
+    assert stored["content_type"] == "TRANSCRIPTION_ONLY"
+    assert fake_db.collection("pets").document("rex").collection("analytics").get() == []
@@ -0,0 +1,198 @@
+"""
+Tests for the shared OpenAI client pool, run against a fake async client.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai_pool
+
+
+class SlowCompletions:
+    """Answers every request after a fixed delay and records how many overlapped"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.threads = set()
+
+    async def create(self, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return kwargs["messages"][-1]["content"]
+
+
+@pytest.fixture
+def slow_openai(monkeypatch):
+    """Swap in a fake client and a fresh semaphore allowing 3 requests at once."""
+    completions = SlowCompletions(delay=0.1)
+    monkeypatch.setattr(openai_pool, "_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(openai_pool, "_semaphore", None)
+    monkeypatch.setattr(openai_pool, "OPENAI_MAX_CONCURRENCY", 3)
+    monkeypatch.setattr(openai_pool, "request_bucket", openai_pool.TokenBucket(0))
+    monkeypatch.setattr(openai_pool, "token_bucket", openai_pool.TokenBucket(0))
+    monkeypatch.setattr(openai_pool, "_paused_until", 0.0)
+    return completions
+
+
+def test_concurrent_requests_overlap_up_to_the_limit(slow_openai):
+    """Test that awaited completions run concurrently but never above the global cap."""
+
+    async def ask_all():
+        return await asyncio.gather(
+            *(openai_pool.chat_completion(model="gpt-4o", messages=[{"role": "user", "content": str(i)}]) for i in range(6))
+        )
+
+    start = time.perf_counter()
+    answers = asyncio.run(ask_all())
+    elapsed = time.perf_counter() - start
+
+    assert answers == [str(i) for i in range(6)]
+    assert slow_openai.max_in_flight == 3
+    # At least two waves of three (overlap itself is shown by max_in_flight)
+    assert elapsed >= 0.2
+    assert slow_openai.threads == {"openai-client"}
+
+
+def test_sync_callers_share_the_same_pool(slow_openai):
+    """Test that worker threads using the blocking entry point are bound by the same cap."""
+    message = [{"role": "user", "content": "hello"}]
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        answers = list(executor.map(lambda _: openai_pool.chat_completion_sync(model="gpt-4o", messages=message), range(5)))
+
+    assert answers == ["hello"] * 5
+    assert slow_openai.max_in_flight == 3
+
+
+def rate_limit_error(retry_after):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_rate_limited_request_waits_for_retry_after(slow_openai, monkeypatch):
+    """Test that a 429 is retried after the provider's Retry-After, pausing every request."""
+    monkeypatch.setattr(openai_pool, "OPENAI_BACKOFF_BASE", 0.01)
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise rate_limit_error("0.2")
+        return "ok"
+
+    monkeypatch.setattr(slow_openai, "create", create)
+    assert openai_pool.chat_completion_sync(model="gpt-4o", messages=[]) == "ok"
+    assert calls[1] - calls[0] >= 0.2
+    assert openai_pool._paused_until >= calls[0] + 0.2
+
+
+def test_other_errors_are_not_retried(slow_openai, monkeypatch):
+    """Test that errors a retry can't fix are raised on the first attempt."""
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise ValueError("bad request")
+
+    monkeypatch.setattr(slow_openai, "create", create)
+    with pytest.raises(ValueError):
+        openai_pool.chat_completion_sync(model="gpt-4o", messages=[], max_attempts=3)
+    assert len(calls) == 1
+
+
+def test_backoff_is_jittered_and_capped():
+    """Test that backoff without Retry-After is spread over a growing, bounded window."""
+    delays = [openai_pool.retry_delay(openai.APIConnectionError(request=None), 3) for _ in range(200)]
+    assert all(0 <= delay <= openai_pool.OPENAI_BACKOFF_BASE * 8 for delay in delays)
+    assert len(set(delays)) > 100
+    assert openai_pool.retry_delay(openai.APIConnectionError(request=None), 20) <= openai_pool.OPENAI_BACKOFF_MAX
+
+
+class FakeClock:
+    """Monotonic clock that only moves when something sleeps on it"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_paces_requests_at_the_limit():
+    """Test that an empty bucket hands out tokens at its per-minute rate."""
+    clock = FakeClock()
+    bucket = openai_pool.TokenBucket(600, clock=clock, sleep=clock.sleep)
+    bucket.tokens = 0
+
+    async def take(count):
+        for _ in range(count):
+            await bucket.acquire(1)
+
+    asyncio.run(take(3))
+    # 600 per minute is one every 0.1 s
+    assert clock.sleeps == pytest.approx([0.1, 0.1, 0.1])
+    assert clock.now == pytest.approx(0.3)
+
+
+class StreamingCompletions:
+    """Streams each word of the prompt as a chunk"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        return self.chunks(kwargs["messages"][-1]["content"].split())
+
+    async def chunks(self, words):
+        for word in words:
+            await asyncio.sleep(0.01)
+            self.sent += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+
+def test_stream_yields_chunks_in_order(slow_openai, monkeypatch):
+    """Test that streamed chunks reach the caller's event loop in order, and closing early stops the stream."""
+    completions = StreamingCompletions()
+    monkeypatch.setattr(openai_pool, "_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    async def read(limit=None):
+        words = []
+        stream = openai_pool.stream_chat_completion(
+            model="gpt-4", messages=[{"role": "user", "content": "one two three four"}]
+        )
+        async for chunk in stream:
+            words.append(chunk.choices[0].delta.content)
+            if len(words) == limit:
+                await stream.aclose()
+                break
+        return words
+
+    assert asyncio.run(read()) == ["one", "two", "three", "four"]
+
+    completions.sent = 0
+    assert asyncio.run(read(limit=1)) == ["one"]
+    time.sleep(0.1)
+    assert completions.sent < 4
@@ -0,0 +1,73 @@
+"""
+Tests for PDF text extraction and page-aware chunking.
+"""
+
+import os
+import sys
+import tempfile
+
+import fitz
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_extract
+from pdf_extract import chunk_pages, extract_page_texts, pdf_buffer
+
+
+def make_pdf(page_count):
+    doc = fitz.open()
+    for number in range(1, page_count + 1):
+        doc.new_page().insert_text((72, 72), f"Lab report page {number}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_spooled_upload_is_read_in_place():
+    """Test that uploads held in memory and rolled over to disk both parse without moving the file position."""
+    data = make_pdf(2)
+    for max_size in (len(data) * 2, 16):
+        upload = tempfile.SpooledTemporaryFile(max_size=max_size)
+        upload.write(data)
+        upload.seek(0)
+        with pdf_buffer(upload) as pdf:
+            assert isinstance(pdf, memoryview)
+            assert [text.strip() for text in extract_page_texts(pdf)] == ["Lab report page 1", "Lab report page 2"]
+        assert upload.tell() == 0
+        assert upload.read() == data
+
+
+def test_large_documents_are_split_across_processes(monkeypatch):
+    """Test that the process pool returns every page, in order."""
+    monkeypatch.setattr(pdf_extract, "PDF_PROCESS_POOL_MIN_PAGES", 5)
+    monkeypatch.setattr(pdf_extract, "PDF_EXTRACT_PROCESSES", 2)
+    get_pool = pdf_extract._get_pool
+    sources = []
+
+    class RecordingPool:
+        def submit(self, fn, source, *args):
+            sources.append(source)
+            return get_pool().submit(fn, source, *args)
+
+    monkeypatch.setattr(pdf_extract, "_get_pool", RecordingPool)
+    try:
+        pages = extract_page_texts(memoryview(make_pdf(7)))
+        assert pdf_extract._pool is not None
+    finally:
+        pdf_extract.shutdown_pool()
+    assert [text.strip() for text in pages] == [f"Lab report page {number}" for number in range(1, 8)]
+    # Workers were sent a path, not the document, and the temporary copy is gone
+    assert len(sources) == 2 and len(set(sources)) == 1
+    assert isinstance(sources[0], str) and not os.path.exists(sources[0])
+
+
+def test_chunks_break_between_pages():
+    """Test that pages are grouped up to the size limit, blank pages are skipped and oversized pages are split."""
+    pages = ["a" * 40, "b" * 40, "  ", "c" * 40, "d" * 250, "e" * 10]
+    chunks = chunk_pages(pages, 100)
+
+    assert [(first, last) for first, last, _ in chunks] == [(1, 2), (4, 4), (5, 5), (5, 5), (5, 5), (6, 6)]
+    assert chunks[0][2] == "a" * 40 + "\n" + "b" * 40
+    assert "".join(text for first, _, text in chunks if first == 5) == "d" * 250
+    assert all(len(text) <= 100 for _, _, text in chunks)
@@ -0,0 +1,60 @@
+"""
+Tests for combining the chunk summaries of long PDFs.
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import install
+
+install()
+
+import pdf_parser
+from llm_cache import LLMCache
+
+
+def test_reduce_keeps_every_summary_when_none_fit_together(monkeypatch):
+    """Test that summaries too long to group are combined in pairs rather than cut off."""
+    monkeypatch.setattr(pdf_parser, "PDF_CHUNK_CHARS", 100)
+    requests = []
+
+    async def complete(prompt_version, system_prompt, text):
+        requests.append(text)
+        return f"summary of {len(requests)}"
+
+    monkeypatch.setattr(pdf_parser, "_complete", complete)
+    partials = [(number, number, f"{number}" * 80) for number in range(1, 6)]
+    summary = asyncio.run(pdf_parser._reduce(partials, asyncio.Semaphore(4)))
+
+    assert summary == f"summary of {len(requests)}"
+    for _, _, text in partials:
+        assert any(text in request for request in requests)
+    # Three pairs, then the three short summaries in one request
+    assert len(requests) == 4
+
+
+def test_cache_tells_prompts_apart(tmp_path, monkeypatch):
+    """Test that the same text sent with the chunk and reduce prompts is answered separately, then from the cache."""
+    monkeypatch.setattr(pdf_parser, "llm_cache", LLMCache(str(tmp_path / "llm_cache.sqlite3"), 3600, 1024 * 1024, 1024 * 1024))
+    requests = []
+
+    async def chat_completion(model, messages, temperature):
+        requests.append(messages[0]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f" summary {len(requests)} "))])
+
+    monkeypatch.setattr(pdf_parser, "chat_completion", chat_completion)
+
+    async def complete_both():
+        results = []
+        for _ in range(2):
+            for prompt in (pdf_parser.CHUNK_PROMPT, pdf_parser.REDUCE_PROMPT):
+                results.append(await pdf_parser._complete(pdf_parser.PDF_PROMPT_VERSION, prompt, "Page 1:\nBloodwork normal"))
+        return results
+
+    assert asyncio.run(complete_both()) == ["summary 1", "summary 2", "summary 1", "summary 2"]
+    assert requests == [pdf_parser.CHUNK_PROMPT, pdf_parser.REDUCE_PROMPT]
@@ -0,0 +1,78 @@
+"""
+Tests for reading a pet's timeline, from the timeline collection and from the original collections.
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import pet_timeline
+from pet_timeline import load_pet_timeline, normalize_timestamp, record_ingest
+
+
+@pytest.fixture(autouse=True)
+def empty_database(monkeypatch):
+    fake_db.reset()
+    monkeypatch.setattr(pet_timeline, "_timeline_ready_pets", set())
+    monkeypatch.setattr(pet_timeline, "_schedule_backfill", lambda pet_id: None)
+
+
+def store(pet_id, collection, data):
+    _, ref = fake_db.collection("pets").document(pet_id).collection(collection).add(data)
+    record_ingest(pet_id, collection, ref.id, data)
+    return ref.id
+
+
+def hours_ago(hours):
+    return (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+
+
+def test_pages_are_full_when_other_collections_are_interleaved():
+    """Test that skipped records don't shorten pages, and following the cursor returns every entry once."""
+    fake_db.collection("pets").document("rex").set({"timeline_ready": True})
+    expected = []
+    for hour in range(1, 8):
+        expected.append(store("rex", "analytics", {"category": "diet", "timestamp": hours_ago(hour)}))
+        store("rex", "records", {"summary": "Lab report", "timestamp": hours_ago(hour + 0.5)})
+
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(load_pet_timeline("rex", limit=3, cursor=cursor))
+        pages.append([entry["id"] for entry in page["entries"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [entry_id for page in pages for entry_id in page] == expected
+
+
+def test_zero_days_returns_nothing_older_than_now():
+    """Test that days=0 is an empty window on both read paths rather than the full history."""
+    store("rex", "analytics", {"category": "diet", "timestamp": hours_ago(2)})
+
+    # Before the backfill, entries come from the original collections
+    assert asyncio.run(load_pet_timeline("rex", days=0))["entries"] == []
+    assert len(asyncio.run(load_pet_timeline("rex", days=None))["entries"]) == 1
+
+    fake_db.collection("pets").document("rex").set({"timeline_ready": True})
+    assert asyncio.run(load_pet_timeline("rex", days=0))["entries"] == []
+    assert len(asyncio.run(load_pet_timeline("rex", days=1))["entries"]) == 1
+
+
+def test_timestamps_are_normalized_to_naive_utc():
+    """Test that offsets are converted to the naive UTC form stored documents use."""
+    assert normalize_timestamp("2024-05-01T23:30:00-02:00") == "2024-05-02T01:30:00"
+    assert normalize_timestamp("2024-05-01T08:00:00Z") == "2024-05-01T08:00:00"
+    assert normalize_timestamp("2024-05-01T08:00:00") == "2024-05-01T08:00:00"
+    assert normalize_timestamp("yesterday") is None
@@ -0,0 +1,98 @@
+"""
+Tests for the versioned response cache.
+"""
+
+import os
+import sys
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+from response_cache import ResponseCache, bump_data_version, etag_matches, get_data_version, make_etag
+
+
+def test_data_version_changes_on_bump():
+    """Test that bumping a pet's version changes only that pet's version, which is kept on the pet document."""
+    fake_db.reset()
+    before = get_data_version("pet-a")
+    other = get_data_version("pet-b")
+
+    bump_data_version("pet-a")
+    assert get_data_version("pet-a") != before
+    assert get_data_version("pet-b") == other
+    assert fake_db.collection("pets").document("pet-a").get().to_dict() == {"data_version": 1}
+
+
+def test_ingest_bumps_data_version():
+    """Test that timeline writes, single and batched, bump the version they commit with."""
+    from pet_timeline import ingest_batch, record_ingest
+
+    fake_db.reset()
+    before = get_data_version("pet-e")
+    record_ingest("pet-e", "analytics", "a1", {"category": "diet", "timestamp": "2024-05-01T08:00:00"})
+    after_single = get_data_version("pet-e")
+    ingest_batch("pet-e", "analytics", [{"category": "diet", "timestamp": "2024-05-02T08:00:00"}])
+
+    assert before != after_single != get_data_version("pet-e")
+
+
+def test_hit_and_miss_counters():
+    """Test that lookups are counted as hits or misses."""
+    cache = ResponseCache(max_bytes=1024)
+    assert cache.get("key") is None
+    cache.set("key", {"value": 1})
+
+    assert cache.get("key") == {"value": 1}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_respects_memory_bound():
+    """Test that the least recently used entries are evicted to stay under the bound."""
+    cache = ResponseCache(max_bytes=100)
+    cache.set("a", "x", size=40)
+    cache.set("b", "x", size=40)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", "x", size=40)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "x"
+    assert cache.get("c") == "x"
+    assert cache.current_bytes == 80
+    assert cache.evictions == 1
+
+
+def test_oversized_value_is_not_cached():
+    """Test that a value larger than the whole cache is skipped."""
+    cache = ResponseCache(max_bytes=10)
+    cache.set("big", "x" * 100)
+
+    assert cache.get("big") is None
+    assert cache.current_bytes == 0
+
+
+def test_etag_changes_with_data_version_and_params():
+    """Test that ETags are stable until the pet's data or the request changes."""
+    etag = make_etag("pet-c", "3", "analytics", 7)
+    assert etag == make_etag("pet-c", "3", "analytics", 7)
+    assert etag != make_etag("pet-c", "3", "analytics", 30)
+    assert etag != make_etag("pet-c", "4", "analytics", 7)
+    assert etag != make_etag("pet-d", "3", "analytics", 7)
+
+
+def test_etag_matches_if_none_match_lists():
+    """Test If-None-Match parsing, including lists, weak validators and wildcards."""
+    etag = make_etag("pet-d", "1", "summary")
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches(etag.removeprefix("W/"), etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
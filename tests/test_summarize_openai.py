@@ -0,0 +1,115 @@
+"""
+Tests for the combined note analysis call, run against a fake OpenAI client.
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import summarize_openai
+from llm_cache import LLMCache
+
+
+class FakeCompletions:
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if isinstance(self.content, Exception):
+            raise self.content
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def fake_openai(monkeypatch, tmp_path):
+    """Replace the shared OpenAI client; set ``.content`` to the reply (or an exception) before calling."""
+    completions = FakeCompletions("")
+    monkeypatch.setattr(summarize_openai, "chat_completion_sync", completions.create)
+    monkeypatch.setattr(
+        summarize_openai, "llm_cache", LLMCache(str(tmp_path / "llm_cache.sqlite3"), 3600, 1024 * 1024, 1024 * 1024)
+    )
+    return completions
+
+
+def test_analyze_pet_note_makes_one_json_call(fake_openai):
+    """Test that the summary and classification come back from a single JSON-mode request."""
+    fake_openai.content = json.dumps(
+        {
+            "summary": "Long walk in the park, very happy.",
+            "classification": "DAILY_ACTIVITY",
+            "confidence": 0.9,
+            "keywords": ["walk", "park"],
+            "reasoning": "Normal exercise",
+            "primary_activities": ["walk"],
+        }
+    )
+    result = summarize_openai.analyze_pet_note("Max had a long walk in the park today")
+
+    assert len(fake_openai.calls) == 1
+    assert fake_openai.calls[0]["response_format"] == {"type": "json_object"}
+    assert result["summary"] == "Long walk in the park, very happy."
+    assert result["classification"] == "DAILY_ACTIVITY"
+    assert result["keywords"] == ["walk", "park"]
+
+
+def test_wrappers_return_their_part_of_the_analysis(fake_openai):
+    """Test that summarize_text and classify_pet_content keep their original return shapes."""
+    fake_openai.content = json.dumps({"summary": "Limping on the left leg.", "classification": "MEDICAL"})
+
+    assert summarize_openai.summarize_text("Bella is limping") == "Limping on the left leg."
+    classification = summarize_openai.classify_pet_content("Bella is limping")
+    assert classification["classification"] == "MEDICAL"
+    assert classification["confidence"] == 0.5
+    assert "summary" not in classification
+
+
+def test_api_errors_fall_back_to_default_analysis(fake_openai):
+    """Test that exhausted retries still return a summary and the fallback classification."""
+    fake_openai.content = RuntimeError("rate limited")
+    result = summarize_openai.analyze_pet_note("The vet gave him medication for the infection", max_retries=2)
+
+    # Retrying is left to openai_pool
+    assert len(fake_openai.calls) == 1
+    assert fake_openai.calls[0]["max_attempts"] == 2
+    assert result["summary"].startswith("Unable to generate AI summary")
+    assert result["classification"] == "DAILY_ACTIVITY"
+    assert result["reasoning"] == "Fallback classification due to API issues"
+
+
+def test_strict_analysis_raises_api_errors(fake_openai):
+    """Test that strict callers get the API error instead of the fallback analysis."""
+    fake_openai.content = RuntimeError("rate limited")
+    with pytest.raises(RuntimeError):
+        summarize_openai.analyze_pet_note("Rex seems to be limping badly", strict=True)
+
+
+def test_empty_note_skips_the_api(fake_openai):
+    """Test that an empty note is answered without calling OpenAI."""
+    result = summarize_openai.analyze_pet_note("   ")
+    assert fake_openai.calls == []
+    assert result["summary"] == "No content to summarize"
+    assert result["classification"] == "UNKNOWN"
+
+
+def test_repeated_note_is_served_from_the_cache(fake_openai):
+    """Test that analyzing the same note twice calls OpenAI once, and API errors are not cached."""
+    fake_openai.content = RuntimeError("rate limited")
+    summarize_openai.analyze_pet_note("Max napped all afternoon", max_retries=1)
+
+    fake_openai.content = json.dumps({"summary": "Long nap.", "classification": "DAILY_ACTIVITY"})
+    first = summarize_openai.analyze_pet_note("Max napped all afternoon")
+    first.pop("summary")
+    second = summarize_openai.analyze_pet_note("Max napped all afternoon")
+
+    assert len(fake_openai.calls) == 2
+    assert second["summary"] == "Long nap."
+    assert summarize_openai.llm_cache.stats()["memory_hits"] == 1
@@ -0,0 +1,357 @@
+"""
+Tests for streaming speech recognition, run against a local fake Speech-to-Text service.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent import futures
+from types import SimpleNamespace
+
+import grpc
+import numpy as np
+import pytest
+from google.cloud import speech
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transcribe
+
+# One second of a 220 Hz tone, loud enough to count as speech
+TONE = (3000 * np.sin(2 * np.pi * 220 * np.arange(16000) / 16000)).astype("<i2").tobytes()
+
+
+class FakeSpeechService:
+    """Speech-to-Text over gRPC on localhost: one word per audio chunk, finalized every five chunks"""
+
+    def __init__(self):
+        self.streams = 0
+        self.fail_streaming = False
+        # Batch recognition: the results for a request's audio, and how long each request takes
+        self.batch_results = lambda audio: ["batch"]
+        self.recognize_delay = 0.0
+        self.recognize_requests = []
+        self.fail_recognize = lambda audio: False
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def streaming_recognize(self, requests, context):
+        self.streams += 1
+        if self.fail_streaming:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "stream dropped")
+        words = []
+        for request in requests:
+            if not request.audio_content:
+                continue  # the config request
+            words.append(f"word{len(words) + 1}")
+            if len(words) % 5:
+                yield self.response(" ".join(words[-(len(words) % 5) :]), is_final=False)
+            else:
+                yield self.response(" ".join(words[-5:]), is_final=True)
+        if len(words) % 5:
+            yield self.response(" ".join(words[-(len(words) % 5) :]), is_final=True)
+
+    def recognize(self, request, context):
+        self.recognize_requests.append(request)
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.recognize_delay)
+        with self._lock:
+            self.in_flight -= 1
+        if self.fail_recognize(request.audio.content):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "bad segment")
+        return speech.RecognizeResponse(
+            results=[
+                speech.SpeechRecognitionResult(alternatives=[speech.SpeechRecognitionAlternative(transcript=transcript)])
+                for transcript in self.batch_results(request.audio.content)
+            ]
+        )
+
+    @staticmethod
+    def response(transcript, is_final):
+        alternative = speech.SpeechRecognitionAlternative(transcript=transcript)
+        return speech.StreamingRecognizeResponse(
+            results=[speech.StreamingRecognitionResult(alternatives=[alternative], is_final=is_final)]
+        )
+
+
+@pytest.fixture
+def speech_service(monkeypatch):
+    service = FakeSpeechService()
+    handler = grpc.method_handlers_generic_handler(
+        "google.cloud.speech.v1.Speech",
+        {
+            "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+                service.streaming_recognize,
+                request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+                response_serializer=speech.StreamingRecognizeResponse.serialize,
+            ),
+            "Recognize": grpc.unary_unary_rpc_method_handler(
+                service.recognize,
+                request_deserializer=speech.RecognizeRequest.deserialize,
+                response_serializer=speech.RecognizeResponse.serialize,
+            ),
+        },
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=16))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+
+    channel = grpc.insecure_channel(f"localhost:{port}")
+    client = speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+    monkeypatch.setattr(transcribe, "get_speech_client", lambda: client)
+    # A microphone that delivers a chunk of a steady tone every 10 ms
+    microphone = SimpleNamespace(
+        read=lambda frames, exception_on_overflow=True: time.sleep(0.01) or TONE[: frames * 2],
+        stop_stream=lambda: None,
+        close=lambda: None,
+    )
+    fake_pyaudio = SimpleNamespace(
+        paInt16=8, PyAudio=lambda: SimpleNamespace(open=lambda **kwargs: microphone, terminate=lambda: None)
+    )
+    monkeypatch.setitem(sys.modules, "pyaudio", fake_pyaudio)
+    sessions = transcribe.RecordingSessions(idle_timeout=60)
+    monkeypatch.setattr(transcribe, "recording_sessions", sessions)
+    yield service
+    for session in list(sessions._sessions.values()):
+        session.abandon()
+    server.stop(0)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def session(pet="max", session_id="default"):
+    return transcribe.recording_sessions.get(("user-1", pet, session_id))
+
+
+def test_interim_results_arrive_while_recording(speech_service):
+    """Test that status shows interim and final text during recording, and stop returns the streamed transcript."""
+    assert transcribe.start_recording("user-1", "max", streaming=True)["streaming"] is True
+    wait_for(lambda: transcribe.get_recording_status("user-1", "max")["interim_transcript"])
+    wait_for(lambda: transcribe.get_recording_status("user-1", "max")["transcript"])
+    assert transcribe.get_recording_status("user-1", "max")["transcript"].startswith("word1 word2 word3 word4 word5")
+
+    result = transcribe.stop_recording("user-1", "max")
+    # The transcript came from the stream, not from batch recognition of the whole recording
+    assert not speech_service.recognize_requests
+
+    chunks = session().audio_data.chunks
+    words = result["transcript"].split()
+    assert result["status"] == "stopped"
+    assert words == [f"word{number}" for number in range(1, chunks + 1)]
+    assert transcribe.get_recording_status("user-1", "max") == {
+        "is_recording": False,
+        "transcript": result["transcript"],
+        "interim_transcript": "",
+    }
+
+
+def test_long_recordings_continue_on_a_new_stream(speech_service, monkeypatch):
+    """Test that audio past the per-stream limit is sent on another stream without losing chunks."""
+    # Two 100 ms chunks per stream
+    monkeypatch.setattr(transcribe, "STREAMING_LIMIT_SECONDS", 0.2)
+    transcribe.start_recording("user-1", "max", streaming=True)
+    wait_for(lambda: session().audio_data.chunks >= 6)
+    result = transcribe.stop_recording("user-1", "max")
+
+    chunks = session().audio_data.chunks
+    assert speech_service.streams >= 3
+    assert len(result["transcript"].split()) == chunks
+
+
+def test_broken_stream_falls_back_to_batch_recognition(speech_service):
+    """Test that a failed stream still produces a transcript from the recorded audio."""
+    speech_service.fail_streaming = True
+    transcribe.start_recording("user-1", "max", streaming=True)
+    wait_for(lambda: session().stream_error)
+    result = transcribe.stop_recording("user-1", "max")
+    assert result["transcript"] == "batch"
+
+
+def test_failed_and_abandoned_sessions_let_go_of_their_audio(speech_service):
+    """Test that chunks stop being queued once the stream fails, and abandoning a session frees its buffer."""
+    speech_service.fail_streaming = True
+    transcribe.start_recording("user-1", "max", "tab-1", streaming=True, source="browser")
+    browser = session(session_id="tab-1")
+    browser.add_chunk(b"\0" * 3200)
+    wait_for(lambda: not browser.recognizer.is_alive())
+    assert browser.stream_error
+
+    for _ in range(50):
+        browser.add_chunk(b"\0" * 3200)
+    assert browser.audio_queue.empty()
+
+    browser.abandon()
+    with browser.audio_data.view() as audio:
+        assert len(audio) == 0
+
+
+def test_silent_recordings_are_not_sent_for_batch_recognition(speech_service):
+    """Test that batch recognition gets no request when the recording is all silence."""
+    assert transcribe._transcribe_audio_data(b"\0" * 32000) == "No speech detected"
+    assert not speech_service.recognize_requests
+
+
+def utterances(amplitudes, seconds=1.0, pause=1.0):
+    """A tone at each amplitude in turn, with a pause of room noise after each"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * 16000)) / 16000
+    parts = []
+    for amplitude in amplitudes:
+        parts += [amplitude * np.sin(2 * np.pi * 220 * t), np.zeros(int(pause * 16000))]
+    return (np.concatenate(parts) + rng.normal(0, 20, sum(map(len, parts)))).astype("<i2").tobytes()
+
+
+def loudness_words(audio):
+    """One result per voiced stretch of a segment, named after its amplitude in thousands"""
+    frames = np.frombuffer(audio, dtype="<i2")[: len(audio) // 960 * 480].reshape(-1, 480)
+    return [f"tone{level}" for level in sorted({round(int(abs(frame).max()) / 1000) for frame in frames} - {0})]
+
+
+def test_long_recordings_are_transcribed_in_segments_in_order(speech_service, monkeypatch):
+    """Test that audio over the segment limit is split at pauses, recognized in parallel and joined in order."""
+    monkeypatch.setattr(transcribe, "TRANSCRIBE_SEGMENT_SECONDS", 2.5)
+    speech_service.batch_results = loudness_words
+    speech_service.recognize_delay = 0.2
+    audio = utterances([1000 * level for level in range(1, 9)])
+
+    transcript = transcribe._transcribe_audio_data(audio)
+
+    segments = [request.audio.content for request in speech_service.recognize_requests]
+    assert transcript == " ".join(f"tone{level}" for level in range(1, 9))
+    assert len(segments) >= 4
+    assert all(len(segment) <= 2.5 * 16000 * 2 for segment in segments)
+    assert speech_service.max_in_flight > 1
+
+
+def test_failed_segments_are_retried_then_marked(speech_service, monkeypatch):
+    """Test that a segment failing once is retried, and one that keeps failing leaves a marker in its place."""
+    monkeypatch.setattr(transcribe, "TRANSCRIBE_SEGMENT_SECONDS", 2.5)
+    speech_service.batch_results = loudness_words
+    audio = utterances([1000 * level for level in range(1, 9)])
+    failures = []
+
+    def fail_once(content):
+        if "tone3" in loudness_words(content) and not failures:
+            failures.append(content)
+            return True
+        return False
+
+    speech_service.fail_recognize = fail_once
+    assert transcribe._transcribe_audio_data(audio) == " ".join(f"tone{level}" for level in range(1, 9))
+    segment_count = len(speech_service.recognize_requests) - 1
+    assert failures
+
+    speech_service.fail_recognize = lambda content: "tone3" in loudness_words(content)
+    transcript = transcribe._transcribe_audio_data(audio).split(" [")
+    marked = [part for part in transcript if "could not be transcribed" in part]
+    assert len(marked) == 1
+    assert "tone2" in transcript[0] and "tone3" not in " ".join(transcript)
+    assert len(speech_service.recognize_requests) == 2 * segment_count + 1 + transcribe.TRANSCRIBE_SEGMENT_ATTEMPTS - 1
+
+    speech_service.fail_recognize = lambda content: True
+    assert transcribe._transcribe_audio_data(audio).startswith("Error:")
+
+
+def test_ten_minute_recording_segments_are_recognized_concurrently(speech_service):
+    """Test that the segments of a 10-minute recording are recognized at the same time, not one after another."""
+    speech_service.recognize_delay = 0.5
+    audio = utterances([3000] * 200, seconds=2.0)
+    assert len(audio) == 600 * 16000 * 2
+
+    start = time.perf_counter()
+    transcript = transcribe._transcribe_audio_data(audio)
+    elapsed = time.perf_counter() - start
+
+    requests = len(speech_service.recognize_requests)
+    print(f"10-minute recording: {requests} segments in {elapsed:.2f}s ({requests * 0.5:.1f}s one after the other)")
+    assert requests >= 10
+    assert transcript == " ".join(["batch"] * requests)
+    assert speech_service.max_in_flight > 1
+
+
+def test_long_recording_memory_stays_under_one_copy(speech_service):
+    """Test that recording and transcribing 30 minutes of audio never holds the whole recording on the heap.
+
+    benchmarks/bench_recording_memory.py reports the actual peaks.
+    """
+    speech_service.batch_results = lambda audio: []
+    transcribe.start_recording("user-1", "max", "tab-1", streaming=False, source="browser")
+    browser = session(session_id="tab-1")
+    chunk = TONE[:3200]
+    audio_bytes = 30 * 60 * 10 * len(chunk)
+
+    tracemalloc.start()
+    try:
+        for _ in range(30 * 60 * 10):
+            browser.add_chunk(chunk)
+        result = transcribe.stop_recording("user-1", "max", "tab-1")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert result["transcript"] == "No speech detected"
+    assert peak < audio_bytes
+
+
+def test_sessions_record_concurrently(speech_service):
+    """Test that several pets record at once, each with its own buffer and transcript."""
+    keys = [("max", "a"), ("max", "b"), ("bella", "a")]
+    for pet, session_id in keys:
+        assert transcribe.start_recording("user-1", pet, session_id, streaming=True)["status"] == "recording"
+    assert transcribe.start_recording("user-1", "max", "a")["message"] == "Already recording"
+    assert transcribe.recording_sessions.stats()["recording"] == 3
+
+    wait_for(lambda: all(session(*key).audio_data.chunks >= 3 for key in keys))
+    for pet, session_id in keys:
+        result = transcribe.stop_recording("user-1", pet, session_id)
+        assert len(result["transcript"].split()) == session(pet, session_id).audio_data.chunks
+    assert transcribe.stop_recording("user-1", "max", "a")["message"] == "Not recording"
+    assert transcribe.stop_recording("user-1", "rex", "a")["message"] == "Not recording"
+
+
+def test_idle_sessions_are_reaped(speech_service):
+    """Test that sessions nobody has touched within the idle timeout are dropped, but live recordings are kept."""
+    transcribe.recording_sessions.idle_timeout = 0.2
+    # The microphone keeps delivering chunks, though nobody polls its status
+    transcribe.start_recording("user-1", "max", streaming=True)
+    # A browser tab that went away without closing its socket
+    transcribe.start_recording("user-1", "bella", "tab-1", streaming=True, source="browser")
+    transcribe.start_recording("user-1", "rex", streaming=False)
+    transcribe.stop_recording("user-1", "rex")
+    abandoned = session("bella", "tab-1")
+
+    time.sleep(0.3)
+    assert transcribe.recording_sessions.reap() == 2
+
+    assert session("bella", "tab-1") is None
+    assert session("rex") is None
+    assert session().is_recording
+    wait_for(lambda: not any(thread.is_alive() for thread in abandoned.threads))
+    assert transcribe.stop_recording("user-1", "max")["status"] == "stopped"
+
+
+def test_browser_sessions_transcribe_uploaded_chunks(speech_service):
+    """Test that a browser session streams the chunks it is given, without opening a microphone."""
+    sys.modules.pop("pyaudio")
+    transcribe.start_recording("user-1", "max", "tab-1", streaming=True, source="browser")
+    browser = session(session_id="tab-1")
+    assert browser.recorder is None
+
+    for _ in range(7):
+        browser.add_chunk(b"\0" * 3200)
+    wait_for(lambda: browser.status()["transcript"])
+    result = transcribe.stop_recording("user-1", "max", "tab-1")
+    assert result["transcript"] == " ".join(f"word{number}" for number in range(1, 8))
@@ -0,0 +1,103 @@
+"""
+Tests for duplicate detection in PDF uploads, with storage and summarizing stubbed out.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_firestore import fake_db, install
+
+install()
+
+import api_server
+import pet_timeline
+from pdf_parser import SUMMARY_ERROR
+
+PDF = b"%PDF-1.4 Rex bloodwork, all values normal"
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    fake_db.reset()
+    monkeypatch.setenv("GOOGLE_CLOUD_PROJECT", "test-project")
+    monkeypatch.setattr(pet_timeline, "_timeline_ready_pets", set())
+    calls = SimpleNamespace(uploaded=[], summarized=[], summaries=[])
+
+    def upload_to_storage(blob, upload, size, content_type):
+        calls.uploaded.append(blob)
+        return f"https://storage.example/{blob}"
+
+    async def summarize_pdf(pdf):
+        calls.summarized.append(bytes(pdf))
+        return calls.summaries.pop(0) if calls.summaries else "Bloodwork normal"
+
+    monkeypatch.setattr(api_server, "storage", SimpleNamespace(bucket=lambda: SimpleNamespace(blob=lambda name: name)))
+    monkeypatch.setattr(api_server, "upload_to_storage", upload_to_storage)
+    monkeypatch.setattr(api_server, "summarize_pdf", summarize_pdf)
+    return calls
+
+
+def upload(force=False):
+    return (
+        TestClient(api_server.app)
+        .post(
+            "/api/upload_pdf" + ("?force=true" if force else ""),
+            data={"uid": "user-1", "pet": "rex"},
+            files={"file": ("bloodwork.pdf", PDF, "application/pdf")},
+        )
+        .json()
+    )
+
+
+def records():
+    return fake_db.collection("pets").document("rex").collection("records").get()
+
+
+def test_duplicate_upload_returns_the_existing_record(uploads):
+    """Test that the same file uploaded again is answered from its record without storing or summarizing it."""
+    first = upload()
+    assert first["duplicate"] is False
+    assert first["summary"] == "Bloodwork normal"
+
+    second = upload()
+    assert second["duplicate"] is True
+    assert (second["record_id"], second["summary"], second["url"]) == (first["record_id"], first["summary"], first["url"])
+    assert len(uploads.uploaded) == len(uploads.summarized) == 1
+    assert uploads.summarized == [PDF]
+    assert len(records()) == 1
+
+
+def test_force_reprocesses_a_duplicate(uploads):
+    """Test that force=true stores and summarizes a file the pet already has as a new record."""
+    first = upload()
+    uploads.summaries.append("Bloodwork normal, recheck in 6 months")
+    forced = upload(force=True)
+
+    assert forced["duplicate"] is False
+    assert forced["record_id"] != first["record_id"]
+    assert forced["summary"] == "Bloodwork normal, recheck in 6 months"
+    assert len(uploads.uploaded) == len(uploads.summarized) == 2
+    assert len(records()) == 2
+
+
+def test_failed_summary_is_not_treated_as_a_duplicate(uploads):
+    """Test that a record whose summary failed is not indexed, so uploading the file again retries it."""
+    uploads.summaries.append(SUMMARY_ERROR)
+    failed = upload()
+    assert failed["summary"] == SUMMARY_ERROR
+    assert fake_db.collection("pets").document("rex").collection("record_hashes").get() == []
+
+    retried = upload()
+    assert retried["duplicate"] is False
+    assert retried["summary"] == "Bloodwork normal"
+    assert len(uploads.summarized) == 2
+
+    assert upload()["record_id"] == retried["record_id"]
+    assert len(uploads.summarized) == 2
@@ -1,12 +1,13 @@
 # transcribe.py
-import pyaudio
 import queue
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import speech
 import os
 from dotenv import load_dotenv
 from gcloud_auth import setup_google_cloud_auth
+from audio_processing import AudioBuffer, split_at_silence, trim_silence
 
 load_dotenv()
 
@@ -17,10 +18,37 @@ setup_google_cloud_auth()
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms chunks
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
+SAMPLE_WIDTH = 2  # 16-bit samples (pyaudio.paInt16)
 
-# Global state for recording
-recording_state = {"is_recording": False, "audio_data": [], "transcript": "", "audio_queue": queue.Queue()}
+# Send audio to Speech-to-Text while recording (interim results, transcript ready on stop),
+# instead of one recognize call with the whole recording after it stops
+STREAMING_RECOGNITION = os.getenv("STREAMING_RECOGNITION", "true").lower() == "true"
+
+# Speech-to-Text ends a stream after about five minutes of audio, so longer recordings
+# continue on a new stream after this many seconds
+STREAMING_LIMIT_SECONDS = 240
+
+# Seconds stop_recording waits for the final results of a stream
+STREAMING_FINAL_TIMEOUT = 5.0
+
+# Seconds without a request for a session (start, status, stop) before it is stopped and dropped
+RECORDING_IDLE_TIMEOUT = int(os.getenv("RECORDING_IDLE_TIMEOUT", "600"))
+
+# Seconds between sweeps for idle sessions
+RECORDING_REAP_INTERVAL = 30
+
+# recognize rejects more than about a minute of audio, so longer recordings are
+# sent as segments of at most this many seconds, cut at pauses
+TRANSCRIBE_SEGMENT_SECONDS = float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "55"))
+
+# Segments recognized at once, across all recordings (16 covers a 15-minute recording in one round)
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "16"))
+
+# Attempts per segment before its place in the transcript is marked as missing
+TRANSCRIBE_SEGMENT_ATTEMPTS = int(os.getenv("TRANSCRIBE_SEGMENT_ATTEMPTS", "2"))
+
+_segment_pool = None
+_segment_pool_lock = threading.Lock()
 
 
 def get_speech_client():
@@ -37,27 +65,27 @@ def get_speech_client():
         return None
 
 
+def _recognition_config():
+    return speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=RATE,
+        language_code="en-US",
+    )
+
+
 def transcribe_audio(duration_seconds=10):
     """Simple transcription for a fixed duration"""
-    client = get_speech_client()
-    if not client:
-        return "Error: Could not initialize Speech client"
+    # Only needed where the server records from its own microphone
+    import pyaudio
 
     # Set up audio recording
     audio = pyaudio.PyAudio()
 
-    # Recording configuration
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-        sample_rate_hertz=RATE,
-        language_code="en-US",
-    )
-
     # Start recording
-    stream = audio.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
+    stream = audio.open(format=pyaudio.paInt16, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
 
     print(f"Recording for {duration_seconds} seconds...")
-    frames = []
+    frames = AudioBuffer()
 
     for _ in range(0, int(RATE / CHUNK * duration_seconds)):
         data = stream.read(CHUNK)
@@ -70,125 +98,331 @@ def transcribe_audio(duration_seconds=10):
     stream.close()
     audio.terminate()
 
-    # Combine audio data
-    audio_data = b''.join(frames)
-
     # Transcribe
-    audio = speech.RecognitionAudio(content=audio_data)
-
-    try:
-        response = client.recognize(config=config, audio=audio)
-
-        if response.results:
-            transcript = response.results[0].alternatives[0].transcript
-            print(f"Transcript: {transcript}")
-            return transcript
+    with frames.view() as audio_data:
+        return _transcribe_audio_data(audio_data)
+
+
+class RecordingSession:
+    """One recording: its audio buffer, worker threads and transcript"""
+
+    def __init__(self, key, streaming, source="microphone"):
+        self.key = key
+        self.streaming = streaming
+        # "microphone" records on this server; "browser" sessions get their chunks from add_chunk
+        self.source = source
+        self.is_recording = False
+        self.audio_data = AudioBuffer()
+        self.audio_queue = queue.Queue()
+        self.transcript = ""
+        self.final_transcripts = []
+        self.interim_transcript = ""
+        self.stream_error = None
+        self.recorder = None
+        self.recognizer = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    @property
+    def threads(self):
+        return [thread for thread in (self.recorder, self.recognizer) if thread is not None]
+
+    def start(self):
+        self.is_recording = True
+        # Start recording thread, and the recognizer thread that streams its chunks
+        name = "recording-" + "-".join(self.key)
+        if self.source == "microphone":
+            self.recorder = threading.Thread(target=self._record_audio, name=name, daemon=True)
+        if self.streaming:
+            self.recognizer = threading.Thread(target=self._stream_recognize, name=name, daemon=True)
+        for thread in self.threads:
+            thread.start()
+
+    def _end_of_audio(self):
+        if self.recorder is None:
+            # Browser sessions have no recorder to close the recognizer's request stream
+            self.audio_queue.put(None)
+
+    def stop(self):
+        """Stop recording and process audio"""
+        self.touch()
+        if not self.is_recording:
+            print("Not currently recording")
+            return {"status": "error", "message": "Not recording"}
+
+        print(f"Stopping recording {self.key}...")
+        self.is_recording = False
+        self._end_of_audio()
+
+        # Wait for the recorder to hand over its last chunk, then for the final streaming results
+        if self.recorder is not None:
+            self.recorder.join(timeout=1.0)
+        if self.recognizer is not None:
+            self.recognizer.join(timeout=STREAMING_FINAL_TIMEOUT)
+
+        # Process the recorded audio
+        if self.audio_data:
+            print(f"Processing {self.audio_data.chunks} audio chunks")
+            transcript = self._streamed_transcript() if self.recognizer is not None else None
+            if transcript is None:
+                with self.audio_data.view() as audio_data:
+                    buffered = " (buffered in a temporary file)" if self.audio_data.spilled else ""
+                    print(f"Total audio data size: {len(audio_data)} bytes{buffered}")
+                    transcript = _transcribe_audio_data(audio_data)
+            self.transcript = transcript
+            self.audio_data.close()
+
+            print(f"Recording stopped successfully. Transcript: '{transcript[:100]}...'")
+            return {"status": "stopped", "transcript": transcript, "message": "Recording stopped and transcribed"}
         else:
-            return "No speech detected"
+            print("No audio data recorded")
+            return {"status": "error", "message": "No audio data recorded"}
+
+    def abandon(self):
+        """Stop the worker threads and free the audio without transcribing anything"""
+        # The recorder sees this within a chunk, and its end-of-audio marker closes the stream
+        self.is_recording = False
+        self._end_of_audio()
+        self.audio_data.close()
+
+    def status(self):
+        """While streaming, ``transcript`` grows as phrases are finalized"""
+        self.touch()
+        transcript = self.transcript
+        if self.is_recording and self.streaming:
+            transcript = " ".join(self.final_transcripts)
+        return {
+            "is_recording": self.is_recording,
+            "transcript": transcript,
+            "interim_transcript": self.interim_transcript,
+        }
+
+    def add_chunk(self, data):
+        """Keep a recorded chunk, and pass it to the recognizer when streaming"""
+        # A session that is still receiving audio is in use, whether or not anyone polls it
+        self.touch()
+        self.audio_data.append(data)
+        # Once the stream has failed nothing reads the queue; stop() transcribes the buffer instead
+        if self.streaming and self.stream_error is None:
+            self.audio_queue.put(data)
+
+    def _record_audio(self):
+        """Record from the server's microphone until stopped"""
+        audio = None
+        try:
+            import pyaudio
 
-    except Exception as e:
-        print(f"Transcription error: {e}")
-        return f"Error: {str(e)}"
+            audio = pyaudio.PyAudio()
+            stream = audio.open(format=pyaudio.paInt16, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
 
+            print("Recording started...")
 
-def start_recording():
-    """Start recording audio"""
+            while self.is_recording:
+                try:
+                    data = stream.read(CHUNK, exception_on_overflow=False)
+                    self.add_chunk(data)
+                except Exception as e:
+                    print(f"Error reading audio: {e}")
+                    break
 
-    if recording_state["is_recording"]:
-        return {"status": "error", "message": "Already recording"}
+            stream.stop_stream()
+            stream.close()
+        finally:
+            if audio is not None:
+                audio.terminate()
+            # Ends the recognizer's request stream
+            self.audio_queue.put(None)
 
-    recording_state["is_recording"] = True
-    recording_state["audio_data"] = []
-    recording_state["transcript"] = ""
-    recording_state["audio_queue"] = queue.Queue()
+        print("Recording stopped")
 
-    # Start recording thread
-    recording_thread = threading.Thread(target=_record_audio)
-    recording_thread.daemon = True
-    recording_thread.start()
+    def _stream_recognize(self):
+        """Feed queued chunks to StreamingRecognize and collect interim and final transcripts"""
+        client = get_speech_client()
+        if not client:
+            self.stream_error = "Could not initialize Speech client"
+            return
+
+        streaming_config = speech.StreamingRecognitionConfig(config=_recognition_config(), interim_results=True)
+        stream_limit_bytes = STREAMING_LIMIT_SECONDS * RATE * SAMPLE_WIDTH * CHANNELS
+        finished = False
+
+        def requests():
+            nonlocal finished
+            sent = 0
+            while sent < stream_limit_bytes:
+                data = self.audio_queue.get()
+                if data is None:
+                    finished = True
+                    return
+                sent += len(data)
+                yield speech.StreamingRecognizeRequest(audio_content=data)
 
-    return {"status": "recording", "message": "Recording started"}
+        try:
+            # Each pass is one stream; closing its requests makes the service finalize what it heard
+            while not finished:
+                # No client retries: a retried stream can't resend the chunks it already consumed
+                for response in client.streaming_recognize(streaming_config, requests(), retry=None):
+                    interim = []
+                    for result in response.results:
+                        if not result.alternatives:
+                            continue
+                        if result.is_final:
+                            self.final_transcripts.append(result.alternatives[0].transcript.strip())
+                        else:
+                            interim.append(result.alternatives[0].transcript)
+                    self.interim_transcript = "".join(interim)
+        except Exception as e:
+            # stop() falls back to transcribing the whole recording
+            print(f"Streaming recognition error: {e}")
+            self.stream_error = str(e)
+            # Free the chunks queued before add_chunk saw the error
+            while not self.audio_queue.empty():
+                self.audio_queue.get_nowait()
+        self.interim_transcript = ""
+
+    def _streamed_transcript(self):
+        """Transcript from the finished stream, or None when the recording must be transcribed again"""
+        if self.stream_error or self.recognizer.is_alive():
+            return None
+        transcript = " ".join(text for text in self.final_transcripts if text)
+        return transcript or "No speech detected"
+
+
+class RecordingSessions:
+    """Recording sessions keyed by ``(uid, pet_id, session_id)``
+
+    Any number of users and pets can record at once, each session with its own
+    buffer, threads and transcript. A stopped session is kept so its status can
+    still be read. A background thread drops sessions that haven't received audio or been polled for
+    ``idle_timeout`` seconds, first stopping any that are still recording.
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.reaped = 0
+
+    def start(self, key, streaming, source="microphone"):
+        """A new recording session, or None while ``key`` is already recording"""
+        with self._lock:
+            existing = self._sessions.get(key)
+            if existing is not None and existing.is_recording:
+                return None
+            session = RecordingSession(key, streaming, source)
+            self._sessions[key] = session
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="recording-reaper", daemon=True)
+                self._reaper.start()
+        session.start()
+        return session
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def discard(self, session):
+        """Abandon a session and drop it, unless its key has already been reused by a newer one"""
+        with self._lock:
+            if self._sessions.get(session.key) is session:
+                del self._sessions[session.key]
+        session.abandon()
+
+    def reap(self):
+        """Drop idle sessions; returns how many were dropped"""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [key for key, session in self._sessions.items() if session.last_active < deadline]
+            sessions = [self._sessions.pop(key) for key in idle]
+            self.reaped += len(sessions)
+        for session in sessions:
+            print(f"Dropping idle recording session {session.key}")
+            session.abandon()
+        return len(sessions)
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(RECORDING_REAP_INTERVAL)
+            self.reap()
+
+    def stats(self):
+        with self._lock:
+            recording = sum(session.is_recording for session in self._sessions.values())
+            return {"sessions": len(self._sessions), "recording": recording, "reaped": self.reaped}
+
+
+recording_sessions = RecordingSessions(RECORDING_IDLE_TIMEOUT)
+
+
+def start_recording(uid, pet_id, session_id="default", streaming=None, source="microphone"):
+    """Start recording audio; ``streaming`` defaults to STREAMING_RECOGNITION
+
+    With ``source="browser"`` nothing is recorded on the server: the client's
+    chunks are passed to ``add_chunk`` of ``recording_sessions.get(key)``.
+    """
+    streaming = STREAMING_RECOGNITION if streaming is None else streaming
+    session = recording_sessions.start((uid, pet_id, session_id), streaming, source)
+    if session is None:
+        return {"status": "error", "message": "Already recording"}
+    return {"status": "recording", "message": "Recording started", "session_id": session_id, "streaming": streaming}
 
 
-def stop_recording():
+def stop_recording(uid, pet_id, session_id="default"):
     """Stop recording and process audio"""
-
-    print(f"Stop recording called. Current state: {recording_state['is_recording']}")
-
-    if not recording_state["is_recording"]:
-        print("Not currently recording")
+    session = recording_sessions.get((uid, pet_id, session_id))
+    if session is None:
+        print(f"No recording session {(uid, pet_id, session_id)}")
         return {"status": "error", "message": "Not recording"}
+    return session.stop()
 
-    print("Stopping recording...")
-    recording_state["is_recording"] = False
-
-    # Wait a moment for recording to finish
-    time.sleep(0.5)
-
-    # Process the recorded audio
-    if recording_state["audio_data"]:
-        print(f"Processing {len(recording_state['audio_data'])} audio chunks")
-        audio_data = b''.join(recording_state["audio_data"])
-        print(f"Total audio data size: {len(audio_data)} bytes")
-
-        transcript = _transcribe_audio_data(audio_data)
-        recording_state["transcript"] = transcript
-
-        print(f"Recording stopped successfully. Transcript: '{transcript[:100]}...'")
-        return {"status": "stopped", "transcript": transcript, "message": "Recording stopped and transcribed"}
-    else:
-        print("No audio data recorded")
-        return {"status": "error", "message": "No audio data recorded"}
 
-
-def get_recording_status():
+def get_recording_status(uid, pet_id, session_id="default"):
     """Get current recording status"""
-    return {"is_recording": recording_state["is_recording"], "transcript": recording_state["transcript"]}
-
-
-def _record_audio():
-    """Internal function to record audio in background"""
-
-    audio = pyaudio.PyAudio()
-
-    stream = audio.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
-
-    print("Recording started...")
-
-    while recording_state["is_recording"]:
-        try:
-            data = stream.read(CHUNK, exception_on_overflow=False)
-            recording_state["audio_data"].append(data)
-        except Exception as e:
-            print(f"Error reading audio: {e}")
-            break
-
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-
-    print("Recording stopped")
+    session = recording_sessions.get((uid, pet_id, session_id))
+    if session is None:
+        return {"is_recording": False, "transcript": "", "interim_transcript": ""}
+    return session.status()
 
 
 def _transcribe_audio_data(audio_data):
     """Transcribe audio data using Google Cloud Speech-to-Text"""
+    # Silence isn't worth uploading, waiting for or paying for
+    trimmed, report = trim_silence(audio_data, RATE)
+    print(
+        f"Trimmed {report['removed_bytes']} bytes ({report['removed_seconds']}s) of silence, "
+        f"{report['trimmed_bytes']} bytes left"
+    )
+    try:
+        if not len(trimmed):
+            return "No speech detected"
+        with trimmed.view() as audio_data:
+            return _transcribe_trimmed(audio_data)
+    finally:
+        trimmed.close()
+
+
+def _transcribe_trimmed(audio_data):
     try:
         client = get_speech_client()
         if not client:
             return "Error: Could not initialize Speech client"
 
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=RATE,
-            language_code="en-US",
-        )
-
-        audio = speech.RecognitionAudio(content=audio_data)
-        print("Transcribing audio with Google Cloud Speech-to-Text...")
-        response = client.recognize(config=config, audio=audio)
+        config = _recognition_config()
 
-        if response.results:
-            transcript = response.results[0].alternatives[0].transcript
+        segments = split_at_silence(audio_data, RATE, TRANSCRIBE_SEGMENT_SECONDS)
+        print(f"Transcribing audio with Google Cloud Speech-to-Text in {len(segments)} segment(s)...")
+        try:
+            transcripts = _recognize_segments(client, config, segments)
+        finally:
+            # A memory map can't be closed while views of it are alive, and logged errors still reference them
+            for segment in segments:
+                segment.release()
+
+        transcript = " ".join(part for part in transcripts if part)
+        if transcript:
             print(f"Transcript: {transcript}")
             return transcript
         else:
@@ -197,3 +431,48 @@ def _transcribe_audio_data(audio_data):
     except Exception as e:
         print(f"Transcription error: {e}")
         return f"Error: {str(e)}"
+
+
+def _recognize_segments(client, config, segments):
+    """Transcripts of the segments in recording order, recognized in parallel
+
+    Failed segments are retried on the pool. A segment that still fails is
+    replaced by a marker, so the gap shows in the note; if every segment
+    fails, the first error is raised.
+    """
+    transcripts = [None] * len(segments)
+    pending = list(range(len(segments)))
+    errors = {}
+    for attempt in range(1, TRANSCRIBE_SEGMENT_ATTEMPTS + 1):
+        futures = {index: _get_segment_pool().submit(_recognize_segment, client, config, segments[index]) for index in pending}
+        errors = {}
+        for index, future in futures.items():
+            try:
+                transcripts[index] = future.result()
+            except Exception as e:
+                print(f"Transcription error on segment {index + 1} of {len(segments)} (attempt {attempt}): {e}")
+                errors[index] = e
+        pending = list(errors)
+        if not pending:
+            break
+
+    if len(errors) == len(segments):
+        raise next(iter(errors.values()))
+    for index in errors:
+        transcripts[index] = f"[segment {index + 1} could not be transcribed]"
+    return transcripts
+
+
+def _recognize_segment(client, config, audio_data):
+    """Transcript of one segment, with every result (one per utterance) joined"""
+    # Segments are views of the trimmed audio; only the ones being sent are copied
+    response = client.recognize(config=config, audio=speech.RecognitionAudio(content=bytes(audio_data)))
+    return " ".join(result.alternatives[0].transcript.strip() for result in response.results if result.alternatives)
+
+
+def _get_segment_pool():
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is None:
+            _segment_pool = ThreadPoolExecutor(TRANSCRIBE_CONCURRENCY, thread_name_prefix="transcribe-segment")
+    return _segment_pool